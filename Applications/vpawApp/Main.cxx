@@ -26,6 +26,9 @@
 #include "vtkSlicerVersionConfigure.h" // For Slicer_MAIN_PROJECT_VERSION_FUL
 #include "vtkMRMLScene.h"
 
+// Qt includes
+#include <QDateTime>
+
 
 namespace
 {
@@ -36,6 +39,9 @@ SlicerAppMain(int argc, char * argv[])
 {
   typedef qvpawAppMainWindow SlicerMainWindowType;
 
+  // The Home module logs the time from here until it is ready
+  qputenv("VPAW_LAUNCH_TIME_MS", QByteArray::number(QDateTime::currentMSecsSinceEpoch()));
+
   qSlicerApplicationHelper::preInitializeApplication(argv[0], new qAppStyle);
 
   qSlicerApplication app(argc, argv);
@@ -1,8 +1,17 @@
 import logging
+import os
 import qt
 import slicer
 import slicer.ScriptedLoadableModule
 import slicer.util
+import time
+
+# Set by Main.cxx to the time, in milliseconds since the epoch, at which the
+# application's main function started
+LAUNCH_TIME_ENVIRONMENT_VARIABLE = "VPAW_LAUNCH_TIME_MS"
+# If set, the number of seconds within which startup should reach a ready Home module
+STARTUP_TARGET_ENVIRONMENT_VARIABLE = "VPAW_STARTUP_TARGET_SECONDS"
+MILLISECONDS_PER_SECOND = 1000
 
 # from Resources import HomeResourcesResources
 
@@ -70,6 +79,9 @@ class HomeWidget(
         self.ui.VPAWVisualizeButton.connect("clicked(bool)", self.onVPAWVisualizeButton)
         self.ui.VPAWModelButton.connect("clicked(bool)", self.onVPAWModelButton)
 
+        # The Home module is ready once the events queued during startup are processed
+        qt.QTimer.singleShot(0, self.logic.logStartupTime)
+
     def setupNodes(self):
         # Set up the layout / 3D View
         self.logic.setup3DView()
@@ -121,12 +133,8 @@ class HomeWidget(
         gearIcon = qt.QIcon(self.resourcePath("Icons/Gears.png"))
         self.settingsAction = self.CustomToolBar.addAction(gearIcon, "")
 
-        self.settingsDialog = slicer.util.loadUI(self.resourcePath("UI/Settings.ui"))
-        self.settingsUI = slicer.util.childWidgetVariables(self.settingsDialog)
-
-        self.settingsUI.CustomUICheckBox.toggled.connect(self.toggleUI)
-        self.settingsUI.CustomStyleCheckBox.toggled.connect(self.toggleStyle)
-
+        # The settings dialog is loaded the first time that it is raised
+        self.settingsDialog = None
         self.settingsAction.triggered.connect(self.raiseSettings)
         self.hideSlicerUI()
 
@@ -143,6 +151,13 @@ class HomeWidget(
             self.showSlicerUI()
 
     def raiseSettings(self, unused):
+        if self.settingsDialog is None:
+            self.settingsDialog = slicer.util.loadUI(
+                self.resourcePath("UI/Settings.ui"),
+            )
+            self.settingsUI = slicer.util.childWidgetVariables(self.settingsDialog)
+            self.settingsUI.CustomUICheckBox.toggled.connect(self.toggleUI)
+            self.settingsUI.CustomStyleCheckBox.toggled.connect(self.toggleStyle)
         self.settingsDialog.exec()
 
     def applyApplicationStyle(self):
@@ -202,6 +217,33 @@ class HomeLogic(slicer.ScriptedLoadableModule.ScriptedLoadableModuleLogic):
 
         qt.QTimer.singleShot(0, _exitApplication)
 
+    def logStartupTime(self):
+        """
+        Log the seconds from the start of the application's main function to now, and
+        warn if that exceeds the target in VPAW_STARTUP_TARGET_SECONDS.  Returns the
+        seconds, or None if the start time is unknown.
+        """
+        # Pop the start time so that it is reported once and not inherited by processes
+        # that VPAW starts
+        launchTime = os.environ.pop(LAUNCH_TIME_ENVIRONMENT_VARIABLE, "")
+        if not launchTime.isdigit():
+            return None
+        seconds = time.time() - int(launchTime) / MILLISECONDS_PER_SECOND
+        logging.info(f"VPAW startup took {seconds:.2f} s, from launch to Home ready")
+        target = os.environ.get(STARTUP_TARGET_ENVIRONMENT_VARIABLE, "")
+        try:
+            if target and seconds > float(target):
+                logging.warning(
+                    f"VPAW startup took {seconds:.2f} s, more than the target of"
+                    + f" {float(target):.2f} s",
+                )
+        except ValueError:
+            logging.warning(
+                f"Ignoring {STARTUP_TARGET_ENVIRONMENT_VARIABLE}={target!r}, which is"
+                + " not a number",
+            )
+        return seconds
+
     # settings for 3D view
     def setup3DView(self):
         slicer.app.layoutManager()
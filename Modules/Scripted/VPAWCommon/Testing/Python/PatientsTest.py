@@ -0,0 +1,111 @@
+"""
+Tests of vpawcommonlib.patients.
+"""
+
+import os
+import tempfile
+import unittest
+
+from vpawcommonlib.patients import (
+    PREVIEW_SUFFIX,
+    entry_prefix,
+    list_patient_prefixes,
+    parse_patient_selection,
+    patient_image_files,
+    select_patient_prefixes,
+)
+
+
+class PatientsTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.data_root = directory.name
+        os.makedirs(os.path.join(self.data_root, "images"))
+
+    def write_images(self, *basenames):
+        for basename in basenames:
+            with open(os.path.join(self.data_root, "images", basename), "w"):
+                pass
+
+    def test_previews_are_not_patient_images(self):
+        self.write_images(
+            "1000_CT.nrrd",
+            "1000_CT.nrrd" + PREVIEW_SUFFIX,
+            "1000_MR.nhdr",
+            "1000_notes.txt",
+            "1001_CT.nrrd",
+        )
+        assert patient_image_files(self.data_root, "1000_") == [
+            os.path.join(self.data_root, "images", basename)
+            for basename in ("1000_CT.nrrd", "1000_MR.nhdr")
+        ]
+        assert list_patient_prefixes(self.data_root) == ["1000_", "1001_"]
+
+    def test_selection_is_split_on_commas_and_white_space(self):
+        assert parse_patient_selection(" 1000, 1001_\t1002 ,,\n 10") == [
+            "1000",
+            "1001_",
+            "1002",
+            "10",
+        ]
+        assert parse_patient_selection("   ") == []
+
+    def test_selection_file(self):
+        filename = os.path.join(self.data_root, "selection.txt")
+        with open(filename, "w") as selection_file:
+            selection_file.write(
+                "# Patients for the validation run\n"
+                + "1000, 1001  # reviewed\n"
+                + "\n"
+                + "  1002_\n"
+                + "#1003\n",
+            )
+        assert parse_patient_selection("@" + filename) == ["1000", "1001", "1002_"]
+        assert parse_patient_selection(" @ " + filename) == ["1000", "1001", "1002_"]
+
+    def test_missing_selection_file(self):
+        try:
+            parse_patient_selection("@" + os.path.join(self.data_root, "missing.txt"))
+        except OSError:
+            pass
+        else:
+            self.fail("A missing selection file was not reported")
+
+    def test_patient_id_selects_only_that_patient(self):
+        self.write_images("1000_CT.nrrd", "10001_CT.nrrd", "1001_CT.nrrd")
+        assert select_patient_prefixes(self.data_root, ["1000"]) == ["1000_"]
+        assert entry_prefix(self.data_root, "1000") == "1000_"
+        # Without a patient 100_, "100" is a prefix of every patient
+        assert select_patient_prefixes(self.data_root, ["100"]) == [
+            "10001_",
+            "1000_",
+            "1001_",
+        ]
+        assert entry_prefix(self.data_root, "100") == "100"
+
+    def test_selection_keeps_order_and_drops_duplicates(self):
+        self.write_images("1000_CT.nrrd", "1001_CT.nrrd", "1002_CT.nrrd")
+        assert select_patient_prefixes(
+            self.data_root, ["1002", "1000_", "1002_", "1000"],
+        ) == ["1002_", "1000_"]
+
+    def test_unmatched_entries_are_kept(self):
+        self.write_images("1000_CT.nrrd")
+        with self.assertLogs(level="WARNING"):
+            selected = select_patient_prefixes(self.data_root, ["1000", "2000"])
+        assert selected == ["1000_", "2000"]
+
+    def test_prefix_string_selects_every_match(self):
+        self.write_images("1000_CT.nrrd", "1001_CT.nrrd", "2000_CT.nrrd")
+        assert select_patient_prefixes(self.data_root, "100") == ["1000_", "1001_"]
+        assert select_patient_prefixes(self.data_root, "") == [
+            "1000_",
+            "1001_",
+            "2000_",
+        ]
+        assert select_patient_prefixes(self.data_root, "3") == ["3"]
+
+
+if __name__ == "__main__":
+    unittest.main()
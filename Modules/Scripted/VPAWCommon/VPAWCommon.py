@@ -0,0 +1,39 @@
+import slicer
+import slicer.ScriptedLoadableModule
+
+#
+# VPAWCommon
+#
+
+
+class VPAWCommon(slicer.ScriptedLoadableModule.ScriptedLoadableModule):
+    """
+    A hidden module that provides vpawcommonlib, the helpers shared by VPAWModel and
+    VPAWVisualize, so that neither module depends on the other.
+
+    Uses ScriptedLoadableModule base class, available at:
+    https://github.com/Slicer/Slicer/blob/main/Base/Python/slicer/ScriptedLoadableModule.py
+    """
+
+    def __init__(self, parent):
+        slicer.ScriptedLoadableModule.ScriptedLoadableModule.__init__(self, parent)
+        self.parent.title = "VPAW Common"
+        self.parent.categories = ["VPAW"]
+        self.parent.dependencies = []
+        self.parent.hidden = True
+        self.parent.contributors = [
+            "Andinet Enquobahrie (Kitware, Inc.)",
+            "Shreeraj Jadhav (Kitware, Inc.)",
+            "Jean-Christophe Fillion-Robin (Kitware, Inc.)",
+            "Ebrahim Ebrahim (Kitware, Inc.)",
+            "Lee Newberg (Kitware, Inc.)",
+        ]
+        self.parent.helpText = """
+Helpers shared by the VPAW modules: finding patients, reading NRRD headers, profiling,
+and tracing.
+"""
+        self.parent.acknowledgementText = """
+This file was built from template originally developed by Jean-Christophe Fillion-Robin,
+Kitware Inc., Andras Lasso, PerkLab, and Steve Pieper, Isomics, Inc. and was partially
+funded by NIH grant 3P41RR013218-12S1.
+"""
@@ -0,0 +1,18 @@
+"""
+Formatting of measurements for VPAW's logs and reports.
+"""
+
+BYTES_PER_KILOBYTE = 1024
+
+
+def format_bytes(value):
+    """
+    Return a human-readable size, e.g., "1.5 GB", or "unknown" for None.
+    """
+    if value is None:
+        return "unknown"
+    for unit in ("B", "KB", "MB"):
+        if abs(value) < BYTES_PER_KILOBYTE:
+            return f"{value:.0f} {unit}" if unit == "B" else f"{value:.1f} {unit}"
+        value /= BYTES_PER_KILOBYTE
+    return f"{value:.1f} GB"
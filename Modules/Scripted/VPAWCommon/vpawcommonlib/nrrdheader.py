@@ -0,0 +1,148 @@
+"""
+Read NRRD headers without reading, or decompressing, the voxel data.
+"""
+
+import math
+import re
+
+# Names of the NRRD "space" values, and their abbreviations, for the anatomical spaces
+_SPACES = {
+    "left-posterior-superior": "LPS",
+    "lps": "LPS",
+    "right-anterior-superior": "RAS",
+    "ras": "RAS",
+}
+
+# Bytes per voxel for each NRRD "type" spelling
+_TYPE_SIZES = {
+    **dict.fromkeys(
+        ("signed char", "int8", "int8_t", "uchar", "unsigned char", "uint8", "uint8_t"),
+        1,
+    ),
+    **dict.fromkeys(
+        (
+            "short",
+            "short int",
+            "signed short",
+            "signed short int",
+            "int16",
+            "int16_t",
+            "ushort",
+            "unsigned short",
+            "unsigned short int",
+            "uint16",
+            "uint16_t",
+        ),
+        2,
+    ),
+    **dict.fromkeys(
+        (
+            "int",
+            "signed int",
+            "int32",
+            "int32_t",
+            "uint",
+            "unsigned int",
+            "uint32",
+            "uint32_t",
+            "float",
+        ),
+        4,
+    ),
+    **dict.fromkeys(
+        (
+            "longlong",
+            "long long",
+            "long long int",
+            "signed long long",
+            "signed long long int",
+            "int64",
+            "int64_t",
+            "ulonglong",
+            "unsigned long long",
+            "unsigned long long int",
+            "uint64",
+            "uint64_t",
+            "double",
+        ),
+        8,
+    ),
+}
+
+
+def read_nrrd_header(filename):
+    """
+    Read the header of a .nrrd or .nhdr file.
+
+    Args:
+        filename: the file
+    Return: a dict from each field name, in lower case, to its unparsed value.
+        Key/value pairs (lines with ":=") and comments are skipped.
+    """
+    fields = dict()
+    with open(filename, "rb") as nrrd_file:
+        magic = nrrd_file.readline()
+        if not magic.startswith(b"NRRD"):
+            raise ValueError(f"{filename} is not a NRRD file")
+        for raw_line in nrrd_file:
+            line = raw_line.decode("latin-1").rstrip("\r\n")
+            if line == "":
+                # A blank line ends the header
+                break
+            if line.startswith("#") or ":=" in line:
+                continue
+            key, separator, value = line.partition(":")
+            if separator:
+                fields[key.strip().lower()] = value.strip()
+    return fields
+
+
+def header_sizes(fields):
+    """
+    Return the number of samples along each axis as a list of int.
+    """
+    return [int(size) for size in fields["sizes"].split()]
+
+
+def header_voxel_count(fields):
+    return math.prod(header_sizes(fields))
+
+
+def header_bytes_per_voxel(fields):
+    """
+    Return the number of bytes of one sample of the NRRD "type", or None if unknown.
+    """
+    return _TYPE_SIZES.get(" ".join(fields.get("type", "").lower().split()))
+
+
+def _parse_vector(text):
+    return [float(value) for value in text.strip().strip("()").split(",")]
+
+
+def header_space(fields):
+    """
+    Return "LPS" or "RAS" for the anatomical space of the header, or None if it has
+    none of these.
+    """
+    return _SPACES.get(fields.get("space", "").strip().lower())
+
+
+def header_ijk_to_space(fields):
+    """
+    Return the 4x4 matrix that maps homogeneous voxel indices (i, j, k, 1) of the
+    spatial axes to coordinates in the header's space.  Non-spatial axes, which have
+    "none" as their space direction, are skipped.
+    """
+    directions = [
+        _parse_vector(vector)
+        for vector in re.findall(r"\([^)]*\)|none", fields["space directions"])
+        if vector != "none"
+    ]
+    # numpy is imported here, not at file scope, because this file is imported when 3D
+    # Slicer starts and only this function needs it.
+    import numpy as np
+
+    matrix = np.eye(4)
+    matrix[:3, :3] = np.array(directions).T
+    matrix[:3, 3] = _parse_vector(fields.get("space origin", "(0,0,0)"))
+    return matrix
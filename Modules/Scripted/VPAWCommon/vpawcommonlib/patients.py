@@ -0,0 +1,110 @@
+"""
+Helpers for finding the patients in a VPAW data root.
+"""
+
+import logging
+import os
+import re
+
+# Suffix of the low-resolution previews that VPAW Visualize writes next to the images of
+# a data root, e.g., "1000_CT.nrrd.preview.nrrd".  They are not images of patients.
+PREVIEW_SUFFIX = ".preview.nrrd"
+
+
+def list_patient_prefixes(vPAWRootDirectory):
+    """
+    Return the sorted patient prefixes of the CT scans in the images/ directory of a
+    data root.  A file named like "1000_CT.nrrd" has the patient prefix "1000_".
+
+    Args:
+        vPAWRootDirectory: a directory containing images/*
+    Return: a list of str
+    """
+    images_dir = os.path.join(vPAWRootDirectory, "images")
+    prefixes = set()
+    for basename in os.listdir(images_dir):
+        if basename.startswith(".") or "_" not in basename:
+            continue
+        prefixes.add(basename[: basename.index("_") + 1])
+    return sorted(prefixes)
+
+
+def patient_image_files(vPAWRootDirectory, patientPrefix):
+    """
+    Return the NRRD files in the images/ directory of the data root that belong to the
+    patient, other than previews.
+    """
+    images_dir = os.path.join(vPAWRootDirectory, "images")
+    return sorted(
+        os.path.join(images_dir, basename)
+        for basename in os.listdir(images_dir)
+        if basename.startswith(patientPrefix)
+        and (basename.endswith(".nrrd") or basename.endswith(".nhdr"))
+        and not basename.endswith(PREVIEW_SUFFIX)
+    )
+
+
+def parse_patient_selection(text):
+    """
+    Parse the patients entered by the user: patient IDs or prefixes separated by commas
+    or white space, or "@" followed by the name of a file that lists them, with "#"
+    starting a comment.
+
+    Args:
+        text: the user's entry
+    Return: a list of str, which is empty if nothing was entered.  Every entry, even a
+        single one, is matched by select_patient_prefixes in the same way.
+    """
+    text = text.strip()
+    if text.startswith("@"):
+        with open(os.path.expanduser(text[1:].strip())) as selection_file:
+            text = "\n".join(line.split("#", 1)[0] for line in selection_file)
+    return [entry for entry in re.split(r"[,\s]+", text) if entry]
+
+
+def entry_prefix(vPAWRootDirectory, entry):
+    """
+    Return the prefix that selects what a single patient ID or prefix entered by the
+    user means.
+
+    Args:
+        vPAWRootDirectory: a directory containing images/*
+        entry: a patient ID, such as "1000", or a prefix
+    Return: entry + "_" if that is the prefix of a patient, which then selects only
+        that patient; otherwise entry, which selects every patient that it starts
+    """
+    if entry + "_" in list_patient_prefixes(vPAWRootDirectory):
+        return entry + "_"
+    return entry
+
+
+def select_patient_prefixes(vPAWRootDirectory, selection):
+    """
+    Return the prefixes of the individual patients in a data root that are selected.
+
+    Args:
+        vPAWRootDirectory: a directory containing images/*
+        selection: a prefix, where blank means all patients, or a list of patient IDs
+            and prefixes, as returned by parse_patient_selection.  An entry of the list
+            that is a patient ID, such as "1000", selects only the patient with prefix
+            "1000_"; other entries select the patients that they are a prefix of.
+    Return: a list of str, in the order of the selection and without duplicates.
+        Entries that match no patient are kept as they are, so that the pipeline
+        reports them.
+    """
+    available = list_patient_prefixes(vPAWRootDirectory)
+    if isinstance(selection, str):
+        return [prefix for prefix in available if prefix.startswith(selection)] or [
+            selection,
+        ]
+    selected = []
+    for entry in selection:
+        if entry + "_" in available:
+            matches = [entry + "_"]
+        else:
+            matches = [prefix for prefix in available if prefix.startswith(entry)]
+        if not matches:
+            logging.warning(f"No patient in {vPAWRootDirectory} matches {entry!r}")
+            matches = [entry]
+        selected.extend(prefix for prefix in matches if prefix not in selected)
+    return selected
@@ -0,0 +1,141 @@
+"""
+Opt-in cProfile profiling of VPAW's module switches, GUI actions, and pipeline runs.
+
+Profiling is enabled by naming a directory in the environment variable
+VPAW_PROFILE_DIRECTORY or, failing that, in the application setting
+VPAW/ProfileDirectory.  Each call of a function decorated with @profiled then writes to
+that directory
+
+    <time>-<name>.prof  the profile, for pstats, snakeviz, and similar tools
+    <time>-<name>.txt   the functions that took the most cumulative time
+
+and appends a line to summary.tsv.  These files can be attached to a bug report as they
+are.  Profiles do not nest: a profiled function that is called while another is being
+profiled, in any thread, is not profiled separately.  Only the calling thread is
+profiled, so work done in background threads or child processes shows up as waiting.
+"""
+
+import cProfile
+import datetime
+import functools
+import io
+import logging
+import os
+import pstats
+import re
+import threading
+import time
+
+ENVIRONMENT_VARIABLE = "VPAW_PROFILE_DIRECTORY"
+SETTINGS_KEY = "VPAW/ProfileDirectory"
+SUMMARY_FILENAME = "summary.tsv"
+SUMMARY_COLUMNS = (
+    "started",
+    "name",
+    "wall_seconds",
+    "profiled_seconds",
+    "function_calls",
+    "profile",
+)
+# The number of functions listed in each .txt file
+TOP_FUNCTIONS = 40
+
+# cProfile allows one active profiler per process
+_profiler_lock = threading.Lock()
+
+
+def configured_directory(environment_variable, settings_key):
+    """
+    Return the directory named by an environment variable or, failing that, by an
+    application setting, or None if neither is set.
+    """
+    directory = os.environ.get(environment_variable, "")
+    if not directory:
+        try:
+            import qt
+        except ImportError:
+            # Not running within 3D Slicer
+            return None
+        directory = qt.QSettings().value(settings_key, "") or ""
+    return directory or None
+
+
+def profile_directory():
+    """
+    Return the directory that profiles are written to, or None if profiling is off.
+    """
+    return configured_directory(ENVIRONMENT_VARIABLE, SETTINGS_KEY)
+
+
+def profiled(function):
+    """
+    Decorator that profiles each call of function when profiling is enabled.  When it
+    is not, the only cost is a lookup of the profile directory.
+    """
+    name = function.__qualname__
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        directory = profile_directory()
+        if directory is None or not _profiler_lock.acquire(blocking=False):
+            return function(*args, **kwargs)
+        try:
+            profiler = cProfile.Profile()
+            started = datetime.datetime.now()
+            start = time.perf_counter()
+            try:
+                return profiler.runcall(function, *args, **kwargs)
+            finally:
+                wall_seconds = time.perf_counter() - start
+                try:
+                    write_profile(directory, name, started, wall_seconds, profiler)
+                except OSError as e:
+                    logging.warning(f"Unable to write the profile of {name}: {e}")
+        finally:
+            _profiler_lock.release()
+
+    return wrapper
+
+
+def write_profile(directory, name, started, wall_seconds, profiler):
+    """
+    Write the .prof and .txt files for one profiled call and add it to summary.tsv.
+
+    Args:
+        directory: where to write the files; it is created if necessary
+        name: the name of the profiled function
+        started: the datetime at which the call started
+        wall_seconds: the elapsed time of the call
+        profiler: the cProfile.Profile of the call
+    Return: the filename of the .prof file
+    """
+    os.makedirs(directory, exist_ok=True)
+    basename = (
+        started.strftime("%Y%m%d-%H%M%S-%f") + "-" + re.sub(r"[^\w.-]+", "_", name)
+    )
+    profile_filename = os.path.join(directory, basename + ".prof")
+    profiler.dump_stats(profile_filename)
+
+    stream = io.StringIO()
+    stats = pstats.Stats(profiler, stream=stream)
+    stream.write(f"{name} started {started.isoformat()}, {wall_seconds:.3f} s\n")
+    stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(TOP_FUNCTIONS)
+    with open(os.path.join(directory, basename + ".txt"), "w") as text_file:
+        text_file.write(stream.getvalue())
+
+    summary_filename = os.path.join(directory, SUMMARY_FILENAME)
+    new_summary = not os.path.exists(summary_filename)
+    with open(summary_filename, "a") as summary_file:
+        if new_summary:
+            summary_file.write("\t".join(SUMMARY_COLUMNS) + "\n")
+        row = (
+            started.isoformat(timespec="seconds"),
+            name,
+            f"{wall_seconds:.3f}",
+            f"{stats.total_tt:.3f}",
+            str(stats.total_calls),
+            os.path.basename(profile_filename),
+        )
+        summary_file.write("\t".join(row) + "\n")
+    logging.info(f"Profiled {name} ({wall_seconds:.2f} s) to {profile_filename}")
+    return profile_filename
@@ -0,0 +1,203 @@
+"""
+A timeline of VPAW's operations in the Chrome Trace Event format.
+
+Tracing is enabled by naming a directory in the environment variable
+VPAW_TRACE_DIRECTORY or, failing that, in the application setting VPAW/TraceDirectory.
+Spans, which may nest, are then recorded with the thread that ran them, along with the
+start, end, and progress of traced VTK filters and render windows.  Whenever an
+outermost span of a thread ends, and when the process exits, the events recorded since
+the last write are appended to vpaw-<time>-<pid>.trace.json in that directory, so each
+event is written once.  The file is a JSON array of events that is never closed, which
+the Trace Event format allows, and can be opened with https://ui.perfetto.dev or
+chrome://tracing at any time.
+"""
+
+import atexit
+import contextlib
+import datetime
+import functools
+import itertools
+import json
+import logging
+import os
+import threading
+import time
+
+from vpawcommonlib.profiling import configured_directory
+
+ENVIRONMENT_VARIABLE = "VPAW_TRACE_DIRECTORY"
+SETTINGS_KEY = "VPAW/TraceDirectory"
+# Trace Event timestamps are in microseconds
+MICROSECONDS_PER_SECOND = 1_000_000
+# Later events are dropped, so that a forgotten trace cannot use up memory
+MAX_EVENTS = 1_000_000
+
+_origin = time.perf_counter()
+_trace_name = "vpaw-" + datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+_lock = threading.Lock()
+# Events recorded but not yet written
+_pending = []
+_event_numbers = itertools.count()
+_named_threads = set()
+_local = threading.local()
+# Directories that the trace has been written to, the latest last
+_written_directories = []
+# Directories that a trace could not be written to
+_unwritable_directories = set()
+
+
+def trace_directory():
+    """
+    Return the directory that traces are written to, or None if tracing is off.
+    """
+    return configured_directory(ENVIRONMENT_VARIABLE, SETTINGS_KEY)
+
+
+def _timestamp():
+    return (time.perf_counter() - _origin) * MICROSECONDS_PER_SECOND
+
+
+def _record(event):
+    pid, tid = os.getpid(), threading.get_ident()
+    with _lock:
+        if next(_event_numbers) >= MAX_EVENTS:
+            return
+        if tid not in _named_threads:
+            _named_threads.add(tid)
+            _pending.append(
+                dict(
+                    name="thread_name",
+                    ph="M",
+                    pid=pid,
+                    tid=tid,
+                    args=dict(name=threading.current_thread().name),
+                ),
+            )
+        _pending.append(dict(event, pid=pid, tid=tid))
+
+
+@contextlib.contextmanager
+def span(name, category="vpaw", **args):
+    """
+    Context manager that records its body as a span of the trace, if tracing is on.
+
+    Args:
+        name: the name of the span
+        category: the category of the span, by which a trace viewer can filter
+        args: values to show with the span
+    """
+    directory = trace_directory()
+    if directory is None:
+        yield
+        return
+    depth = getattr(_local, "depth", 0)
+    _local.depth = depth + 1
+    start = _timestamp()
+    try:
+        yield
+    finally:
+        _local.depth = depth
+        _record(
+            dict(
+                name=name,
+                cat=category,
+                ph="X",
+                ts=start,
+                dur=_timestamp() - start,
+                args=args,
+            ),
+        )
+        if depth == 0:
+            write_trace(directory)
+
+
+def traced(function):
+    """
+    Decorator that records each call of function as a span, if tracing is on.
+    """
+    name = function.__qualname__
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        with span(name):
+            return function(*args, **kwargs)
+
+    return wrapper
+
+
+def trace_vtk_events(vtk_object, name=None, category="vtk"):
+    """
+    If tracing is on, observe the StartEvent, EndEvent, and ProgressEvent of a VTK
+    object, such as a filter or a render window, and record its executions as spans and
+    its progress as a counter.
+
+    Args:
+        vtk_object: the object to observe
+        name: the name of its spans; defaults to its class name
+        category: the category of its spans
+    Return: vtk_object
+    """
+    if trace_directory() is None:
+        return vtk_object
+    if name is None:
+        name = vtk_object.GetClassName()
+
+    def on_start(caller, event):
+        _record(dict(name=name, cat=category, ph="B", ts=_timestamp()))
+
+    def on_end(caller, event):
+        _record(dict(name=name, cat=category, ph="E", ts=_timestamp()))
+
+    def on_progress(caller, event):
+        _record(
+            dict(
+                name=name + " progress",
+                cat=category,
+                ph="C",
+                ts=_timestamp(),
+                args=dict(percent=100 * caller.GetProgress()),
+            ),
+        )
+
+    vtk_object.AddObserver("StartEvent", on_start)
+    vtk_object.AddObserver("EndEvent", on_end)
+    if hasattr(vtk_object, "GetProgress"):
+        vtk_object.AddObserver("ProgressEvent", on_progress)
+    return vtk_object
+
+
+def write_trace(directory):
+    """
+    Append the events recorded since the last write to the trace file in directory,
+    starting the file if it does not exist.  Return the trace filename, or None if it
+    cannot be written, in which case those events are dropped.
+    """
+    filename = os.path.join(directory, f"{_trace_name}-{os.getpid()}.trace.json")
+    # The lock is held while writing so that writes from different threads do not
+    # interleave
+    with _lock:
+        events = list(_pending)
+        _pending.clear()
+        try:
+            os.makedirs(directory, exist_ok=True)
+            with open(filename, "a") as trace_file:
+                if trace_file.tell() == 0:
+                    trace_file.write("[\n")
+                trace_file.writelines(json.dumps(event) + ",\n" for event in events)
+        except OSError as e:
+            if directory not in _unwritable_directories:
+                # Warn once rather than at the end of every span
+                logging.warning(f"Unable to write the trace {filename}: {e}")
+                _unwritable_directories.add(directory)
+            return None
+        if directory in _written_directories:
+            _written_directories.remove(directory)
+        _written_directories.append(directory)
+    return filename
+
+
+@atexit.register
+def _write_remaining_events():
+    # Events recorded outside of spans, e.g., by VTK objects, after the last write
+    if _pending and _written_directories:
+        write_trace(_written_directories[-1])
@@ -0,0 +1,118 @@
+"""
+Tests of the wheelhouse lockfile handling in vpawmodellib.dependencies.
+"""
+
+import os
+import tempfile
+import unittest
+
+from vpawmodellib.dependencies import (
+    LOCKFILE_NAME,
+    read_lockfile,
+    wheelhouse_pip_install_arguments,
+)
+
+# A lockfile in the layout that pip-compile --generate-hashes writes
+LOCKFILE = """#
+# This file is autogenerated by pip-compile with Python 3.9
+# by the following command:
+#
+#    pip-compile --generate-hashes requirements.in
+#
+--index-url https://pypi.org/simple
+--find-links ./wheels
+
+itk==5.3.0 \\
+    --hash=sha256:0123456789abcdef0123456789abcdef0123456789abcdef0123456789abcdef \\
+    --hash=sha256:fedcba9876543210fedcba9876543210fedcba9876543210fedcba9876543210
+    # via -r requirements.in
+monai[nibabel]==1.2.0 \\
+    --hash=sha256:00112233445566778899aabbccddeeff00112233445566778899aabbccddeeff
+    # via -r requirements.in
+numpy==1.26.4  # via itk, monai
+scikit_image==0.22.0 \\
+    --hash=sha256:ffeeddccbbaa99887766554433221100ffeeddccbbaa99887766554433221100
+    # via -r requirements.in
+"""
+
+
+class DependenciesTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.wheelhouse = directory.name
+        self.lockfile = os.path.join(self.wheelhouse, LOCKFILE_NAME)
+
+    def write_lockfile(self, text):
+        with open(self.lockfile, "w") as lockfile:
+            lockfile.write(text)
+
+    def test_read_lockfile(self):
+        self.write_lockfile(LOCKFILE)
+        assert read_lockfile(self.lockfile) == {
+            "itk": "itk==5.3.0",
+            "monai": "monai[nibabel]==1.2.0",
+            "numpy": "numpy==1.26.4",
+            "scikit-image": "scikit_image==0.22.0",
+        }
+
+    def test_windows_line_endings(self):
+        self.write_lockfile(LOCKFILE.replace("\n", "\r\n"))
+        with open(self.lockfile, newline="") as lockfile:
+            assert "\r\n" in lockfile.read()
+        assert set(read_lockfile(self.lockfile)) == {
+            "itk",
+            "monai",
+            "numpy",
+            "scikit-image",
+        }
+
+    def test_unpinned_requirements_are_rejected(self):
+        for requirement in ("torch>=2.0", "torch", "torch~=2.0.1", "torch[cuda]"):
+            self.write_lockfile(LOCKFILE + requirement + " \\\n    --hash=sha256:00\n")
+            try:
+                read_lockfile(self.lockfile)
+            except ValueError as e:
+                message = str(e)
+            else:
+                self.fail(f"{requirement!r} was accepted as pinned")
+            assert requirement in message
+
+    def test_pip_install_arguments(self):
+        self.write_lockfile(LOCKFILE)
+        arguments = wheelhouse_pip_install_arguments(
+            [("itk", "itk"), ("skimage", "Scikit-Image>=0.19")], self.wheelhouse,
+        )
+        assert arguments == [
+            "--no-index",
+            "--find-links",
+            self.wheelhouse,
+            "--constraint",
+            self.lockfile,
+            "itk==5.3.0",
+            "scikit_image==0.22.0",
+        ]
+
+    def test_packages_missing_from_the_lockfile(self):
+        self.write_lockfile(LOCKFILE)
+        try:
+            wheelhouse_pip_install_arguments(
+                [("itk", "itk"), ("torch", "torch")], self.wheelhouse,
+            )
+        except ValueError as e:
+            message = str(e)
+        else:
+            self.fail("A package missing from the lockfile was accepted")
+        assert message.endswith("has no version for torch")
+
+    def test_missing_lockfile(self):
+        try:
+            wheelhouse_pip_install_arguments([("itk", "itk")], self.wheelhouse)
+        except FileNotFoundError:
+            pass
+        else:
+            self.fail("A wheelhouse without a lockfile was accepted")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,181 @@
+"""
+Tests of vpawmodellib.governor: admission control and run_admitted.
+"""
+
+import os
+import tempfile
+import threading
+import time
+import unittest
+
+from vpawmodellib.governor import (
+    AdmissionController,
+    estimate_patient_memory_bytes,
+    run_admitted,
+)
+
+# Seconds that each job runs, so that jobs that are admitted together overlap
+JOB_SECONDS = 0.1
+# Seconds to wait for something that should happen, before failing
+WAIT_SECONDS = 5.0
+
+
+def run_jobs(controller, memory_bytes, cpus=1):
+    """
+    Run a job of each of memory_bytes through controller, and return the most that ran
+    at once.
+    """
+    lock = threading.Lock()
+    running = [0]
+    most = [0]
+
+    def job(memory):
+        with controller.admitted(memory, cpus):
+            with lock:
+                running[0] += 1
+                most[0] = max(most[0], running[0])
+            time.sleep(JOB_SECONDS)
+            with lock:
+                running[0] -= 1
+
+    threads = [threading.Thread(target=job, args=(memory,)) for memory in memory_bytes]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return most[0]
+
+
+class AdmissionControllerTest(unittest.TestCase):
+    def test_jobs_that_fit_run_together(self):
+        jobs = [3, 3, 3]
+        controller = AdmissionController(memory_budget_bytes=10, cpu_budget=4)
+        assert run_jobs(controller, jobs) == len(jobs)
+        assert controller.statistics()["max_concurrency"] == len(jobs)
+        assert controller.statistics()["peak_memory_admitted_bytes"] == sum(jobs)
+
+    def test_memory_budget_limits_concurrency(self):
+        controller = AdmissionController(memory_budget_bytes=10, cpu_budget=4)
+        assert run_jobs(controller, [6, 6, 6]) == 1
+
+    def test_cpu_budget_limits_concurrency(self):
+        cpu_budget, cpus = 4, 2
+        controller = AdmissionController(memory_budget_bytes=100, cpu_budget=cpu_budget)
+        assert run_jobs(controller, [1, 1, 1, 1], cpus=cpus) == cpu_budget // cpus
+
+    def start_job(self, controller, memory_bytes):
+        """
+        Start a thread that acquires a job of memory_bytes and releases it when the
+        returned event is set.  Returns (admitted, release, thread).
+        """
+        admitted, release = threading.Event(), threading.Event()
+
+        def job():
+            with controller.admitted(memory_bytes, 1):
+                admitted.set()
+                release.wait()
+
+        thread = threading.Thread(target=job, daemon=True)
+        thread.start()
+        self.addCleanup(release.set)
+        return admitted, release, thread
+
+    def test_job_over_budget_runs_alone(self):
+        controller = AdmissionController(memory_budget_bytes=10, cpu_budget=4)
+        big_admitted, big_release, big_thread = self.start_job(controller, 20)
+        assert big_admitted.wait(WAIT_SECONDS)
+
+        # A job that fits within the budget on its own waits for the one over it
+        small_admitted, small_release, small_thread = self.start_job(controller, 1)
+        assert not small_admitted.wait(JOB_SECONDS)
+        big_release.set()
+        big_thread.join(WAIT_SECONDS)
+        assert small_admitted.wait(WAIT_SECONDS)
+        small_release.set()
+        small_thread.join(WAIT_SECONDS)
+        assert controller.statistics()["max_concurrency"] == 1
+
+    def test_job_over_budget_waits_for_running_jobs(self):
+        controller = AdmissionController(memory_budget_bytes=10, cpu_budget=4)
+        small_admitted, small_release, small_thread = self.start_job(controller, 1)
+        assert small_admitted.wait(WAIT_SECONDS)
+
+        big_admitted, big_release, big_thread = self.start_job(controller, 20)
+        assert not big_admitted.wait(JOB_SECONDS)
+        small_release.set()
+        small_thread.join(WAIT_SECONDS)
+        assert big_admitted.wait(WAIT_SECONDS)
+        big_release.set()
+        big_thread.join(WAIT_SECONDS)
+        assert controller.statistics()["max_concurrency"] == 1
+
+
+class RunAdmittedTest(unittest.TestCase):
+    def test_results(self):
+        def function(item):
+            if item == "3_":
+                raise RuntimeError("failed run")
+            return item != "2_"
+
+        results = run_admitted(
+            ["1_", "2_", "3_", "4_"],
+            function,
+            AdmissionController(memory_budget_bytes=10, cpu_budget=2),
+            lambda item: 5,
+            cpus_per_item=1,
+        )
+        assert results == {"1_": True, "2_": False, "3_": False, "4_": True}
+
+    def test_item_that_cannot_be_estimated_fails(self):
+        ran = []
+
+        def estimate(item):
+            if item == "2_":
+                raise OSError("no images")
+            return 1
+
+        results = run_admitted(
+            ["1_", "2_", "3_"],
+            lambda item: ran.append(item) is None,
+            AdmissionController(memory_budget_bytes=10, cpu_budget=2),
+            estimate,
+            cpus_per_item=1,
+        )
+        assert results == {"1_": True, "2_": False, "3_": True}
+        assert sorted(ran) == ["1_", "3_"]
+
+    def test_concurrency_follows_the_budget(self):
+        memory_budget_bytes, memory_bytes = 10, 5
+        controller = AdmissionController(memory_budget_bytes, cpu_budget=8)
+        results = run_admitted(
+            ["1_", "2_", "3_", "4_"],
+            lambda item: time.sleep(JOB_SECONDS) is None,
+            controller,
+            lambda item: memory_bytes,
+            cpus_per_item=1,
+        )
+        assert all(results.values())
+        assert (
+            controller.statistics()["max_concurrency"]
+            == memory_budget_bytes // memory_bytes
+        )
+
+
+class EstimateTest(unittest.TestCase):
+    def test_estimate_is_read_from_the_headers(self):
+        with tempfile.TemporaryDirectory() as data_root:
+            os.makedirs(os.path.join(data_root, "images"))
+            for basename in ("1_CT.nrrd", "2_CT.nrrd"):
+                with open(os.path.join(data_root, "images", basename), "w") as header:
+                    header.write(
+                        "NRRD0004\ntype: short\ndimension: 3\nsizes: 2 3 4\n"
+                        + "encoding: raw\n\n",
+                    )
+            estimate = estimate_patient_memory_bytes(
+                data_root, "1_", base_memory_bytes=100, memory_bytes_per_voxel=2,
+            )
+        assert estimate == 100 + 2 * 2 * 3 * 4
+
+
+if __name__ == "__main__":
+    unittest.main()
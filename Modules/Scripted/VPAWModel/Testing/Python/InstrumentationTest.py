@@ -0,0 +1,48 @@
+"""
+Tests of vpawmodellib.instrumentation.PipelineReport.
+"""
+
+import json
+import os
+import tempfile
+import threading
+import unittest
+
+from vpawmodellib.instrumentation import PipelineReport
+
+# Reports written at once, as by the shards of a batch job
+CONCURRENT_REPORTS = 8
+
+
+class PipelineReportTest(unittest.TestCase):
+    def test_concurrent_writes_leave_whole_reports(self):
+        with tempfile.TemporaryDirectory() as directory:
+            reports = [
+                PipelineReport(metadata=dict(shard=index, padding="x" * 100_000))
+                for index in range(CONCURRENT_REPORTS)
+            ]
+            threads = [
+                threading.Thread(target=report.write, args=(directory,))
+                for report in reports
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            assert sorted(os.listdir(directory)) == [
+                "pipeline_report.json",
+                "pipeline_report_history.jsonl",
+            ]
+            with open(os.path.join(directory, "pipeline_report.json")) as report_file:
+                assert "shard" in json.load(report_file)["metadata"]
+            with open(
+                os.path.join(directory, "pipeline_report_history.jsonl"),
+            ) as history_file:
+                shards = sorted(
+                    json.loads(line)["metadata"]["shard"] for line in history_file
+                )
+            assert shards == list(range(CONCURRENT_REPORTS))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,139 @@
+"""
+Tests of vpawmodellib.landmarks, with small .fcsv files and NRRD headers.
+"""
+
+import os
+import pickle
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from vpawmodellib.landmarks import (
+    NATIVE_OUTPUT_DIRECTORY,
+    convert_landmarks,
+    max_landmark_difference,
+    read_fcsv,
+)
+
+# A header-only NRRD image in LPS space, with spacing (0.5, 0.5, 2) and origin
+# (-10, 20, 30).  The voxel data are never read.
+NRRD_HEADER = """NRRD0004
+type: short
+dimension: 3
+space: left-posterior-superior
+sizes: 40 40 10
+space directions: (0.5,0,0) (0,0.5,0) (0,0,2)
+kinds: domain domain domain
+endian: little
+encoding: raw
+space origin: (-10,20,30)
+
+"""
+
+# Landmarks in RAS space, in the layout of current 3D Slicer .fcsv files
+FCSV_RAS = """# Markups fiducial file version = 4.11
+# CoordinateSystem = RAS
+# columns = id,x,y,z,ow,ox,oy,oz,vis,sel,lock,label,desc,associatedNodeID
+vtkMRMLMarkupsFiducialNode_0,10,-20,30,0,0,0,1,1,1,0,Nasion,,
+vtkMRMLMarkupsFiducialNode_1,5,-25,36,0,0,0,1,1,1,0,Pharynx,,
+"""
+
+# The same landmarks in LPS space, in the legacy numeric CoordinateSystem spelling
+# and without a columns line
+FCSV_LPS = """# Markups fiducial file version = 4.6
+# CoordinateSystem = 1
+vtkMRMLMarkupsFiducialNode_0,-10,20,30,0,0,0,1,1,1,0,Nasion,,
+vtkMRMLMarkupsFiducialNode_1,-5,25,36,0,0,0,1,1,1,0,Pharynx,,
+"""
+
+# The continuous voxel indices, in (k, j, i) order, of the landmarks above
+EXPECTED = dict(Nasion=[0.0, 0.0, 0.0], Pharynx=[3.0, 10.0, 10.0])
+
+
+class LandmarksTest(unittest.TestCase):
+    def setUp(self):
+        self.data_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.data_root)
+        for directory in ("images", "landmarks"):
+            os.makedirs(os.path.join(self.data_root, directory))
+        for prefix in ("1000_", "1001_"):
+            self.write("images", prefix + "CT.nrrd", NRRD_HEADER)
+        self.write("landmarks", "1000_landmarks.fcsv", FCSV_RAS)
+        self.write("landmarks", "1001_landmarks.fcsv", FCSV_LPS)
+
+    def write(self, directory, basename, text):
+        filename = os.path.join(self.data_root, directory, basename)
+        with open(filename, "w") as f:
+            f.write(text)
+        return filename
+
+    def read_output(self, basename):
+        filename = os.path.join(self.data_root, NATIVE_OUTPUT_DIRECTORY, basename)
+        with open(filename, "rb") as f:
+            return pickle.load(f)
+
+    def test_read_fcsv(self):
+        labels, points, space = read_fcsv(
+            os.path.join(self.data_root, "landmarks", "1001_landmarks.fcsv"),
+        )
+        assert labels == ["Nasion", "Pharynx"]
+        assert space == "LPS"
+        assert np.array_equal(points, [[-10.0, 20.0, 30.0], [-5.0, 25.0, 36.0]])
+
+    def test_ras_and_lps_landmarks_map_to_the_same_voxels(self):
+        written = convert_landmarks(self.data_root)
+        assert [os.path.basename(filename) for filename in written] == [
+            "1000_landmarks.p3",
+            "1001_landmarks.p3",
+        ]
+        for basename in ("1000_landmarks.p3", "1001_landmarks.p3"):
+            contents = self.read_output(basename)
+            assert set(contents) == set(EXPECTED)
+            for label, indices in EXPECTED.items():
+                assert np.allclose(contents[label], indices), (basename, label)
+
+    def test_prefix_selects_patients(self):
+        written = convert_landmarks(self.data_root, "1001_")
+        assert [os.path.basename(filename) for filename in written] == [
+            "1001_landmarks.p3",
+        ]
+
+    def test_pipeline_landmarks_are_not_overwritten_by_default(self):
+        pipeline_dir = os.path.join(self.data_root, "transformed_landmarks")
+        os.makedirs(pipeline_dir)
+        pipeline_file = os.path.join(pipeline_dir, "1000_landmarks.p3")
+        with open(pipeline_file, "wb") as f:
+            pickle.dump(dict(Nasion=np.zeros(3)), f)
+        before = os.path.getmtime(pipeline_file), os.path.getsize(pipeline_file)
+
+        written = convert_landmarks(self.data_root)
+        assert all(
+            os.path.dirname(filename)
+            == os.path.join(self.data_root, NATIVE_OUTPUT_DIRECTORY)
+            for filename in written
+        )
+        assert (os.path.getmtime(pipeline_file), os.path.getsize(pipeline_file)) == (
+            before
+        )
+
+    def test_max_landmark_difference(self):
+        convert_landmarks(self.data_root)
+        native = os.path.join(
+            self.data_root, NATIVE_OUTPUT_DIRECTORY, "1000_landmarks.p3",
+        )
+        shift = np.array([0.0, 0.0, 0.25])
+        shifted = {label: np.add(indices, shift) for label, indices in EXPECTED.items()}
+        reference = os.path.join(self.data_root, "reference.p3")
+        with open(reference, "wb") as f:
+            pickle.dump(shifted, f)
+        assert np.isclose(max_landmark_difference(native, reference), shift[2])
+
+        with open(reference, "wb") as f:
+            pickle.dump(dict(Nasion=np.zeros(3)), f)
+        assert max_landmark_difference(native, reference) is None
+
+
+if __name__ == "__main__":
+    unittest.main()
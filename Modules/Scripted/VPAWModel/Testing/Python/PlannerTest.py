@@ -0,0 +1,202 @@
+"""
+Tests of vpawmodellib.planner, with header-only NRRD images and a synthetic report
+history.
+"""
+
+import json
+import math
+import os
+import tempfile
+import unittest
+
+from vpawmodellib.governor import estimate_patient_memory_bytes
+from vpawmodellib.instrumentation import PipelineReport
+from vpawmodellib.planner import (
+    HISTORY_FILENAME,
+    PIPELINE_STAGES,
+    format_plan,
+    plan_workload,
+    read_stage_history,
+)
+
+NRRD_HEADER = """NRRD0004
+type: short
+dimension: 3
+space: left-posterior-superior
+sizes: {sizes}
+space directions: (1,0,0) (0,1,0) (0,0,1)
+kinds: domain domain domain
+endian: little
+encoding: raw
+space origin: (0,0,0)
+
+"""
+# The sizes of the CT images of each patient
+PATIENT_SIZES = {"1000_": (40, 40, 10), "1001_": (20, 20, 10)}
+MILLION = 1_000_000
+
+
+def stage_record(stage, wall_seconds, voxels, **fields):
+    return dict(
+        dict(stage=stage, status="ok", wall_seconds=wall_seconds, voxels=voxels),
+        **fields,
+    )
+
+
+class PlannerTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.data_root = directory.name
+        os.makedirs(os.path.join(self.data_root, "images"))
+        for prefix, sizes in PATIENT_SIZES.items():
+            with open(
+                os.path.join(self.data_root, "images", prefix + "CT.nrrd"), "w",
+            ) as f:
+                f.write(NRRD_HEADER.format(sizes=" ".join(map(str, sizes))))
+        self.history = os.path.join(self.data_root, HISTORY_FILENAME)
+
+    def write_history(self, *lines):
+        with open(self.history, "w") as history_file:
+            for line in lines:
+                history_file.write(
+                    (line if isinstance(line, str) else json.dumps(line)) + "\n",
+                )
+
+    def test_malformed_history_lines_are_skipped(self):
+        good = stage_record("landmark_conversion", 2.0, MILLION)
+        self.write_history(
+            dict(stages=[good]),
+            "",
+            '{"stages": [{"stage": "segmentation_and_atlas", "status": "ok"',
+            "not json",
+            "42",
+            '"a string"',
+            json.dumps(["stages"]),
+            dict(stages="landmark_conversion"),
+            dict(status="ok"),
+            dict(
+                stages=[
+                    "landmark_conversion",
+                    dict(good, status="failed"),
+                    dict(good, voxels=None),
+                    dict(good, voxels=0),
+                    dict(good, voxels="many"),
+                    dict(good, wall_seconds=None),
+                    {key: value for key, value in good.items() if key != "stage"},
+                ],
+            ),
+            dict(stages=[good]),
+        )
+        missing = os.path.join(self.data_root, "missing.jsonl")
+        assert read_stage_history([missing, self.history]) == [good, good]
+
+    def test_throughput_estimate(self):
+        landmark_seconds_per_voxel = 2.0 / MILLION
+        # Two runs of segmentation, over different numbers of voxels
+        segmentation_runs = 2
+        segmentation_seconds_per_voxel = (10.0 + 50.0) / (MILLION + 2 * MILLION)
+        peak_bytes_per_voxel = 3000
+        self.write_history(
+            dict(stages=[stage_record("landmark_conversion", 2.0, MILLION)]),
+            dict(
+                stages=[
+                    stage_record(
+                        "segmentation_and_atlas",
+                        10.0,
+                        MILLION,
+                        peak_rss_bytes=2000 * MILLION,
+                        max_patient_voxels=MILLION,
+                    ),
+                    stage_record(
+                        "segmentation_and_atlas",
+                        50.0,
+                        2 * MILLION,
+                        peak_rss_bytes=peak_bytes_per_voxel * MILLION,
+                        max_patient_voxels=MILLION,
+                    ),
+                ],
+            ),
+        )
+        plan = plan_workload(self.data_root, list(PATIENT_SIZES))
+
+        patient_voxels = {
+            prefix: math.prod(sizes) for prefix, sizes in PATIENT_SIZES.items()
+        }
+        total_voxels = sum(patient_voxels.values())
+        largest_voxels = max(patient_voxels.values())
+        assert plan["patient_count"] == len(PATIENT_SIZES)
+        assert plan["patients"] == [
+            dict(prefix=prefix, images=1, voxels=voxels)
+            for prefix, voxels in patient_voxels.items()
+        ]
+        assert plan["total_voxels"] == total_voxels
+        assert plan["largest_patient_voxels"] == largest_voxels
+
+        stages = plan["stages"]
+        assert list(stages) == list(PIPELINE_STAGES)
+        assert math.isclose(
+            stages["landmark_conversion"]["estimated_seconds"],
+            landmark_seconds_per_voxel * total_voxels,
+        )
+        assert stages["landmark_conversion"]["samples"] == 1
+        assert stages["landmark_conversion"]["estimated_peak_memory_bytes"] is None
+        assert math.isclose(
+            stages["segmentation_and_atlas"]["estimated_seconds"],
+            segmentation_seconds_per_voxel * total_voxels,
+        )
+        assert stages["segmentation_and_atlas"]["samples"] == segmentation_runs
+        # The most pessimistic ratio of peak memory to the largest patient is used
+        assert math.isclose(
+            stages["segmentation_and_atlas"]["estimated_peak_memory_bytes"],
+            peak_bytes_per_voxel * largest_voxels,
+        )
+        assert math.isclose(
+            plan["estimated_peak_memory_bytes"], peak_bytes_per_voxel * largest_voxels,
+        )
+        # config_generation has not been measured, so neither has the whole run
+        assert stages["config_generation"]["estimated_seconds"] is None
+        assert plan["estimated_seconds"] is None
+        assert "not measured in earlier runs" in format_plan(plan)
+
+    def test_total_when_every_stage_is_measured(self):
+        self.write_history(
+            dict(
+                stages=[
+                    stage_record(name, seconds, MILLION)
+                    for name, seconds in zip(PIPELINE_STAGES, (1.0, 2.0, 3.0))
+                ],
+            ),
+        )
+        plan = plan_workload(self.data_root, ["1000_"])
+        assert math.isclose(
+            plan["estimated_seconds"],
+            (1.0 + 2.0 + 3.0) / MILLION * math.prod(PATIENT_SIZES["1000_"]),
+        )
+
+    def test_without_history(self):
+        plan = plan_workload(self.data_root, ["1000_", "1001_"])
+        assert all(stage["samples"] == 0 for stage in plan["stages"].values())
+        assert plan["estimated_seconds"] is None
+        assert plan["estimated_peak_memory_bytes"] == estimate_patient_memory_bytes(
+            self.data_root, "1000_",
+        )
+
+    def test_reads_the_history_that_reports_write(self):
+        report = PipelineReport(dict(patient_prefix="1000_"))
+        with report.stage("landmark_conversion", "1000_", voxels=MILLION):
+            pass
+        try:
+            with report.stage("segmentation_and_atlas", "1000_", voxels=MILLION):
+                raise RuntimeError("failed stage")
+        except RuntimeError:
+            pass
+        report.status = "failed"
+        report.write(self.data_root)
+
+        records = read_stage_history([self.history])
+        assert [record["stage"] for record in records] == ["landmark_conversion"]
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,65 @@
+"""
+Tests of vpawmodellib.profiles: inference profiles and the devices of segmentation.
+"""
+
+import os
+import unittest
+from unittest import mock
+
+from vpawmodellib.profiles import (
+    DEFAULT_TRAIN_DEVICES,
+    INFERENCE_PROFILES,
+    apply_inference_profile,
+    segmentation_devices,
+    visible_gpu_count,
+)
+
+
+class ProfilesTest(unittest.TestCase):
+    def test_fast_preview_computes_fewer_tiles(self):
+        def tile_factor(name):
+            return 1 / (1 - INFERENCE_PROFILES[name]["tiles_overlap"]) ** 3
+
+        assert tile_factor("fast preview") < tile_factor("balanced")
+        assert tile_factor("balanced") < tile_factor("full quality")
+
+    def test_apply_inference_profile(self):
+        segment_yaml = dict(
+            crop_size=[192, 192, 192],
+            training=dict(batch_size=8, log_interval=50),
+            inference=dict(force_spacing=None, tiles_overlap=0.75),
+        )
+        apply_inference_profile(segment_yaml, "fast preview")
+        profile = INFERENCE_PROFILES["fast preview"]
+        assert segment_yaml["training"] == dict(
+            batch_size=profile["batch_size"], log_interval=50,
+        )
+        assert segment_yaml["inference"] == dict(
+            force_spacing=None,
+            tiles_overlap=profile["tiles_overlap"],
+            tile_fusion_mode=profile["tile_fusion_mode"],
+        )
+        try:
+            apply_inference_profile(segment_yaml, "fastest")
+        except ValueError:
+            pass
+        else:
+            self.fail("An unknown profile was accepted")
+
+    def test_segmentation_devices(self):
+        assert segmentation_devices(1) == DEFAULT_TRAIN_DEVICES[:1]
+        assert segmentation_devices(len(DEFAULT_TRAIN_DEVICES) + 2) == (
+            DEFAULT_TRAIN_DEVICES
+        )
+        assert segmentation_devices(None) == DEFAULT_TRAIN_DEVICES
+        with self.assertLogs(level="WARNING"):
+            assert segmentation_devices(0) == DEFAULT_TRAIN_DEVICES
+
+    def test_cuda_visible_devices(self):
+        for visible, count in (("", 0), ("-1", 0), ("0", 1), ("2,3", 2), ("1,-1,0", 1)):
+            with mock.patch.dict(os.environ, CUDA_VISIBLE_DEVICES=visible):
+                assert visible_gpu_count() == count, visible
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,97 @@
+"""
+Tests of vpawmodellib.progress: parsing tqdm output and tracking a pipeline run.
+"""
+
+import unittest
+
+from vpawmodellib.progress import BarTimer, ProgressTracker, parse_duration, parse_tqdm
+
+
+def bar_line(n, total=100, description="Inference"):
+    """
+    Return a tqdm line for step n of total.
+    """
+    prefix = f"{description}: " if description else ""
+    percent = 100 * n // total
+    return f"{prefix}{percent:3d}%|####      | {n}/{total} [00:12<01:02:03,  3.60it/s]"
+
+
+class ParseTest(unittest.TestCase):
+    def test_parse_tqdm(self):
+        bar = parse_tqdm(bar_line(45))
+        assert bar == dict(
+            description="Inference",
+            n=45,
+            total=100,
+            fraction=0.45,
+            elapsed_seconds=12,
+            remaining_seconds=3723,
+        )
+
+    def test_parse_tqdm_without_description(self):
+        assert parse_tqdm(bar_line(1, total=4, description=""))["description"] == ""
+
+    def test_parse_tqdm_with_unknown_remaining_time(self):
+        bar = parse_tqdm("Loading:   0%|          | 0/7 [00:00<?, ?it/s]")
+        assert bar["fraction"] == 0.0
+        assert bar["remaining_seconds"] is None
+
+    def test_other_lines_are_not_bars(self):
+        assert parse_tqdm("Segmenting 1000_CT.nrrd") is None
+        assert parse_tqdm("") is None
+
+    def test_parse_duration(self):
+        assert parse_duration("02:03") == 2 * 60 + 3
+        assert parse_duration("01:02:03") == 3600 + 2 * 60 + 3
+        assert parse_duration("?") is None
+
+
+class ProgressTrackerTest(unittest.TestCase):
+    def test_steps_count_toward_the_whole_run(self):
+        tracker = ProgressTracker(expected_steps=4)
+        tracker.start("landmarks", "1_")
+        tracker.finish("landmarks", "1_")
+        tracker.start("segmentation", "1_")
+        tracker.output("segmentation", "1_", bar_line(50))
+        snapshot = tracker.snapshot()
+        assert snapshot["fraction"] == (1 + 0.5) / 4
+        assert [step["stage"] for step in snapshot["active"]] == ["segmentation"]
+
+    def test_bar_updates_are_logged_every_step_of_percentage_points(self):
+        tracker = ProgressTracker(expected_steps=1)
+        tracker.start("segmentation", "")
+        logged = [
+            n
+            for n in range(0, 101, 5)
+            if tracker.output("segmentation", "", bar_line(n))
+        ]
+        assert logged == list(range(0, 101, 10))
+        assert tracker.output("segmentation", "", "a line that is not a bar")
+
+    def test_patient_is_recognized_in_the_output(self):
+        tracker = ProgressTracker(expected_steps=1, patient_prefixes=("1_", "2_"))
+        tracker.start("segmentation", "")
+        tracker.output("segmentation", "", "Segmenting 2_CT.nrrd")
+        tracker.output("segmentation", "", bar_line(30))
+        summary = tracker.summary().splitlines()
+        assert summary[0].startswith("segmentation (2_): Inference 30%")
+        assert summary[-1].startswith("Overall 30%")
+
+    def test_output_of_unknown_step_is_logged(self):
+        tracker = ProgressTracker(expected_steps=1)
+        assert tracker.output("segmentation", "", bar_line(30))
+        assert tracker.snapshot()["fraction"] == 0.0
+
+
+class BarTimerTest(unittest.TestCase):
+    def test_only_matching_bars_are_timed(self):
+        timer = BarTimer()
+        timer.output(bar_line(0, description="Loading"))
+        assert timer.seconds() is None
+        timer.output(bar_line(0, description=""))
+        timer.output(bar_line(100, description=""))
+        assert timer.seconds() >= 0.0
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,95 @@
+"""
+Tests of vpawmodellib.streaming.run_streaming.
+"""
+
+import threading
+import time
+import unittest
+
+from vpawmodellib.streaming import run_streaming
+
+# Seconds to let the stages run before checking how far ahead the first one got
+SETTLE_SECONDS = 0.2
+
+
+class StreamingTest(unittest.TestCase):
+    def test_items_pass_every_stage_in_order(self):
+        seen = dict(a=[], b=[], c=[])
+
+        def stage(name):
+            def function(item):
+                seen[name].append(item)
+                return True
+
+            return name, function
+
+        items = [f"{index}_" for index in range(10)]
+        results = run_streaming(items, [stage("a"), stage("b"), stage("c")])
+        assert results == dict.fromkeys(items)
+        assert seen == dict(a=items, b=items, c=items)
+
+    def test_failed_items_stop_at_their_stage(self):
+        reached_last = []
+
+        def flaky(item):
+            if item == "2_":
+                raise RuntimeError("flaky stage")
+            return item != "3_"
+
+        results = run_streaming(
+            ["1_", "2_", "3_", "4_"],
+            [
+                ("first", lambda item: item != "1_"),
+                ("flaky", flaky),
+                ("last", lambda item: reached_last.append(item) is None),
+            ],
+        )
+        assert results == {"1_": "first", "2_": "flaky", "3_": "flaky", "4_": None}
+        assert reached_last == ["4_"]
+
+    def test_queue_size_bounds_how_far_a_stage_runs_ahead(self):
+        queue_size = 1
+        started = []
+        release = threading.Event()
+
+        def first(item):
+            started.append(item)
+            return True
+
+        def blocked(item):
+            return release.wait()
+
+        result = dict()
+        thread = threading.Thread(
+            target=lambda: result.update(
+                run_streaming(
+                    range(10),
+                    [("first", first), ("blocked", blocked)],
+                    queue_size=queue_size,
+                ),
+            ),
+        )
+        thread.start()
+        try:
+            time.sleep(SETTLE_SECONDS)
+            # One item in the blocked stage, queue_size waiting for it, and one waiting
+            # to be queued
+            assert len(started) <= 1 + queue_size + 1
+        finally:
+            release.set()
+            thread.join()
+        assert result == dict.fromkeys(range(10))
+
+    def test_wait_callback_is_called_while_stages_run(self):
+        calls = []
+
+        def slow(item):
+            time.sleep(SETTLE_SECONDS)
+            return True
+
+        run_streaming(["1_"], [("slow", slow)], wait_callback=lambda: calls.append(1))
+        assert calls
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,14 +1,61 @@
+import contextlib
 import importlib
+import importlib.util
+import json
 import logging
 import os
 import pathlib
 import qt
+import shutil
 import slicer
 import slicer.ScriptedLoadableModule
 import slicer.util
+import subprocess
 import sys
 import tempfile
+import threading
 import time
+from vpawcommonlib.patients import (
+    entry_prefix,
+    parse_patient_selection,
+    select_patient_prefixes,
+)
+from vpawcommonlib.profiling import profiled
+from vpawcommonlib.tracing import span, traced
+from vpawmodellib.dependencies import (
+    LOCKFILE_NAME,
+    find_missing_dependencies,
+    installed_version,
+    wheelhouse_pip_install_arguments,
+)
+from vpawmodellib.governor import (
+    AdmissionController,
+    estimate_patient_memory_bytes,
+    run_admitted,
+)
+from vpawmodellib.inprocess import run_module_in_process
+from vpawmodellib.instrumentation import PipelineReport, pipeline_version
+from vpawmodellib.planner import format_plan, plan_workload
+from vpawmodellib.profiles import (
+    DEFAULT_INFERENCE_PROFILE,
+    INFERENCE_PROFILES,
+    apply_inference_profile,
+    dice_coefficient,
+    find_computed_segmentation,
+    read_segmentation_mask,
+    segmentation_devices,
+    visible_gpu_count,
+)
+from vpawmodellib.progress import BarTimer, ProgressTracker
+from vpawmodellib.streaming import run_streaming
+from vpawmodellib.worker import (
+    DEFAULT_PRELOAD_MODULES,
+    WarmWorker,
+    python_slicer_executable,
+)
+
+# Least number of seconds between GUI updates while the pipeline runs
+PROGRESS_INTERVAL = 0.1
 
 
 class BusyCursor:
@@ -40,8 +87,8 @@ class VPAWModel(slicer.ScriptedLoadableModule.ScriptedLoadableModule):
         slicer.ScriptedLoadableModule.ScriptedLoadableModule.__init__(self, parent)
         self.parent.title = "VPAW Model"
         self.parent.categories = ["VPAW"]
-        # TODO: add here list of module names that this module requires
-        self.parent.dependencies = []
+        # VPAWCommon provides vpawcommonlib
+        self.parent.dependencies = ["VPAWCommon"]
         self.parent.contributors = [
             "Andinet Enquobahrie (Kitware, Inc.)",
             "Shreeraj Jadhav (Kitware, Inc.)",
@@ -108,6 +155,7 @@ class VPAWModelWidget(
         self.logic = None
         self._updatingGUIFromQSettings = False
 
+    @profiled
     def setup(self):
         """
         Called when the user opens the module the first time and the widget is
@@ -126,6 +174,11 @@ class VPAWModelWidget(
         # MRML widget's "setMRMLScene(vtkMRMLScene*)" slot.
         uiWidget.setMRMLScene(slicer.mrmlScene)
 
+        for profileName in INFERENCE_PROFILES:
+            self.ui.InferenceProfile.addItem(profileName)
+        self.ui.pipelineProgressBar.visible = False
+        self.ui.pipelineProgressLabel.visible = False
+
         # Configure 3D view
         viewNode = slicer.app.layoutManager().threeDWidget(0).mrmlViewNode()
         viewNode.SetBackgroundColor(0, 0, 0)
@@ -155,6 +208,9 @@ class VPAWModelWidget(
         self.ui.PediatricAirwayAtlasDirectory.connect(
             "currentPathChanged(const QString&)", self.updateQSettingsFromGUI,
         )
+        self.ui.WheelhouseDirectory.connect(
+            "currentPathChanged(const QString&)", self.updateQSettingsFromGUI,
+        )
         self.ui.VPAWRootDirectory.connect(
             "currentPathChanged(const QString&)", self.updateQSettingsFromGUI,
         )
@@ -164,6 +220,19 @@ class VPAWModelWidget(
         self.ui.PatientPrefix.connect(
             "textChanged(const QString&)", self.updateQSettingsFromGUI,
         )
+        self.ui.InferenceProfile.connect(
+            "currentIndexChanged(int)", self.updateQSettingsFromGUI,
+        )
+        self.ui.UseWarmWorker.connect("toggled(bool)", self.updateQSettingsFromGUI)
+        self.ui.RunInProcess.connect("toggled(bool)", self.updateQSettingsFromGUI)
+        self.ui.NativeLandmarkConversion.connect(
+            "toggled(bool)", self.updateQSettingsFromGUI,
+        )
+        self.ui.Streaming.connect("toggled(bool)", self.updateQSettingsFromGUI)
+        self.ui.MemoryBudget.connect(
+            "valueChanged(double)", self.updateQSettingsFromGUI,
+        )
+        self.ui.CpuBudget.connect("valueChanged(int)", self.updateQSettingsFromGUI)
         self.ui.PediatricAirwayAtlasDirectory.connect(
             "validInputChanged(bool)", self.updateQSettingsFromGUI,
         )
@@ -183,6 +252,9 @@ class VPAWModelWidget(
         self.ui.runPediatricAirwayAtlasButton.connect(
             "clicked(bool)", self.onRunPediatricAirwayAtlasButton,
         )
+        self.ui.compareInferenceProfilesButton.connect(
+            "clicked(bool)", self.onCompareInferenceProfilesButton,
+        )
 
         # No need to call self.updateGUIFromQSettings() because it will be called upon
         # self.enter().
@@ -192,7 +264,10 @@ class VPAWModelWidget(
         Called when the application closes and the module widget is destroyed.
         """
         self.removeObservers()
+        if self.logic is not None:
+            self.logic.shutdownWarmWorker()
 
+    @profiled
     def enter(self):
         """
         Called each time the user opens this module.
@@ -232,10 +307,30 @@ class VPAWModelWidget(
         self.ui.PediatricAirwayAtlasDirectory.currentPath = qsettings.value(
             "PediatricAirwayAtlasDirectory", "",
         )
+        self.ui.WheelhouseDirectory.currentPath = qsettings.value(
+            "WheelhouseDirectory", "",
+        )
         self.ui.VPAWRootDirectory.currentPath = qsettings.value("VPAWRootDirectory", "")
         self.ui.VPAWModelsDirectory.currentPath = qsettings.value(
             "VPAWModelsDirectory", "",
         )
+        self.ui.InferenceProfile.currentText = qsettings.value(
+            "InferenceProfile", DEFAULT_INFERENCE_PROFILE,
+        )
+        self.ui.UseWarmWorker.checked = qsettings.value("UseWarmWorker", "") in (
+            True,
+            "true",
+        )
+        self.ui.RunInProcess.checked = qsettings.value("RunInProcess", "") in (
+            True,
+            "true",
+        )
+        self.ui.NativeLandmarkConversion.checked = qsettings.value(
+            "NativeLandmarkConversion", "",
+        ) in (True, "true")
+        self.ui.Streaming.checked = qsettings.value("Streaming", "") in (True, "true")
+        self.ui.MemoryBudget.value = float(qsettings.value("MemoryBudget", "") or 0)
+        self.ui.CpuBudget.value = int(qsettings.value("CpuBudget", "") or 0)
         qsettings.endGroup()
 
         # Now that we've updated the form widgets' input fields, let's update other
@@ -247,6 +342,11 @@ class VPAWModelWidget(
 
     def updateButtonStatesAndTooltips(self):
         self.ui.PediatricAirwayAtlasDirectory.toolTip = "Root directory for source code"
+        self.ui.WheelhouseDirectory.toolTip = (
+            f"Directory of wheels and a {LOCKFILE_NAME} file of exact versions, for"
+            + " installing dependencies without network access.  Blank means install"
+            + " from the package index."
+        )
         if os.path.isdir(self.ui.PediatricAirwayAtlasDirectory.currentPath):
             self.ui.linkPediatricAirwayAtlasButton.toolTip = (
                 "Link to Pediatric Airway Atlas codebase and install dependencies"
@@ -267,7 +367,44 @@ class VPAWModelWidget(
             "Directory containing file named like '116(158.10-38.AM.24.Mar).pth'"
         )
         self.ui.PatientPrefix.toolTip = (
-            "Process only files with this prefix.  Blank means all files."
+            "Patient IDs or prefixes, separated by commas or spaces, or"
+            + " '@path/to/file' for a file listing them.  An ID such as 1000 selects"
+            + " only the patient with prefix 1000_; a prefix selects every patient that"
+            + " it starts.  Blank means all patients."
+        )
+        self.ui.InferenceProfile.toolTip = (
+            "Trade segmentation accuracy for speed.  'fast preview' uses less tile"
+            + " overlap during inference; 'full quality' is the reference setting."
+        )
+        self.ui.UseWarmWorker.toolTip = (
+            "Run the pipeline in a background process that keeps its Python packages"
+            + " and the segmentation model loaded, so that later runs start faster"
+        )
+        self.ui.RunInProcess.toolTip = (
+            "Experimental: run the pipeline in VPAW's own Python interpreter, with no"
+            + " start-up cost for each stage.  The stages then run one at a time,"
+            + " change VPAW's working directory while they run, and a crash in the"
+            + " pipeline closes VPAW.  'Keep pipeline loaded' is the supported way to"
+            + " avoid the start-up cost."
+        )
+        self.ui.NativeLandmarkConversion.toolTip = (
+            "Convert landmarks to voxel indices with VPAW's own implementation, which"
+            + " reads only the image headers, instead of with pediatric_airway_atlas."
+            + "  Until the two have been found to match, pediatric_airway_atlas also"
+            + " runs and its landmarks are the ones used."
+        )
+        self.ui.Streaming.toolTip = (
+            "Run the pipeline one patient at a time, converting the landmarks of the"
+            + " next patients while earlier patients are being segmented"
+        )
+        self.ui.MemoryBudget.toolTip = (
+            "Run several patients at once, starting each one only when its estimated"
+            + " memory fits within this budget.  'No limit' runs the patients together"
+            + " in a single pipeline run."
+        )
+        self.ui.CpuBudget.toolTip = (
+            "When a memory budget is set, the number of CPUs that the patients running"
+            + " at once may use together"
         )
         if os.path.isdir(self.ui.VPAWRootDirectory.currentPath) and os.path.isdir(
             self.ui.VPAWModelsDirectory.currentPath,
@@ -280,6 +417,23 @@ class VPAWModelWidget(
                 + " directory"
             )
             self.ui.runPediatricAirwayAtlasButton.enabled = False
+        patientText = self.ui.PatientPrefix.text.strip()
+        if (
+            self.ui.runPediatricAirwayAtlasButton.enabled
+            and not patientText.startswith("@")
+            and len(parse_patient_selection(patientText)) == 1
+        ):
+            self.ui.compareInferenceProfilesButton.toolTip = (
+                "Run the segmentation for the patient with every inference profile and"
+                + " report run times and Dice differences against 'full quality'"
+            )
+            self.ui.compareInferenceProfilesButton.enabled = True
+        else:
+            self.ui.compareInferenceProfilesButton.toolTip = (
+                "Comparison is disabled; first select input/output root directory,"
+                + " models directory, and a single patient prefix"
+            )
+            self.ui.compareInferenceProfilesButton.enabled = False
 
     def setOrRemoveQSetting(self, qsettings, key, value):
         # We can keep the operating system's "registry" cleaner by removing the key
@@ -307,12 +461,42 @@ class VPAWModelWidget(
             "PediatricAirwayAtlasDirectory",
             self.ui.PediatricAirwayAtlasDirectory.currentPath,
         )
+        self.setOrRemoveQSetting(
+            qsettings, "WheelhouseDirectory", self.ui.WheelhouseDirectory.currentPath,
+        )
         self.setOrRemoveQSetting(
             qsettings, "VPAWRootDirectory", self.ui.VPAWRootDirectory.currentPath,
         )
         self.setOrRemoveQSetting(
             qsettings, "VPAWModelsDirectory", self.ui.VPAWModelsDirectory.currentPath,
         )
+        self.setOrRemoveQSetting(
+            qsettings, "InferenceProfile", self.ui.InferenceProfile.currentText,
+        )
+        self.setOrRemoveQSetting(
+            qsettings, "UseWarmWorker", "true" if self.ui.UseWarmWorker.checked else "",
+        )
+        self.setOrRemoveQSetting(
+            qsettings, "RunInProcess", "true" if self.ui.RunInProcess.checked else "",
+        )
+        self.setOrRemoveQSetting(
+            qsettings,
+            "NativeLandmarkConversion",
+            "true" if self.ui.NativeLandmarkConversion.checked else "",
+        )
+        self.setOrRemoveQSetting(
+            qsettings, "Streaming", "true" if self.ui.Streaming.checked else "",
+        )
+        self.setOrRemoveQSetting(
+            qsettings,
+            "MemoryBudget",
+            str(self.ui.MemoryBudget.value) if self.ui.MemoryBudget.value else "",
+        )
+        self.setOrRemoveQSetting(
+            qsettings,
+            "CpuBudget",
+            str(self.ui.CpuBudget.value) if self.ui.CpuBudget.value else "",
+        )
         qsettings.endGroup()
 
         # Because the widgets' form inputs have changed, we should update other widgets
@@ -343,6 +527,7 @@ class VPAWModelWidget(
         ):
             self.logic.linkPediatricAirwayAtlas(
                 self.ui.PediatricAirwayAtlasDirectory.currentPath,
+                self.ui.WheelhouseDirectory.currentPath,
             )
 
     def onRunPediatricAirwayAtlasButton(self):
@@ -358,19 +543,141 @@ class VPAWModelWidget(
         VPAWModelsDirectory :
             It must contain a file with name like "116(158.10-38.AM.24.Mar).pth".
         PatientPrefix :
-            Process only files with this prefix.  Blank means all files.
-
-        Run the Pediatric Airway Atlas pipeline at the user's request.
+            Process only files with this prefix.  Blank means all files.  Alternatively,
+            several patient IDs or prefixes, or "@" and the name of a file listing them.
+            A single ID or prefix runs the pipeline once for all of the patients that it
+            selects, as before lists were supported, and shows an error as soon as it
+            happens.  A list or file runs the pipeline separately for each patient and
+            reports the patients that failed together at the end; see
+            VPAWModelLogic.runPatients.
+        InferenceProfile :
+            Name of the inference profile used for segmentation.
+        UseWarmWorker :
+            Whether to run the pipeline in a persistent background process.
+        RunInProcess :
+            Whether to run the pipeline in 3D Slicer's own Python interpreter, which is
+            experimental; see vpawmodellib.inprocess.
+        NativeLandmarkConversion :
+            Whether to convert landmarks with vpawmodellib.landmarks.
+        Streaming :
+            Whether to overlap the pipeline stages of different patients.
+        MemoryBudget :
+            If not zero, the memory in GB that the patients running at once may use.
+        CpuBudget :
+            The number of CPUs that the patients running at once may use.  Zero means
+            all CPUs.
+
+        Show the estimated duration and peak memory of the run, then run the Pediatric
+        Airway Atlas pipeline at the user's request.
         """
+        text = self.ui.PatientPrefix.text
+        try:
+            entries = parse_patient_selection(text)
+            if len(entries) == 1 and not text.strip().startswith("@"):
+                # A single ID or prefix is run as one pipeline run
+                selection = entry_prefix(
+                    self.ui.VPAWRootDirectory.currentPath, entries[0],
+                )
+            else:
+                # Nothing entered means all patients, in one run of the pipeline
+                selection = entries or ""
+        except OSError as e:
+            slicer.util.errorDisplay(
+                f"Unable to read the list of patients: {e}", windowTitle="Run Error",
+            )
+            return
+        try:
+            plan = self.logic.planWorkload(
+                self.ui.VPAWRootDirectory.currentPath, selection,
+            )
+        except (OSError, ValueError) as e:
+            logging.warning(f"Unable to plan the run: {e}")
+        else:
+            if not slicer.util.confirmOkCancelDisplay(
+                format_plan(plan) + "\n\nRun the pipeline?", "Planned Run",
+            ):
+                return
         with slicer.util.tryWithErrorDisplay(
             "Failed to compute results.", waitCursor=True,
         ):
-            self.logic.runPediatricAirwayAtlas(
+            self.logic.use_warm_worker = self.ui.UseWarmWorker.checked
+            self.logic.run_in_process = self.ui.RunInProcess.checked
+            self.logic.native_landmark_conversion = (
+                self.ui.NativeLandmarkConversion.checked
+            )
+            self.logic.memory_budget_bytes = (
+                int(self.ui.MemoryBudget.value * 1024**3) or None
+            )
+            self.logic.cpu_budget = self.ui.CpuBudget.value or None
+            self.logic.progress_callback = self.showPipelineProgress
+            self.ui.pipelineProgressBar.value = 0
+            self.ui.pipelineProgressBar.visible = True
+            self.ui.pipelineProgressLabel.visible = True
+            try:
+                self.logic.runPediatricAirwayAtlas(
+                    self.ui.PediatricAirwayAtlasDirectory.currentPath,
+                    self.ui.VPAWRootDirectory.currentPath,
+                    self.ui.VPAWModelsDirectory.currentPath,
+                    selection,
+                    self.ui.InferenceProfile.currentText,
+                    streaming=self.ui.Streaming.checked,
+                )
+            finally:
+                self.logic.progress_callback = None
+                self.ui.pipelineProgressBar.visible = False
+                self.ui.pipelineProgressLabel.visible = False
+        if self.logic.last_pipeline_report is not None:
+            self.ui.pipelineReportLabel.text = self.logic.last_pipeline_report.summary()
+
+    def showPipelineProgress(self, tracker):
+        """
+        Show the progress of the running pipeline, given its ProgressTracker.
+        """
+        self.ui.pipelineProgressBar.value = int(100 * tracker.snapshot()["fraction"])
+        self.ui.pipelineProgressLabel.text = tracker.summary()
+
+    def onCompareInferenceProfilesButton(self):
+        """
+        Run the segmentation for the patient with each inference profile and show how
+        they compare with "full quality".
+        """
+        with slicer.util.tryWithErrorDisplay(
+            "Failed to compare inference profiles.", waitCursor=True,
+        ):
+            self.logic.use_warm_worker = self.ui.UseWarmWorker.checked
+            self.logic.run_in_process = self.ui.RunInProcess.checked
+            self.logic.native_landmark_conversion = (
+                self.ui.NativeLandmarkConversion.checked
+            )
+            prefixes = self.logic.selectPatientPrefixes(
+                self.ui.VPAWRootDirectory.currentPath,
+                parse_patient_selection(self.ui.PatientPrefix.text),
+            )
+            if len(prefixes) != 1:
+                raise ValueError(
+                    f"Select exactly one patient, not {len(prefixes)}: "
+                    + ", ".join(prefixes),
+                )
+            report = self.logic.compareInferenceProfiles(
                 self.ui.PediatricAirwayAtlasDirectory.currentPath,
                 self.ui.VPAWRootDirectory.currentPath,
                 self.ui.VPAWModelsDirectory.currentPath,
-                self.ui.PatientPrefix.text,
+                prefixes[0],
             )
+            if report:
+                slicer.util.infoDisplay(
+                    "\n".join(
+                        f"{name}: "
+                        + (
+                            f"{result['inference_seconds']:.1f} seconds of inference"
+                            if result["inference_seconds"] is not None
+                            else f"{result['run_seconds']:.1f} seconds in all"
+                        )
+                        + f", Dice difference {result['dice_difference']:.4f}"
+                        for name, result in report["profiles"].items()
+                    ),
+                    "Inference Profiles",
+                )
 
 
 #
@@ -429,24 +736,86 @@ class VPAWModelLogic(slicer.ScriptedLoadableModule.ScriptedLoadableModuleLogic):
             ("yaml", "pyyaml"),
         )
 
+        # When True, pipeline modules are run by a persistent worker process that keeps
+        # torch, monai, etc. and the model checkpoint loaded between runs.  Otherwise
+        # each pipeline module runs in a fresh interpreter.
+        self.use_warm_worker = False
+        # The persistent worker processes, by pipeline stage
+        self.warm_workers = dict()
+        # When True, pipeline modules are run in this process, one at a time, which
+        # takes precedence over self.use_warm_worker.  Experimental; see
+        # vpawmodellib.inprocess.
+        self.run_in_process = False
+        # When True, landmarks are converted by vpawmodellib.landmarks instead of by
+        # pediatric_airway_atlas, once verifyNativeLandmarkConversion has found that
+        # the two match, which sets native_landmark_conversion_verified
+        self.native_landmark_conversion = False
+        self.native_landmark_conversion_verified = False
+
+        # When memory_budget_bytes is set, patients are run concurrently, each admitted
+        # only when its estimated memory and its CPUs fit within the budgets.  A
+        # cpu_budget of None means all CPUs.  Each patient's child processes are limited
+        # to cpus_per_patient threads.
+        self.memory_budget_bytes = None
+        self.cpu_budget = None
+        self.cpus_per_patient = 4
+        # The thread limit for pipeline child processes, or None for no limit
+        self.threads_per_child = None
+
+        # While the pipeline runs, a PipelineReport that records each stage, and the
+        # plan from planWorkload that gives the number of CT voxels of each patient
+        self.pipeline_report = None
+        self.workload_plan = None
+        # While the pipeline runs, a ProgressTracker.  If progress_callback is set, it
+        # is called with the tracker, on the main thread, as the pipeline progresses.
+        self.progress_tracker = None
+        self.progress_callback = None
+        self._lastWaitTime = 0.0
+        self.last_pipeline_report = None
+
+        # When False, messages are logged instead of shown in dialogs and questions are
+        # answered with self.assume_yes, so that the logic can run without a GUI.
+        self.interactive = True
+        self.assume_yes = False
+
     def setDefaultParameters(self, parameterNode):
         """
         Initialize with default settings.
         """
         pass
 
-    def linkPediatricAirwayAtlas(self, pediatricAirwayAtlasDirectory):
+    def showInfo(self, text, windowTitle):
+        if self.interactive:
+            slicer.util.infoDisplay(text, windowTitle)
+        else:
+            logging.info(f"{windowTitle}: {text}")
+
+    def showError(self, text, windowTitle):
+        if self.interactive:
+            slicer.util.errorDisplay(text, windowTitle)
+        else:
+            logging.error(f"{windowTitle}: {text}")
+
+    def confirm(self, text, windowTitle):
+        if self.interactive:
+            return slicer.util.confirmYesNoDisplay(text, windowTitle)
+        logging.info(f"{windowTitle}: {text} {'Yes' if self.assume_yes else 'No'}")
+        return self.assume_yes
+
+    def linkPediatricAirwayAtlas(
+        self, pediatricAirwayAtlasDirectory, wheelhouseDirectory=None,
+    ):
         startTime = time.time()
         logging.info("Pediatric Airway Atlas installation started")
 
-        response = self.installAndImportDependencies() and self.ensureModulePath(
-            pediatricAirwayAtlasDirectory,
-        )
+        response = self.installAndImportDependencies(
+            wheelhouseDirectory,
+        ) and self.ensureModulePath(pediatricAirwayAtlasDirectory)
 
         if response:
             # No error messages have been sent to the user, so let's assure the user
             # that something useful has happened.
-            slicer.util.infoDisplay("Pediatric Airway Atlas is linked", "Linked")
+            self.showInfo("Pediatric Airway Atlas is linked", "Linked")
 
         stopTime = time.time()
         logging.info(
@@ -457,14 +826,23 @@ class VPAWModelLogic(slicer.ScriptedLoadableModule.ScriptedLoadableModuleLogic):
 
     def ensureModulePath(self, directory):
         self.pediatric_airway_atlas_directory = str(pathlib.Path(directory))
+        if any(
+            worker.cwd != self.pediatric_airway_atlas_directory
+            for worker in self.warm_workers.values()
+        ):
+            # The workers have imported from a different source directory
+            self.shutdownWarmWorker()
         if self.pediatric_airway_atlas_directory not in sys.path:
             sys.path.insert(0, self.pediatric_airway_atlas_directory)
             importlib.invalidate_caches()
         try:
+            # Locate, but do not import, the pipeline entry point; it is imported when a
+            # pipeline stage runs.
             for module_name in ("conversion_utils.generate_pixel_space_landmarks",):
-                imported = importlib.import_module(module_name)
+                if importlib.util.find_spec(module_name) is None:
+                    raise ModuleNotFoundError(module_name)
         except:
-            slicer.util.errorDisplay(
+            self.showError(
                 f"Unable to find pediatric_airway_atlas/{module_name}\n"
                 + "Check the console for details.",
                 "Install Error",
@@ -477,28 +855,43 @@ class VPAWModelLogic(slicer.ScriptedLoadableModule.ScriptedLoadableModuleLogic):
             plural = "" if len(installed_modules) == 1 else "s"
             version_text = "\n".join(
                 [
-                    f"    {pip_install_name} version: {module.__version__}"
-                    if hasattr(module, "__version__")
+                    f"    {pip_install_name} version: {version}"
+                    if version is not None
                     else f"    {pip_install_name} version: unknown"
-                    for module_name, pip_install_name, module in installed_modules
+                    for module_name, pip_install_name, version in installed_modules
                 ],
             )
-            slicer.util.infoDisplay(
+            self.showInfo(
                 f"Module{plural} installed:\n" + version_text,
                 f"Module{plural} Installed",
             )
 
-    def installAndImportDependencies(self):
-        needs_installation = []
-        for module_name, pip_install_name in self.python_dependencies:
-            try:
-                importlib.import_module(module_name)
-            except ModuleNotFoundError as e1:
-                needs_installation.append((module_name, pip_install_name))
+    def dependencyCacheFilename(self):
+        """
+        File in which the result of the dependency check is remembered between sessions.
+        """
+        return os.path.join(slicer.app.cachePath, "VPAWModel", "dependencies.json")
+
+    def installAndImportDependencies(self, wheelhouseDirectory=None):
+        """
+        Make sure that the Python packages needed by the pipeline are installed.  The
+        packages are located without being imported; each pipeline stage imports what
+        it needs when it runs.
+
+        Parameters
+        ----------
+        wheelhouseDirectory : str
+            If not blank, missing packages are installed from the wheels in this
+            directory, at the exact versions listed in its requirements.lock, without
+            accessing a package index.
+        """
+        needs_installation = find_missing_dependencies(
+            self.python_dependencies, self.dependencyCacheFilename(),
+        )
         installed_modules = []
         if needs_installation:
             plural = "" if len(needs_installation) == 1 else "s"
-            want_install = slicer.util.confirmYesNoDisplay(
+            want_install = self.confirm(
                 f"Package{plural} not found: "
                 + ", ".join([module_name for module_name, _ in needs_installation])
                 + f"\nInstall the package{plural}?",
@@ -506,26 +899,47 @@ class VPAWModelLogic(slicer.ScriptedLoadableModule.ScriptedLoadableModuleLogic):
             )
             if not want_install:
                 mesg = f"Package{plural} installation declined; giving up."
-                slicer.util.errorDisplay(mesg, "Install Error")
+                self.showError(mesg, "Install Error")
                 print(mesg)
                 return False
             try:
                 # Install missing packages
+                startTime = time.time()
                 with BusyCursor():
-                    slicer.util.pip_install(["--upgrade", "pip", "setuptools", "wheel"])
-                    slicer.util.pip_install(
-                        [pip_install_name for _, pip_install_name in needs_installation],
-                    )
-                    installed_modules = [
-                        (
-                            module_name,
-                            pip_install_name,
-                            importlib.import_module(module_name),
+                    if wheelhouseDirectory:
+                        slicer.util.pip_install(
+                            wheelhouse_pip_install_arguments(
+                                needs_installation, wheelhouseDirectory,
+                            ),
+                        )
+                    else:
+                        slicer.util.pip_install(
+                            ["--upgrade", "pip", "setuptools", "wheel"],
                         )
-                        for module_name, pip_install_name in needs_installation
-                    ]
-            except ModuleNotFoundError as e2:
-                slicer.util.errorDisplay(
+                        slicer.util.pip_install(
+                            [
+                                pip_install_name
+                                for _, pip_install_name in needs_installation
+                            ],
+                        )
+                stopTime = time.time()
+                logging.info(
+                    f"Installed {len(needs_installation)} package{plural}"
+                    + (f" from {wheelhouseDirectory}" if wheelhouseDirectory else "")
+                    + f" in {stopTime-startTime:.2f} seconds",
+                )
+                still_missing = find_missing_dependencies(needs_installation)
+                if still_missing:
+                    raise ModuleNotFoundError(
+                        "Not found after installation: "
+                        + ", ".join(module_name for module_name, _ in still_missing),
+                    )
+                installed_modules = [
+                    (module_name, pip_install_name, installed_version(pip_install_name))
+                    for module_name, pip_install_name in needs_installation
+                ]
+            except (ModuleNotFoundError, OSError, ValueError) as e2:
+                self.showError(
                     "\n".join(
                         [
                             f"Unable to install package{plural}.",
@@ -537,16 +951,20 @@ class VPAWModelLogic(slicer.ScriptedLoadableModule.ScriptedLoadableModuleLogic):
                 print(e2)
                 return False
 
-        # All dependencies were successfully imported
+        # All dependencies were successfully found
         self.showInstalledModules(installed_modules)
         return True
 
-    def runPediatricAirwayAtlas(
+    @profiled
+    @traced
+    def runPediatricAirwayAtlas(  # noqa: PLR0913
         self,
         pediatricAirwayAtlasDirectory,
         vPAWRootDirectory,
         vPAWModelsDirectory,
         patientPrefix,
+        inferenceProfile=DEFAULT_INFERENCE_PROFILE,
+        streaming=False,
     ):
         """
         Run the Pediatric Airway Atlas pipeline.
@@ -562,8 +980,16 @@ class VPAWModelLogic(slicer.ScriptedLoadableModule.ScriptedLoadableModuleLogic):
             landmarks/*.
         vPAWModelsDirectory : str
             It must contain a file with name like "116(158.10-38.AM.24.Mar).pth".
-        patientPrefix : str
-            Process only files with this prefix.  Blank means all files.
+        patientPrefix : str or list of str
+            Process only files with this prefix.  Blank means all files.  A list of
+            patient IDs and prefixes selects several patients, which are run one after
+            the other in this one invocation; see runPatients.
+        inferenceProfile : str
+            One of the names in vpawmodellib.profiles.INFERENCE_PROFILES.
+        streaming : bool
+            If True, run the pipeline one patient at a time, starting the segmentation
+            of each patient as soon as its landmarks are converted.  See runStreaming.
+            Ignored when self.memory_budget_bytes is set; see runGoverned.
         """
         # If self.pediatric_airway_atlas is not yet set then see if we can set it.
         if not hasattr(self, "pediatric_airway_atlas_directory") and not (
@@ -575,15 +1001,84 @@ class VPAWModelLogic(slicer.ScriptedLoadableModule.ScriptedLoadableModuleLogic):
 
         startTime = time.time()
         logging.info("Pediatric Airway Atlas pipeline started")
+        try:
+            self.workload_plan = self.planWorkload(vPAWRootDirectory, patientPrefix)
+        except (OSError, ValueError) as e:
+            logging.warning(f"Unable to plan the run: {e}")
+            self.workload_plan = None
+        else:
+            logging.info("Planned run:\n" + format_plan(self.workload_plan))
+        plan = self.workload_plan or dict()
+        patientPrefixes = [patient["prefix"] for patient in plan.get("patients", [])]
+        # Each patient, or else the whole run, takes a landmark conversion step and a
+        # segmentation step.
+        perPatient = (
+            self.memory_budget_bytes or streaming or not isinstance(patientPrefix, str)
+        )
+        self.progress_tracker = ProgressTracker(
+            2 * (max(1, len(patientPrefixes)) if perPatient else 1), patientPrefixes,
+        )
 
-        # self.convertCTScansToNRRD(vPAWRootDirectory)
-        response = self.convertFCSVLandmarksToP3(
-            vPAWRootDirectory, patientPrefix,
-        ) and self.runSegmentation(
-            vPAWRootDirectory, vPAWModelsDirectory, patientPrefix,
+        self.pipeline_report = PipelineReport(
+            dict(
+                vpaw_root_directory=vPAWRootDirectory,
+                vpaw_models_directory=vPAWModelsDirectory,
+                patient_prefix=patientPrefix,
+                inference_profile=inferenceProfile,
+                streaming=streaming,
+                use_warm_worker=self.use_warm_worker,
+                run_in_process=self.run_in_process,
+                native_landmark_conversion=self.native_landmark_conversion,
+                memory_budget_bytes=self.memory_budget_bytes,
+                cpu_budget=self.cpu_budget,
+                planned_patients=plan.get("patient_count"),
+                planned_voxels=plan.get("total_voxels"),
+                estimated_seconds=plan.get("estimated_seconds"),
+                estimated_peak_memory_bytes=plan.get("estimated_peak_memory_bytes"),
+                pipeline_version=pipeline_version(
+                    self.pediatric_airway_atlas_directory,
+                ),
+            ),
         )
+        response = False
+        try:
+            # self.convertCTScansToNRRD(vPAWRootDirectory)
+            if self.memory_budget_bytes:
+                response = self.runGoverned(
+                    vPAWRootDirectory,
+                    vPAWModelsDirectory,
+                    patientPrefix,
+                    inferenceProfile,
+                )
+            elif streaming:
+                response = self.runStreaming(
+                    vPAWRootDirectory,
+                    vPAWModelsDirectory,
+                    patientPrefix,
+                    inferenceProfile,
+                )
+            elif not isinstance(patientPrefix, str):
+                response = self.runPatients(
+                    vPAWRootDirectory,
+                    vPAWModelsDirectory,
+                    patientPrefix,
+                    inferenceProfile,
+                )
+            else:
+                response = self.convertFCSVLandmarksToP3(
+                    vPAWRootDirectory, patientPrefix,
+                ) and self.runSegmentation(
+                    vPAWRootDirectory,
+                    vPAWModelsDirectory,
+                    patientPrefix,
+                    inferenceProfile,
+                )
+        finally:
+            self.writePipelineReport(vPAWRootDirectory, response)
+            self.workload_plan = None
+            self.progress_tracker = None
         if response:
-            slicer.util.infoDisplay("The pipeline has completed", "Pipeline ran")
+            self.showInfo("The pipeline has completed", "Pipeline ran")
 
         stopTime = time.time()
         logging.info(
@@ -592,57 +1087,629 @@ class VPAWModelLogic(slicer.ScriptedLoadableModule.ScriptedLoadableModuleLogic):
         )
         return response
 
-    def convertFCSVLandmarksToP3(self, vPAWRootDirectory, patientPrefix):
-        cwd = os.getcwd()
-        try:
-            os.chdir(self.pediatric_airway_atlas_directory)
+    def runStreaming(  # noqa: PLR0913
+        self,
+        vPAWRootDirectory,
+        vPAWModelsDirectory,
+        patientPrefix,
+        inferenceProfile=DEFAULT_INFERENCE_PROFILE,
+        queueSize=2,
+    ):
+        """
+        Run the pipeline separately for each patient selected by patientPrefix, with
+        the landmark conversion of later patients overlapping the segmentation of
+        earlier ones.  At most queueSize patients wait between the two stages.  As in
+        runPatients, each stage runs in its own warm worker, so that the Python
+        packages and the model are loaded once per stage rather than once per patient;
+        unless self.use_warm_worker is set, the workers are stopped at the end.  Errors
+        are reported once, after all patients are done.  Returns True if every patient
+        succeeded.
+        """
+        prefixes = self.selectPatientPrefixes(vPAWRootDirectory, patientPrefix)
+        logging.info(f"Streaming the pipeline for {len(prefixes)} patients")
 
-            images_dir = os.path.join(vPAWRootDirectory, "images")
-            input_landmarks_dir = os.path.join(vPAWRootDirectory, "landmarks")
-            output_landmarks_dir = os.path.join(
-                vPAWRootDirectory, "transformed_landmarks",
+        # The stages run in worker threads, which must not open dialogs.
+        interactive, self.interactive = self.interactive, False
+        useWarmWorker, self.use_warm_worker = self.use_warm_worker, True
+        try:
+            results = run_streaming(
+                prefixes,
+                [
+                    (
+                        "landmark_conversion",
+                        lambda prefix: self.convertFCSVLandmarksToP3(
+                            vPAWRootDirectory, prefix,
+                        ),
+                    ),
+                    (
+                        "segmentation_and_atlas",
+                        lambda prefix: self.runSegmentation(
+                            vPAWRootDirectory,
+                            vPAWModelsDirectory,
+                            prefix,
+                            inferenceProfile,
+                        ),
+                    ),
+                ],
+                queueSize,
+                wait_callback=self.processEventsWhileWaiting,
             )
-            num_workers = 1
-            subject_prefix = patientPrefix
-            if subject_prefix is not None and subject_prefix != "":
+        finally:
+            self.interactive = interactive
+            self.use_warm_worker = useWarmWorker
+            if not useWarmWorker:
+                self.shutdownWarmWorker()
+
+        return self.reportFailedPatients(
+            [
+                f"{prefix} ({stage})"
+                for prefix, stage in results.items()
+                if stage is not None
+            ],
+            len(prefixes),
+        )
+
+    def runPatients(
+        self,
+        vPAWRootDirectory,
+        vPAWModelsDirectory,
+        patientPrefix,
+        inferenceProfile=DEFAULT_INFERENCE_PROFILE,
+    ):
+        """
+        Run the pipeline for each patient selected by patientPrefix, one after the
+        other.  The pipeline modules run in warm workers, or in this process if
+        self.run_in_process is set, so that the Python packages and the model are
+        loaded once for all of the patients.  Unless
+        self.use_warm_worker is set, the workers are stopped at the end.  Errors are
+        reported once, after all patients are done.  Returns True if every patient
+        succeeded.
+        """
+        prefixes = self.selectPatientPrefixes(vPAWRootDirectory, patientPrefix)
+        logging.info(f"Running the pipeline for {len(prefixes)} patients")
+
+        failed = []
+        interactive, self.interactive = self.interactive, False
+        useWarmWorker, self.use_warm_worker = self.use_warm_worker, True
+        try:
+            for prefix in prefixes:
                 try:
-                    slicer.util._executePythonModule(
-                        "conversion_utils.generate_pixel_space_landmarks",
-                        [
-                            f"--images_dir={images_dir}",
-                            f"--input_landmarks_dir={input_landmarks_dir}",
-                            f"--output_landmarks_dir={output_landmarks_dir}",
-                            f"--num_workers={num_workers}",
-                            f"--subject_prefix={subject_prefix}",
-                        ],
+                    succeeded = self.convertFCSVLandmarksToP3(
+                        vPAWRootDirectory, prefix,
+                    ) and self.runSegmentation(
+                        vPAWRootDirectory, vPAWModelsDirectory, prefix, inferenceProfile,
                     )
-                except:
-                    slicer.util.errorDisplay(
-                        "The run failed.  It may be that a non-blank patient prefix is"
-                        + " not supported by this version of pediatric_airway_atlas"
-                        + ".conversion_utils.generate_pixel_space_landmarks."
-                        + "  Please update pediatric_airway_atlas and try again."
-                        + "  Alternatively, it may be that you entered a patient prefix"
-                        + " that does not exist.",
-                        "Run Error",
+                except Exception:
+                    logging.exception(f"The run failed for {prefix!r}")
+                    succeeded = False
+                if not succeeded:
+                    failed.append(prefix)
+        finally:
+            self.interactive = interactive
+            self.use_warm_worker = useWarmWorker
+            if not useWarmWorker:
+                self.shutdownWarmWorker()
+        return self.reportFailedPatients(failed, len(prefixes))
+
+    def reportFailedPatients(self, failed, patientCount):
+        """
+        Show one error that lists the patients for which the run failed, if there are
+        any.  Returns True if there are none.
+        """
+        if failed:
+            self.showError(
+                f"The run failed for {len(failed)} of {patientCount} patients: "
+                + ", ".join(sorted(failed))
+                + "\nCheck the console for details.",
+                "Run Error",
+            )
+        return not failed
+
+    def selectPatientPrefixes(self, vPAWRootDirectory, patientPrefix):
+        """
+        Return the prefixes of the individual patients selected by patientPrefix, which
+        is a prefix or a list of patient IDs and prefixes.  See
+        vpawcommonlib.patients.select_patient_prefixes.
+        """
+        return select_patient_prefixes(vPAWRootDirectory, patientPrefix)
+
+    def planWorkload(self, vPAWRootDirectory, patientPrefix):
+        """
+        Estimate the duration and peak memory of running the pipeline for the patients
+        selected by patientPrefix, from the NRRD headers of their CT images and the
+        throughput measured in earlier runs.  See vpawmodellib.planner.plan_workload.
+        """
+        return plan_workload(
+            vPAWRootDirectory,
+            self.selectPatientPrefixes(vPAWRootDirectory, patientPrefix),
+        )
+
+    def runGoverned(
+        self,
+        vPAWRootDirectory,
+        vPAWModelsDirectory,
+        patientPrefix,
+        inferenceProfile=DEFAULT_INFERENCE_PROFILE,
+    ):
+        """
+        Run the pipeline separately for each patient selected by patientPrefix, with as
+        many patients at once as fit within self.memory_budget_bytes and
+        self.cpu_budget.  The memory of each patient is estimated from the NRRD headers
+        of its CT images.  The concurrency achieved is added to the pipeline report.
+        Errors are reported once, after all patients are done.  Returns True if every
+        patient succeeded.
+        """
+        prefixes = self.selectPatientPrefixes(vPAWRootDirectory, patientPrefix)
+        cpuBudget = self.cpu_budget or os.cpu_count() or 1
+        cpusPerPatient = max(1, min(self.cpus_per_patient, cpuBudget))
+        controller = AdmissionController(self.memory_budget_bytes, cpuBudget)
+        logging.info(
+            f"Running the pipeline for {len(prefixes)} patients within"
+            + f" {self.memory_budget_bytes / 1024**3:.1f} GB and {cpuBudget} CPUs",
+        )
+
+        def estimateMemory(prefix):
+            try:
+                return estimate_patient_memory_bytes(vPAWRootDirectory, prefix)
+            except (OSError, ValueError, KeyError) as e:
+                # Without an estimate, the patient is run alone
+                logging.warning(f"Unable to estimate the memory for {prefix!r}: {e}")
+                return self.memory_budget_bytes
+
+        def runPatient(prefix):
+            return self.convertFCSVLandmarksToP3(
+                vPAWRootDirectory, prefix,
+            ) and self.runSegmentation(
+                vPAWRootDirectory, vPAWModelsDirectory, prefix, inferenceProfile,
+            )
+
+        # The patients run in worker threads, which must not open dialogs.  A warm
+        # worker, like this process, runs one module at a time, and its memory is
+        # outside of the budget, so each patient gets fresh child processes.
+        interactive, self.interactive = self.interactive, False
+        useWarmWorker, self.use_warm_worker = self.use_warm_worker, False
+        runInProcess, self.run_in_process = self.run_in_process, False
+        self.threads_per_child = cpusPerPatient
+        try:
+            results = run_admitted(
+                prefixes,
+                runPatient,
+                controller,
+                estimateMemory,
+                cpusPerPatient,
+                wait_callback=self.processEventsWhileWaiting,
+            )
+        finally:
+            self.interactive = interactive
+            self.use_warm_worker = useWarmWorker
+            self.run_in_process = runInProcess
+            self.threads_per_child = None
+
+        statistics = controller.statistics()
+        logging.info(
+            f"Ran up to {statistics['max_concurrency']} patients at once, on average"
+            + f" {statistics['mean_concurrency']:.2f}",
+        )
+        if self.pipeline_report is not None:
+            self.pipeline_report.metadata["admission"] = statistics
+
+        return self.reportFailedPatients(
+            [prefix for prefix in prefixes if not results.get(prefix, False)],
+            len(prefixes),
+        )
+
+    def writePipelineReport(self, vPAWRootDirectory, response):
+        """
+        Finish the report of the current pipeline run, write it to pipeline_report.json
+        in vPAWRootDirectory, and log its summary.
+        """
+        report, self.pipeline_report = self.pipeline_report, None
+        report.status = "completed" if response else "failed"
+        self.last_pipeline_report = report
+        try:
+            reportName = report.write(vPAWRootDirectory)
+        except OSError as e:
+            logging.warning(f"Unable to write pipeline report: {e}")
+        else:
+            logging.info(f"Pipeline report written to {reportName}")
+        logging.info("Pipeline stages:\n" + report.summary())
+
+    def recordStage(self, stage, patientPrefix):
+        """
+        Return a context manager that records the time and resources used by a pipeline
+        stage in the report of the current run, if there is one.
+        """
+        if self.pipeline_report is None:
+            return contextlib.nullcontext()
+        # The voxel counts let later plans estimate this stage's throughput
+        voxels = [
+            patient["voxels"]
+            for patient in (self.workload_plan or dict()).get("patients", [])
+            if patient["prefix"].startswith(patientPrefix or "")
+        ]
+        return self.pipeline_report.stage(
+            stage,
+            patientPrefix or "",
+            voxels=sum(voxels) if voxels else None,
+            max_patient_voxels=max(voxels) if voxels else None,
+        )
+
+    def runPipelineModule(  # noqa: PLR0913
+        self, module_name, args, stage, patientPrefix, output_callback=None,
+    ):
+        """
+        Run a pediatric_airway_atlas module as if by `python -m module_name *args`,
+        either in a fresh interpreter, in this process if self.run_in_process is set,
+        or in the persistent worker process if self.use_warm_worker is set.  Raises an
+        exception if the module fails.  The run is recorded as `stage` for the patients
+        selected by `patientPrefix`.  If given, output_callback is also called with
+        each line of output of the module, except when it runs in this process.
+        """
+
+        def handleOutput(line):
+            self.handlePipelineOutput(stage, patientPrefix, line)
+            if output_callback is not None:
+                output_callback(line)
+
+        # The module is run with the pediatric_airway_atlas directory as its working
+        # directory.  Except when it is run in this process, this does not change the
+        # working directory of 3D Slicer, so stages can run concurrently.
+        with self.recordStage(stage, patientPrefix) as monitor, self.trackProgress(
+            stage, patientPrefix,
+        ):
+            if self.run_in_process:
+                # Its resources are not measured, because other stages may be
+                # running in this process too
+                run_module_in_process(
+                    module_name,
+                    args,
+                    self.pediatric_airway_atlas_directory,
+                    wait_callback=(
+                        self.processEventsWhileWaiting
+                        if threading.current_thread() is threading.main_thread()
+                        else None
+                    ),
+                )
+                return
+            if not self.use_warm_worker:
+                proc = slicer.util.launchConsoleProcess(
+                    [python_slicer_executable(), "-m", module_name, *args],
+                    useStartupEnvironment=False,
+                    updateEnvironment=self.childThreadEnvironment(),
+                    cwd=self.pediatric_airway_atlas_directory,
+                )
+                if monitor is not None:
+                    monitor.watch(proc.pid)
+                self.relayProcessOutput(proc, handleOutput)
+                return
+            # Each stage gets its own worker so that stages can run concurrently.
+            worker = self.warm_workers.get(stage)
+            if worker is None:
+                worker = WarmWorker(
+                    self.pediatric_airway_atlas_directory,
+                    preload_modules=(
+                        DEFAULT_PRELOAD_MODULES
+                        if stage == "segmentation_and_atlas"
+                        else ()
+                    ),
+                )
+                self.warm_workers[stage] = worker
+            worker.start()
+            if monitor is not None:
+                monitor.watch(worker.process.pid)
+            worker.run_module(
+                module_name,
+                args,
+                cwd=self.pediatric_airway_atlas_directory,
+                output_callback=handleOutput,
+            )
+
+    @contextlib.contextmanager
+    def trackProgress(self, stage, patientPrefix):
+        """
+        Context manager that counts its body as a step of the current run in
+        self.progress_tracker, if there is one, and records it as a span of the trace.
+        """
+        tracker = self.progress_tracker
+        with span(stage, "pipeline", patient=patientPrefix or ""):
+            if tracker is None:
+                yield
+                return
+            tracker.start(stage, patientPrefix or "")
+            try:
+                yield
+            finally:
+                tracker.finish(stage, patientPrefix or "")
+                if threading.current_thread() is threading.main_thread():
+                    self.processEventsWhileWaiting()
+
+    def relayProcessOutput(self, proc, output_callback):
+        """
+        Like slicer.util.logProcessOutput, but each line of output is passed to
+        output_callback, e.g., to log it and update the progress of the run.  Raises
+        subprocess.CalledProcessError if the process fails.
+        """
+        while True:
+            try:
+                line = proc.stdout.readline()
+            except UnicodeDecodeError:
+                # tqdm's bar characters may not decode in some locales
+                continue
+            if not line:
+                break
+            output_callback(line.rstrip())
+        proc.wait()
+        if proc.returncode != 0:
+            raise subprocess.CalledProcessError(proc.returncode, proc.args)
+
+    def handlePipelineOutput(self, stage, patientPrefix, line):
+        """
+        Log a line of output of a pipeline module, unless it is a tqdm update that adds
+        little, and update the progress of the run.
+        """
+        tracker = self.progress_tracker
+        if tracker is None or tracker.output(stage, patientPrefix or "", line):
+            logging.info(line)
+        if threading.current_thread() is threading.main_thread():
+            self.processEventsWhileWaiting()
+
+    def processEventsWhileWaiting(self):
+        """
+        While the pipeline runs, show its progress and keep the GUI painted, but not
+        accepting input.  Call only from the main thread.
+        """
+        now = time.monotonic()
+        if now - self._lastWaitTime < PROGRESS_INTERVAL:
+            return
+        self._lastWaitTime = now
+        if self.progress_callback is not None and self.progress_tracker is not None:
+            self.progress_callback(self.progress_tracker)
+        slicer.app.processEvents(qt.QEventLoop.ExcludeUserInputEvents)
+
+    def childThreadEnvironment(self):
+        """
+        Return the environment variables that limit the threads of a pipeline child
+        process to self.threads_per_child, or None if there is no limit.
+        """
+        if not self.threads_per_child:
+            return None
+        return {
+            name: str(self.threads_per_child)
+            for name in (
+                "OMP_NUM_THREADS",
+                "MKL_NUM_THREADS",
+                "OPENBLAS_NUM_THREADS",
+                "NUMEXPR_NUM_THREADS",
+                "ITK_GLOBAL_DEFAULT_NUMBER_OF_THREADS",
+            )
+        }
+
+    def clearCheckpointCache(self):
+        """
+        Have the persistent worker processes forget the model checkpoints that they
+        have cached, so that their memory is freed without stopping the workers.
+        Returns the number of checkpoints forgotten.
+        """
+        return sum(
+            worker.clear_checkpoint_cache() for worker in self.warm_workers.values()
+        )
+
+    def shutdownWarmWorker(self):
+        """
+        Stop the persistent worker processes, if there are any.
+        """
+        for worker in self.warm_workers.values():
+            worker.shutdown()
+        self.warm_workers = dict()
+
+    def convertFCSVLandmarksToP3(
+        self, vPAWRootDirectory, patientPrefix, outputDirectory=None, native=None,
+    ):
+        """
+        Convert the landmarks/*.fcsv files selected by patientPrefix to voxel indices in
+        outputDirectory, which defaults to transformed_landmarks/ in the data root.  If
+        native, or by default self.native_landmark_conversion, is set then this is done
+        by convertFCSVLandmarksNatively; otherwise by pediatric_airway_atlas.  Returns
+        True on success.
+
+        Segmentation reads transformed_landmarks/, so native conversion writes there
+        only once it has been verified.  Until then, the landmarks are converted by
+        pediatric_airway_atlas and compared with those of the native conversion, which
+        are left in native_transformed_landmarks/.
+        """
+        images_dir = os.path.join(vPAWRootDirectory, "images")
+        input_landmarks_dir = os.path.join(vPAWRootDirectory, "landmarks")
+        output_landmarks_dir = outputDirectory or os.path.join(
+            vPAWRootDirectory, "transformed_landmarks",
+        )
+        if native if native is not None else self.native_landmark_conversion:
+            if outputDirectory is None and not self.native_landmark_conversion_verified:
+                return (
+                    self.verifyNativeLandmarkConversion(
+                        vPAWRootDirectory, patientPrefix, output_landmarks_dir,
                     )
-                    return False
-            else:
-                slicer.util._executePythonModule(
+                    is not None
+                )
+            return self.convertFCSVLandmarksNatively(
+                vPAWRootDirectory, patientPrefix, output_landmarks_dir,
+            )
+        num_workers = 1
+        subject_prefix = patientPrefix
+        if subject_prefix is not None and subject_prefix != "":
+            try:
+                self.runPipelineModule(
                     "conversion_utils.generate_pixel_space_landmarks",
                     [
                         f"--images_dir={images_dir}",
                         f"--input_landmarks_dir={input_landmarks_dir}",
                         f"--output_landmarks_dir={output_landmarks_dir}",
                         f"--num_workers={num_workers}",
+                        f"--subject_prefix={subject_prefix}",
                     ],
+                    "landmark_conversion",
+                    subject_prefix,
                 )
-        finally:
-            os.chdir(cwd)
+            except:
+                self.showError(
+                    "The run failed.  It may be that a non-blank patient prefix is"
+                    + " not supported by this version of pediatric_airway_atlas"
+                    + ".conversion_utils.generate_pixel_space_landmarks."
+                    + "  Please update pediatric_airway_atlas and try again."
+                    + "  Alternatively, it may be that you entered a patient prefix"
+                    + " that does not exist.",
+                    "Run Error",
+                )
+                return False
+        else:
+            self.runPipelineModule(
+                "conversion_utils.generate_pixel_space_landmarks",
+                [
+                    f"--images_dir={images_dir}",
+                    f"--input_landmarks_dir={input_landmarks_dir}",
+                    f"--output_landmarks_dir={output_landmarks_dir}",
+                    f"--num_workers={num_workers}",
+                ],
+                "landmark_conversion",
+                subject_prefix,
+            )
         return True
 
-    def runSegmentation(self, vPAWRootDirectory, vPAWModelsDirectory, patientPrefix):
-        cwd = os.getcwd()
+    def convertFCSVLandmarksNatively(
+        self, vPAWRootDirectory, patientPrefix, outputDirectory,
+    ):
+        """
+        Convert landmarks with vpawmodellib.landmarks, which reads only the NRRD headers
+        of the images and needs none of the pipeline's dependencies.
+        """
+        # vpawmodellib.landmarks imports numpy, which 3D Slicer need not import at
+        # startup
+        from vpawmodellib.landmarks import convert_landmarks
+
+        try:
+            with self.recordStage(
+                "landmark_conversion", patientPrefix,
+            ), self.trackProgress("landmark_conversion", patientPrefix):
+                written = convert_landmarks(
+                    vPAWRootDirectory, patientPrefix or "", outputDirectory,
+                )
+        except (OSError, ValueError, KeyError) as e:
+            self.showError(f"Unable to convert the landmarks: {e}", "Run Error")
+            return False
+        logging.info(f"Converted {len(written)} landmark files")
+        return True
+
+    def verifyNativeLandmarkConversion(
+        self, vPAWRootDirectory, patientPrefix, referenceDirectory=None,
+    ):
+        """
+        Convert the landmarks selected by patientPrefix both with pediatric_airway_atlas
+        and with vpawmodellib.landmarks, and compare the results.  If every file
+        matches to within vpawmodellib.landmarks.MATCH_TOLERANCE, later native
+        conversions may write to transformed_landmarks/.
+
+        Parameters
+        ----------
+        referenceDirectory :
+            Where pediatric_airway_atlas writes its files.  If given, the native files
+            are written to native_transformed_landmarks/ in the data root; otherwise
+            both are written to a temporary directory and removed.
+
+        Returns
+        -------
+        A dict from each file written by pediatric_airway_atlas to the largest distance,
+        in voxels, from the same landmark written by vpawmodellib.landmarks, or to None
+        if the files do not match up.  Returns None if either conversion fails.
+        """
+        from vpawmodellib.landmarks import (
+            MATCH_TOLERANCE,
+            NATIVE_OUTPUT_DIRECTORY,
+            max_landmark_difference,
+        )
+
+        with tempfile.TemporaryDirectory() as temporaryDirectory:
+            if referenceDirectory is None:
+                referenceDirectory = os.path.join(temporaryDirectory, "reference")
+                nativeDirectory = os.path.join(temporaryDirectory, "native")
+            else:
+                nativeDirectory = os.path.join(
+                    vPAWRootDirectory, NATIVE_OUTPUT_DIRECTORY,
+                )
+            os.makedirs(referenceDirectory, exist_ok=True)
+            if not (
+                self.convertFCSVLandmarksToP3(
+                    vPAWRootDirectory, patientPrefix, referenceDirectory, native=False,
+                )
+                and self.convertFCSVLandmarksToP3(
+                    vPAWRootDirectory, patientPrefix, nativeDirectory, native=True,
+                )
+            ):
+                return None
+            differences = dict()
+            for basename in sorted(os.listdir(referenceDirectory)):
+                # referenceDirectory may hold the files of other patients
+                if not (
+                    basename.endswith(".p3")
+                    and basename.startswith(patientPrefix or "")
+                ):
+                    continue
+                nativeFilename = os.path.join(nativeDirectory, basename)
+                differences[basename] = (
+                    max_landmark_difference(
+                        nativeFilename, os.path.join(referenceDirectory, basename),
+                    )
+                    if os.path.exists(nativeFilename)
+                    else None
+                )
+        if differences and all(
+            difference is not None and difference <= MATCH_TOLERANCE
+            for difference in differences.values()
+        ):
+            self.native_landmark_conversion_verified = True
+        for basename, difference in differences.items():
+            logging.info(
+                f"{basename}: "
+                + (
+                    f"largest difference {difference:.3g} voxels"
+                    if difference is not None
+                    else "does not match"
+                ),
+            )
+        return differences
+
+    def runSegmentation(
+        self,
+        vPAWRootDirectory,
+        vPAWModelsDirectory,
+        patientPrefix,
+        inferenceProfile=DEFAULT_INFERENCE_PROFILE,
+    ):
+        """
+        Run the segmentation and atlas stage of the pipeline.  Returns whether it
+        succeeded.
+        """
+        return (
+            self.runTimedSegmentation(
+                vPAWRootDirectory, vPAWModelsDirectory, patientPrefix, inferenceProfile,
+            )
+            is not None
+        )
+
+    @profiled
+    @traced
+    def runTimedSegmentation(
+        self,
+        vPAWRootDirectory,
+        vPAWModelsDirectory,
+        patientPrefix,
+        inferenceProfile=DEFAULT_INFERENCE_PROFILE,
+    ):
+        """
+        Run the segmentation and atlas stage of the pipeline.  Returns None if it
+        failed, else a dict with its "run_seconds" and the "inference_seconds" of the
+        segmentation's inference within it, which are timed by the inference's progress
+        bars in the output, so are None if the output is not seen (see
+        runPipelineModule).
+        """
         ConfigDescriptor, ConfigName = None, None
         SegmentDescriptor, SegmentName = None, None
         try:
@@ -650,97 +1717,109 @@ class VPAWModelLogic(slicer.ScriptedLoadableModule.ScriptedLoadableModuleLogic):
             # that time.
             import yaml
 
-            # Change directory and create files
-            os.chdir(self.pediatric_airway_atlas_directory)
-            ConfigDescriptor, ConfigName = tempfile.mkstemp(suffix=".yaml", text=True)
-            SegmentDescriptor, SegmentName = tempfile.mkstemp(suffix=".yaml", text=True)
-
-            # Add text to the main configuration file
-            b_s_f_s = "False"
-            n_p = 1
-            ConfigYaml = dict(
-                root=vPAWRootDirectory,
-                n_samples=-1,
-                metadata_excel_fname="FilteredControlBlindingLogUniqueScanFiltered.xls",
-                band_depth_ages=[20, 40, 60, 80, 100, 120, 140],
-                n_centerline_points=200,
-                n_curve_points=500,
-                TARGET_LANDMARKS_ORDERED=[
-                    "nasalspine",
-                    "choana",
-                    "epiglottistip",
-                    "tvc",
-                    "subglottis",
-                    "carina",
-                ],
-                dilation_times=20,
-                ALL_POSSIBLE_LANDMARKS=[
-                    "carina",
-                    "tracheacarina",
-                    "trachea",
-                    "tvc",
-                    "subglottis",
-                    "epiglottistip",
-                    "columella",
-                    "nasalspine",
-                    "rightalarim",
-                    "leftalarim",
-                    "nosetip",
-                    ["choana", "posteriorinferiorvomercorner"],
-                    "pyrinaaperture",
-                    ["baseoftongue", "tonguebase"],
-                ],
-                plane_estimation_based_mesh_area=True,
-                use_planes_for_laplace_marking=True,
-                balance_spacing_for_segmentation=b_s_f_s,
-                num_processes=n_p,
-            )
-            with os.fdopen(ConfigDescriptor, "w") as ConfigFile:
-                ConfigDescriptor = None  # descriptor will close when `with` exits
-                yaml.dump(ConfigYaml, ConfigFile)
-
-            # Add text to the configuration file for segmentation
-            SegmentYaml = dict(
-                data_root_dir=vPAWRootDirectory,
-                model_save_directory=vPAWModelsDirectory,
-                crop_size=[192, 192, 192],
-                network_model=dict(name="TwoStepSeparatedModel", params=dict()),
-                dataset=dict(
-                    image_min_max_normalization=[-1024.0, 3071.0],
-                    extra_keys_to_fetch=["image_spacing"],
-                    train_test_split_fpath="segmentation/train_test_split_new_with_spherical.yaml",
-                ),
-                loss_type="ce",
-                loss_params=dict(pos_weight=[2.0], loss_multiplier=10.0),
-                training=dict(
-                    batch_size=8,
-                    num_data_loaders=24,
-                    log_interval=50,
-                    max_training_iteration=1000000,
-                    optimizer_params=dict(lr=0.0001, weight_decay=1e-05),
-                ),
-                inference=dict(
-                    force_spacing=None, tiles_overlap=0.75, tile_fusion_mode="gaussian",
-                ),
-                train_devices=[0, 1],
-            )
-            with os.fdopen(SegmentDescriptor, "w") as SegmentFile:
-                SegmentDescriptor = None  # descriptor will close when `with` exits
-                yaml.dump(SegmentYaml, SegmentFile)
+            # Create files
+            with self.recordStage("config_generation", patientPrefix):
+                ConfigDescriptor, ConfigName = tempfile.mkstemp(
+                    suffix=".yaml", text=True,
+                )
+                SegmentDescriptor, SegmentName = tempfile.mkstemp(
+                    suffix=".yaml", text=True,
+                )
+
+                # Add text to the main configuration file
+                b_s_f_s = "False"
+                n_p = 1
+                ConfigYaml = dict(
+                    root=vPAWRootDirectory,
+                    n_samples=-1,
+                    metadata_excel_fname="FilteredControlBlindingLogUniqueScanFiltered.xls",
+                    band_depth_ages=[20, 40, 60, 80, 100, 120, 140],
+                    n_centerline_points=200,
+                    n_curve_points=500,
+                    TARGET_LANDMARKS_ORDERED=[
+                        "nasalspine",
+                        "choana",
+                        "epiglottistip",
+                        "tvc",
+                        "subglottis",
+                        "carina",
+                    ],
+                    dilation_times=20,
+                    ALL_POSSIBLE_LANDMARKS=[
+                        "carina",
+                        "tracheacarina",
+                        "trachea",
+                        "tvc",
+                        "subglottis",
+                        "epiglottistip",
+                        "columella",
+                        "nasalspine",
+                        "rightalarim",
+                        "leftalarim",
+                        "nosetip",
+                        ["choana", "posteriorinferiorvomercorner"],
+                        "pyrinaaperture",
+                        ["baseoftongue", "tonguebase"],
+                    ],
+                    plane_estimation_based_mesh_area=True,
+                    use_planes_for_laplace_marking=True,
+                    balance_spacing_for_segmentation=b_s_f_s,
+                    num_processes=n_p,
+                )
+                with os.fdopen(ConfigDescriptor, "w") as ConfigFile:
+                    ConfigDescriptor = None  # descriptor will close when `with` exits
+                    yaml.dump(ConfigYaml, ConfigFile)
+
+                # Add text to the configuration file for segmentation
+                SegmentYaml = dict(
+                    data_root_dir=vPAWRootDirectory,
+                    model_save_directory=vPAWModelsDirectory,
+                    crop_size=[192, 192, 192],
+                    network_model=dict(name="TwoStepSeparatedModel", params=dict()),
+                    dataset=dict(
+                        image_min_max_normalization=[-1024.0, 3071.0],
+                        extra_keys_to_fetch=["image_spacing"],
+                        train_test_split_fpath="segmentation/train_test_split_new_with_spherical.yaml",
+                    ),
+                    loss_type="ce",
+                    loss_params=dict(pos_weight=[2.0], loss_multiplier=10.0),
+                    training=dict(
+                        batch_size=8,
+                        num_data_loaders=self.threads_per_child or 24,
+                        log_interval=50,
+                        max_training_iteration=1000000,
+                        optimizer_params=dict(lr=0.0001, weight_decay=1e-05),
+                    ),
+                    inference=dict(
+                        force_spacing=None,
+                        tiles_overlap=0.75,
+                        tile_fusion_mode="gaussian",
+                    ),
+                    train_devices=segmentation_devices(visible_gpu_count()),
+                )
+                apply_inference_profile(SegmentYaml, inferenceProfile)
+                with os.fdopen(SegmentDescriptor, "w") as SegmentFile:
+                    SegmentDescriptor = None  # descriptor will close when `with` exits
+                    yaml.dump(SegmentYaml, SegmentFile)
 
             # Run the pipeline
+            inferenceTimer = BarTimer()
+            startTime = time.time()
             if patientPrefix is not None and patientPrefix != "":
                 try:
-                    slicer.util._executePythonModule(
+                    self.runPipelineModule(
                         "atlas_builder_configurable",
                         [
                             f"--config={ConfigName}",
                             f"--segmentation_config={SegmentName}",
                             f"--subject_prefix={patientPrefix}",
                         ],
+                        "segmentation_and_atlas",
+                        patientPrefix,
+                        inferenceTimer.output,
                     )
                 except:
-                    slicer.util.errorDisplay(
+                    self.showError(
                         "The run failed.  It may be that a non-blank patient prefix is"
                         + " not supported by this version of pediatric_airway_atlas"
                         + ".atlas_builder_configurable."
@@ -749,12 +1828,29 @@ class VPAWModelLogic(slicer.ScriptedLoadableModule.ScriptedLoadableModuleLogic):
                         + " that does not exist.",
                         "Run Error",
                     )
-                    return False
+                    return None
             else:
-                slicer.util._executePythonModule(
+                self.runPipelineModule(
                     "atlas_builder_configurable",
                     [f"--config={ConfigName}", f"--segmentation_config={SegmentName}"],
+                    "segmentation_and_atlas",
+                    patientPrefix,
+                    inferenceTimer.output,
                 )
+            stopTime = time.time()
+            timing = dict(
+                run_seconds=stopTime - startTime,
+                inference_seconds=inferenceTimer.seconds(),
+            )
+            logging.info(
+                f"Segmentation with inference profile {inferenceProfile!r} completed in"
+                + f" {timing['run_seconds']:.2f} seconds"
+                + (
+                    f", {timing['inference_seconds']:.2f} seconds of them inference"
+                    if timing["inference_seconds"] is not None
+                    else ""
+                ),
+            )
 
         finally:
             if ConfigDescriptor is not None:
@@ -769,8 +1865,97 @@ class VPAWModelLogic(slicer.ScriptedLoadableModule.ScriptedLoadableModuleLogic):
             if SegmentName is not None and os.path.exists(SegmentName):
                 os.remove(SegmentName)
                 SegmentName = None
-            os.chdir(cwd)
-        return True
+        return timing
+
+    @profiled
+    @traced
+    def compareInferenceProfiles(  # noqa: PLR0913
+        self,
+        pediatricAirwayAtlasDirectory,
+        vPAWRootDirectory,
+        vPAWModelsDirectory,
+        referencePrefix,
+        profileNames=None,
+    ):
+        """
+        Run the segmentation for a single reference patient with each inference profile,
+        measuring the time of its inference (see runTimedSegmentation), the time of the
+        whole run, and the Dice difference of the computed segmentation
+        against that of "full quality".  The report is written to
+        inference_profiles_report.json in vPAWRootDirectory and returned; False is
+        returned if a run fails.  "full quality" runs last so that its results are the
+        ones left in vPAWRootDirectory.
+
+        Parameters
+        ----------
+        referencePrefix : str
+            The prefix of exactly one patient.
+        profileNames : list of str
+            Profiles to compare; defaults to all of them.
+        """
+        if not referencePrefix:
+            raise ValueError("A reference patient prefix is required")
+        if not hasattr(self, "pediatric_airway_atlas_directory") and not (
+            os.path.isdir(pediatricAirwayAtlasDirectory)
+            and self.linkPediatricAirwayAtlas(pediatricAirwayAtlasDirectory)
+        ):
+            return False
+        if profileNames is None:
+            profileNames = list(INFERENCE_PROFILES)
+        profileNames = [
+            name for name in profileNames if name != DEFAULT_INFERENCE_PROFILE
+        ] + [DEFAULT_INFERENCE_PROFILE]
+
+        if not self.convertFCSVLandmarksToP3(vPAWRootDirectory, referencePrefix):
+            return False
+        timings = dict()
+        with tempfile.TemporaryDirectory() as savedDirectory:
+            savedSegmentations = dict()
+            for profileName in profileNames:
+                timing = self.runTimedSegmentation(
+                    vPAWRootDirectory, vPAWModelsDirectory, referencePrefix, profileName,
+                )
+                if timing is None:
+                    return False
+                timings[profileName] = timing
+                segmentation = find_computed_segmentation(
+                    vPAWRootDirectory, referencePrefix,
+                )
+                if segmentation is None:
+                    raise FileNotFoundError(
+                        f"Expected one computed segmentation for {referencePrefix!r}",
+                    )
+                savedSegmentations[profileName] = os.path.join(
+                    savedDirectory, f"{len(savedSegmentations)}.seg.nrrd",
+                )
+                shutil.copyfile(segmentation, savedSegmentations[profileName])
+
+            reference = read_segmentation_mask(
+                savedSegmentations[DEFAULT_INFERENCE_PROFILE],
+            )
+            report = dict(
+                reference_prefix=referencePrefix,
+                reference_profile=DEFAULT_INFERENCE_PROFILE,
+                profiles={
+                    profileName: dict(
+                        settings=INFERENCE_PROFILES[profileName],
+                        inference_seconds=timings[profileName]["inference_seconds"],
+                        run_seconds=timings[profileName]["run_seconds"],
+                        dice_difference=1.0
+                        - dice_coefficient(
+                            read_segmentation_mask(savedSegmentations[profileName]),
+                            reference,
+                        ),
+                    )
+                    for profileName in profileNames
+                },
+            )
+
+        reportName = os.path.join(vPAWRootDirectory, "inference_profiles_report.json")
+        with open(reportName, "w") as reportFile:
+            json.dump(report, reportFile, indent=2)
+        logging.info(f"Inference profile comparison written to {reportName}")
+        return report
 
 
 #
@@ -0,0 +1,249 @@
+r"""
+Headless batch processing with VPAW Model and VPAW Visualize.
+
+Run with the VPAW (or 3D Slicer) executable, e.g., from a cluster job:
+
+    QT_QPA_PLATFORM=offscreen vpaw --no-main-window \\
+        --python-script path/to/vpawmodellib/batch.py job.json \\
+        --shard-index 3 --shard-count 16
+
+The job file is JSON:
+
+    {
+      "pediatric_airway_atlas_directory": "path/to/pediatric_airway_atlas",
+      "models_directory": "path/to/models",
+      "wheelhouse_directory": "path/to/wheelhouse",     (optional)
+      "install_missing_dependencies": false,            (optional)
+      "inference_profile": "full quality",              (optional)
+      "use_warm_worker": true,                          (optional)
+      "run_in_process": false,              (experimental, optional)
+      "native_landmark_conversion": false,              (optional)
+      "run_pipeline": true,                             (optional)
+      "convert_p3_files": false,                        (optional)
+      "transcode_volumes": false,                       (optional)
+      "volume_cache_directory": "path/to/cache",        (optional)
+      "precompute_isosurfaces": true,                   (optional)
+      "number_of_isosurface_values": 10,                (optional)
+      "jobs": [
+        {"data_root": "path/to/vpaw-data-root", "prefixes": ["1000_", "1001_"]},
+        {"data_root": "path/to/another-data-root"}
+      ]
+    }
+
+Relative paths are relative to the job file.  A job without "prefixes" covers every
+patient in the images/ directory of its data root.  The (data root, prefix) pairs are
+sorted and split into --shard-count shards, and only shard --shard-index is processed.
+With "convert_p3_files", each patient's .p3 files are also converted to the
+memory-mappable .p3.npz format that VPAW Visualize prefers (see
+vpawvisualizelib.p3arrays).  With "transcode_volumes", an uncompressed copy of each
+of the patient's gzip-compressed volumes is written to "volume_cache_directory", or by
+default to the directory named by VPAW_VOLUME_CACHE_DIRECTORY, and VPAW Visualize reads
+the copies when the same cache directory is configured for it (see
+vpawvisualizelib.transcode).
+
+With --plan plan.json, nothing is run.  Instead the shard's patients are counted and
+their stage durations and peak memory are estimated from their NRRD headers and earlier
+runs (see vpawmodellib.planner), and the plans, one per data root, are written as JSON
+to plan.json, e.g., for a job scheduler to size its requests.
+
+Progress and errors are reported only through logging.  The exit status is 0 if every
+patient succeeded, 1 if any failed, and 2 if the job file could not be used.
+"""
+
+import argparse
+import json
+import logging
+import os
+import sys
+
+if __name__ == "__main__":
+    # Make vpawmodellib and vpawcommonlib importable when this file is run as a
+    # script.  Once installed, both are in the scripted modules directory; in the
+    # source tree, vpawcommonlib is in the VPAWCommon module's directory.
+    modules_directory = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    common_directory = os.path.join(os.path.dirname(modules_directory), "VPAWCommon")
+    for directory in (common_directory, modules_directory):
+        if os.path.isdir(directory) and directory not in sys.path:
+            sys.path.insert(0, directory)
+
+from vpawcommonlib.patients import list_patient_prefixes
+from vpawmodellib.planner import format_plan, plan_workload
+from vpawmodellib.profiles import DEFAULT_INFERENCE_PROFILE
+
+EXIT_SUCCESS = 0
+EXIT_FAILURE = 1
+EXIT_BAD_JOB = 2
+
+
+def load_job_file(filename):
+    """
+    Read a job file, resolving its relative paths against the job file's directory.
+    """
+    with open(filename) as job_file:
+        job = json.load(job_file)
+    base = os.path.dirname(os.path.abspath(filename))
+
+    def resolve(path):
+        return os.path.normpath(os.path.join(base, path)) if path else path
+
+    for key in (
+        "pediatric_airway_atlas_directory",
+        "models_directory",
+        "wheelhouse_directory",
+        "volume_cache_directory",
+    ):
+        job[key] = resolve(job.get(key))
+    if not job.get("jobs"):
+        raise ValueError(f"{filename} does not list any jobs")
+    for entry in job["jobs"]:
+        if not entry.get("data_root"):
+            raise ValueError(f"{filename}: every job needs a data_root")
+        entry["data_root"] = resolve(entry["data_root"])
+    return job
+
+
+def select_tasks(job, shard_index=0, shard_count=1):
+    """
+    Return this shard's sorted list of (data_root, patient_prefix) pairs.
+    """
+    if not 0 <= shard_index < shard_count:
+        raise ValueError(f"Shard index {shard_index} is not in [0, {shard_count})")
+    tasks = sorted(
+        {
+            (entry["data_root"], prefix)
+            for entry in job["jobs"]
+            for prefix in (
+                entry.get("prefixes") or list_patient_prefixes(entry["data_root"])
+            )
+        },
+    )
+    return tasks[shard_index::shard_count]
+
+
+def run_task(job, model_logic, visualize_logic, data_root, prefix):
+    """
+    Run the pipeline for one patient and precompute its visualization data.  Returns
+    True on success.
+    """
+    if job.get("run_pipeline", True) and not model_logic.runPediatricAirwayAtlas(
+        job["pediatric_airway_atlas_directory"],
+        data_root,
+        job["models_directory"],
+        prefix,
+        job.get("inference_profile") or DEFAULT_INFERENCE_PROFILE,
+    ):
+        return False
+    if job.get("convert_p3_files", False):
+        response = visualize_logic.convertP3Files(data_root, prefix)
+        if response["failed"]:
+            return False
+    if job.get("transcode_volumes", False):
+        response = visualize_logic.transcodeVolumes(
+            data_root, prefix, job.get("volume_cache_directory"),
+        )
+        if response["failed"]:
+            return False
+    if job.get("precompute_isosurfaces", True):
+        written = visualize_logic.precomputeSubject(
+            data_root, prefix, job.get("number_of_isosurface_values", 10),
+        )
+        for filename in written:
+            logging.info(f"Wrote {filename}")
+    return True
+
+
+def write_plans(tasks, filename):
+    """
+    Plan the tasks of each data root and write the plans as a JSON list.  Returns the
+    exit status.
+    """
+    prefixes_by_root = dict()
+    for data_root, prefix in tasks:
+        prefixes_by_root.setdefault(data_root, []).append(prefix)
+    try:
+        plans = []
+        for data_root, prefixes in prefixes_by_root.items():
+            plan = plan_workload(data_root, prefixes)
+            logging.info(f"Plan for {data_root}:\n" + format_plan(plan))
+            plans.append(plan)
+        with open(filename, "w") as plan_file:
+            json.dump(plans, plan_file, indent=2)
+    except (OSError, ValueError) as e:
+        logging.error(f"Unable to plan the shard: {e}")
+        return EXIT_FAILURE
+    return EXIT_SUCCESS
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(
+        description="Run VPAW Model and VPAW Visualize without a GUI",
+    )
+    parser.add_argument("job_file", help="JSON file describing the work")
+    parser.add_argument("--shard-index", type=int, default=0)
+    parser.add_argument("--shard-count", type=int, default=1)
+    parser.add_argument(
+        "--plan", metavar="FILENAME", help="only write the estimates to this file",
+    )
+    args = parser.parse_args(argv)
+
+    try:
+        job = load_job_file(args.job_file)
+        tasks = select_tasks(job, args.shard_index, args.shard_count)
+    except (OSError, ValueError, KeyError) as e:
+        logging.error(f"Unable to use job file {args.job_file}: {e}")
+        return EXIT_BAD_JOB
+    logging.info(
+        f"Shard {args.shard_index} of {args.shard_count} has {len(tasks)} patients",
+    )
+    if args.plan:
+        return write_plans(tasks, args.plan)
+
+    # These are importable once 3D Slicer has loaded the VPAW modules.
+    from VPAWModel import VPAWModelLogic
+    from VPAWVisualize import VPAWVisualizeLogic
+
+    model_logic = VPAWModelLogic()
+    model_logic.interactive = False
+    model_logic.assume_yes = bool(job.get("install_missing_dependencies", False))
+    model_logic.use_warm_worker = bool(job.get("use_warm_worker", True))
+    model_logic.run_in_process = bool(job.get("run_in_process", False))
+    model_logic.native_landmark_conversion = bool(
+        job.get("native_landmark_conversion", False),
+    )
+    visualize_logic = VPAWVisualizeLogic()
+
+    failed = []
+    try:
+        if job.get("run_pipeline", True) and not model_logic.linkPediatricAirwayAtlas(
+            job["pediatric_airway_atlas_directory"], job.get("wheelhouse_directory"),
+        ):
+            logging.error("Unable to link to the Pediatric Airway Atlas")
+            return EXIT_FAILURE
+        for data_root, prefix in tasks:
+            logging.info(f"Processing {prefix!r} in {data_root}")
+            try:
+                succeeded = run_task(
+                    job, model_logic, visualize_logic, data_root, prefix,
+                )
+            except Exception:
+                logging.exception(f"Processing {prefix!r} in {data_root} failed")
+                succeeded = False
+            if not succeeded:
+                failed.append((data_root, prefix))
+    finally:
+        model_logic.shutdownWarmWorker()
+        visualize_logic.clearSubject()
+
+    for data_root, prefix in failed:
+        logging.error(f"Failed: {prefix!r} in {data_root}")
+    logging.info(f"{len(tasks) - len(failed)} of {len(tasks)} patients succeeded")
+    return EXIT_FAILURE if failed else EXIT_SUCCESS
+
+
+if __name__ == "__main__":
+    status = main(sys.argv[1:])
+    try:
+        import slicer.util
+    except ImportError:
+        sys.exit(status)
+    slicer.util.exit(status)
@@ -0,0 +1,179 @@
+"""
+Checks for the Python packages needed by pediatric_airway_atlas that do not import
+them.  Importing torch, monai, itk, etc. just to see whether they exist can take a
+minute; importlib.util.find_spec and importlib.metadata only look at the file system.
+"""
+
+import importlib
+import importlib.metadata
+import importlib.util
+import json
+import logging
+import os
+import re
+import site
+import sys
+
+
+def distribution_name(pip_install_name):
+    """
+    Strip any version specifier or extras from a `pip install` requirement, e.g.,
+    "monai[all]>=1.2" becomes "monai".
+    """
+    return re.split(r"[<>=!~\[;@\s]", pip_install_name, maxsplit=1)[0]
+
+
+def installed_version(pip_install_name):
+    """
+    Return the installed version of a distribution, or None if it is unknown.
+    """
+    try:
+        return importlib.metadata.version(distribution_name(pip_install_name))
+    except importlib.metadata.PackageNotFoundError:
+        return None
+
+
+def site_packages_fingerprint():
+    """
+    Return a JSON-compatible value that changes whenever packages are installed into or
+    removed from any directory on sys.path.  Installing or removing a package adds or
+    removes entries in its site-packages directory, which changes the directory's
+    modification time.
+    """
+    directories = list(sys.path) + list(site.getsitepackages())
+    if site.ENABLE_USER_SITE:
+        directories.append(site.getusersitepackages())
+    fingerprint = []
+    for directory in dict.fromkeys(directories):
+        try:
+            fingerprint.append([directory, os.stat(directory or ".").st_mtime_ns])
+        except OSError:
+            fingerprint.append([directory, None])
+    return fingerprint
+
+
+def find_missing_dependencies(python_dependencies, cache_filename=None):
+    """
+    Determine which dependencies are not installed, without importing any of them.
+
+    Args:
+        python_dependencies: a sequence of (module_name, pip_install_name) pairs
+        cache_filename: Optionally, a JSON file in which the result is remembered.  The
+            result is reused for as long as the dependencies and the state of the
+            site-packages directories are unchanged.
+    Return: the list of (module_name, pip_install_name) pairs that are missing
+    """
+    python_dependencies = [list(pair) for pair in python_dependencies]
+    key = dict(
+        dependencies=python_dependencies, site_packages=site_packages_fingerprint(),
+    )
+    if cache_filename is not None and os.path.exists(cache_filename):
+        try:
+            with open(cache_filename) as cache_file:
+                cached = json.load(cache_file)
+            if cached.get("key") == key:
+                return [tuple(pair) for pair in cached["missing"]]
+        except (OSError, ValueError, KeyError):
+            logging.warning(f"Ignoring unreadable dependency cache {cache_filename}")
+
+    importlib.invalidate_caches()
+    missing = []
+    for module_name, pip_install_name in python_dependencies:
+        try:
+            found = importlib.util.find_spec(module_name) is not None
+        except (ImportError, ValueError):
+            found = False
+        if not found:
+            missing.append((module_name, pip_install_name))
+
+    if cache_filename is not None:
+        try:
+            os.makedirs(os.path.dirname(cache_filename), exist_ok=True)
+            with open(cache_filename, "w") as cache_file:
+                json.dump(dict(key=key, missing=missing), cache_file)
+        except OSError:
+            logging.warning(f"Unable to write dependency cache {cache_filename}")
+    return missing
+
+
+#
+# Offline installation from a wheelhouse
+#
+
+# Name of the lockfile, in pip requirements format with exact versions, that must be
+# present in a wheelhouse directory
+LOCKFILE_NAME = "requirements.lock"
+
+
+def normalized_name(name):
+    """
+    Normalize a distribution name as pip does, so that "scikit_image" and
+    "Scikit-Image" compare equal.
+    """
+    return re.sub(r"[-_.]+", "-", name).lower()
+
+
+def read_lockfile(filename):
+    """
+    Read a lockfile in pip requirements format, e.g., as written by pip-compile.
+    Lines ending in a backslash are joined with the next, option lines such as
+    "--index-url ..." are skipped, and so are the options of a requirement, such as
+    "--hash=...".
+
+    Args:
+        filename: the lockfile; every requirement must be pinned with "=="
+    Return: a dict from normalized distribution name to the requirement, without its
+        options
+    """
+    with open(filename) as lockfile:
+        text = lockfile.read()
+    pinned = dict()
+    for line in re.sub(r"\\\r?\n", " ", text).splitlines():
+        # As for pip, "#" starts a comment at the start of a line or after whitespace
+        requirement = re.split(r"(?:^|\s)#", line, maxsplit=1)[0].strip()
+        if not requirement or requirement.startswith("-"):
+            continue
+        requirement = re.split(r"\s--", requirement, maxsplit=1)[0].strip()
+        if "==" not in requirement:
+            raise ValueError(
+                f"{filename}: {requirement!r} is not pinned to an exact version",
+            )
+        pinned[normalized_name(distribution_name(requirement))] = requirement
+    return pinned
+
+
+def wheelhouse_pip_install_arguments(needs_installation, wheelhouse_directory):
+    """
+    Build the arguments for a single `pip install` that installs the missing packages
+    from a local wheelhouse, at the versions given by its lockfile, without contacting
+    any package index.
+
+    Args:
+        needs_installation: a sequence of (module_name, pip_install_name) pairs
+        wheelhouse_directory: a directory of wheels that contains LOCKFILE_NAME
+    Return: a list of arguments for slicer.util.pip_install
+    """
+    lockfile_name = os.path.join(wheelhouse_directory, LOCKFILE_NAME)
+    if not os.path.isfile(lockfile_name):
+        raise FileNotFoundError(f"Wheelhouse lockfile {lockfile_name} not found")
+    pinned = read_lockfile(lockfile_name)
+    requirements = []
+    unpinned = []
+    for _, pip_install_name in needs_installation:
+        name = normalized_name(distribution_name(pip_install_name))
+        if name in pinned:
+            requirements.append(pinned[name])
+        else:
+            unpinned.append(pip_install_name)
+    if unpinned:
+        raise ValueError(f"{lockfile_name} has no version for " + ", ".join(unpinned))
+    # The lockfile is also used as a constraints file so that the packages that the
+    # requirements depend upon are pinned too.
+    return [
+        "--no-index",
+        "--find-links",
+        wheelhouse_directory,
+        "--constraint",
+        lockfile_name,
+        *requirements,
+    ]
@@ -0,0 +1,213 @@
+"""
+Admission control for pipeline child processes.
+
+Each patient's pipeline run is admitted only when its estimated memory and its CPUs fit
+within the budget, given the runs that are already admitted.  The memory of a run is
+estimated from the sizes in the NRRD headers of the patient's CT images, so that no
+image has to be read.
+"""
+
+import contextlib
+import logging
+import threading
+import time
+
+from vpawcommonlib.nrrdheader import header_voxel_count, read_nrrd_header
+from vpawcommonlib.patients import patient_image_files
+from vpawmodellib.streaming import join_thread
+
+# Memory used by a segmentation run regardless of the image size: the Python packages,
+# the network, and the activations for one batch of crops.
+BASE_MEMORY_BYTES = 3 * 1024**3
+# Memory per CT voxel: several float32 copies of the image at different stages, the
+# network's output probabilities, and the Laplace solution.
+MEMORY_BYTES_PER_VOXEL = 64
+
+
+def patient_voxel_count(vPAWRootDirectory, patientPrefix):
+    """
+    Return the total number of voxels in the patient's CT images, read from their
+    headers.
+    """
+    return sum(
+        header_voxel_count(read_nrrd_header(filename))
+        for filename in patient_image_files(vPAWRootDirectory, patientPrefix)
+    )
+
+
+def estimate_patient_memory_bytes(
+    vPAWRootDirectory,
+    patientPrefix,
+    base_memory_bytes=BASE_MEMORY_BYTES,
+    memory_bytes_per_voxel=MEMORY_BYTES_PER_VOXEL,
+):
+    """
+    Estimate the peak memory of the pipeline run for one patient.
+    """
+    voxels = patient_voxel_count(vPAWRootDirectory, patientPrefix)
+    return base_memory_bytes + memory_bytes_per_voxel * voxels
+
+
+class AdmissionController:
+    """
+    Admits jobs, in the order they are requested, while their total memory and CPUs
+    stay within the budget.  A job that does not fit even on its own is admitted when
+    nothing else is running, so that it can still make progress.
+    """
+
+    def __init__(self, memory_budget_bytes, cpu_budget):
+        self.memory_budget_bytes = memory_budget_bytes
+        self.cpu_budget = cpu_budget
+        self._condition = threading.Condition()
+        self._memory_in_use = 0
+        self._cpus_in_use = 0
+        self._running = 0
+        self._max_running = 0
+        self._peak_memory_admitted = 0
+        self._first_admission = None
+        self._last_change = None
+        self._running_time_integral = 0.0
+
+    def _fits(self, memory_bytes, cpus):
+        return self._running == 0 or (
+            self._memory_in_use + memory_bytes <= self.memory_budget_bytes
+            and self._cpus_in_use + cpus <= self.cpu_budget
+        )
+
+    def _account_time(self):
+        now = time.monotonic()
+        if self._last_change is not None:
+            self._running_time_integral += self._running * (now - self._last_change)
+        self._last_change = now
+
+    def acquire(self, memory_bytes, cpus):
+        """
+        Block until the job fits within the budget, then count it as running.
+        """
+        with self._condition:
+            while not self._fits(memory_bytes, cpus):
+                self._condition.wait()
+            if memory_bytes > self.memory_budget_bytes:
+                logging.warning(
+                    f"A job's estimated memory of {memory_bytes / 1024**3:.1f} GB"
+                    + " exceeds the memory budget; running it alone",
+                )
+            self._account_time()
+            if self._first_admission is None:
+                self._first_admission = self._last_change
+            self._memory_in_use += memory_bytes
+            self._cpus_in_use += cpus
+            self._running += 1
+            self._max_running = max(self._max_running, self._running)
+            self._peak_memory_admitted = max(
+                self._peak_memory_admitted, self._memory_in_use,
+            )
+
+    def release(self, memory_bytes, cpus):
+        with self._condition:
+            self._account_time()
+            self._memory_in_use -= memory_bytes
+            self._cpus_in_use -= cpus
+            self._running -= 1
+            self._condition.notify_all()
+
+    @contextlib.contextmanager
+    def admitted(self, memory_bytes, cpus):
+        self.acquire(memory_bytes, cpus)
+        try:
+            yield
+        finally:
+            self.release(memory_bytes, cpus)
+
+    def statistics(self):
+        """
+        Return a dict describing the concurrency that was achieved.
+        """
+        with self._condition:
+            self._account_time()
+            elapsed = (
+                self._last_change - self._first_admission
+                if self._first_admission is not None
+                else 0.0
+            )
+            return dict(
+                memory_budget_bytes=self.memory_budget_bytes,
+                cpu_budget=self.cpu_budget,
+                max_concurrency=self._max_running,
+                mean_concurrency=(
+                    self._running_time_integral / elapsed if elapsed > 0 else 0.0
+                ),
+                peak_memory_admitted_bytes=self._peak_memory_admitted,
+            )
+
+
+def run_admitted(  # noqa: PLR0913
+    items,
+    function,
+    controller,
+    estimate_memory_bytes,
+    cpus_per_item,
+    wait_callback=None,
+):
+    """
+    Run function(item) for each item, each in its own thread, starting each one as soon
+    as the controller admits it.  Items are admitted in order.
+
+    Args:
+        items: a sequence of items, e.g., patient prefixes
+        function: returns True if the item succeeded.  An exception counts as False.
+        controller: an AdmissionController
+        estimate_memory_bytes: function(item) that estimates the item's peak memory.
+            An exception counts as a failure of the item, which is then not run.
+        cpus_per_item: the number of CPUs that each item uses
+        wait_callback: Optionally, a function that is called repeatedly while the
+            items run.
+    Return: a dict from each item to whether it succeeded; an item that could not be
+        run for any reason is counted as failed
+    """
+    results = dict()
+    results_lock = threading.Lock()
+
+    def run_one(item, memory_bytes):
+        try:
+            succeeded = function(item)
+        except Exception:
+            logging.exception(f"Processing {item!r} failed")
+            succeeded = False
+        finally:
+            controller.release(memory_bytes, cpus_per_item)
+        with results_lock:
+            results[item] = succeeded
+
+    threads = []
+
+    def dispatch():
+        for item in items:
+            try:
+                memory_bytes = estimate_memory_bytes(item)
+                controller.acquire(memory_bytes, cpus_per_item)
+            except Exception:
+                logging.exception(f"Unable to admit {item!r}")
+                with results_lock:
+                    results[item] = False
+                continue
+            thread = threading.Thread(
+                target=run_one,
+                args=(item, memory_bytes),
+                name=f"vpaw-{item}",
+                daemon=True,
+            )
+            thread.start()
+            threads.append(thread)
+
+    # Admission waits in its own thread, so that this one can call wait_callback
+    dispatcher = threading.Thread(target=dispatch, name="vpaw-admission", daemon=True)
+    dispatcher.start()
+    join_thread(dispatcher, wait_callback)
+    for thread in threads:
+        join_thread(thread, wait_callback)
+    for item in items:
+        if item not in results:
+            logging.error(f"{item!r} was never run")
+            results[item] = False
+    return results
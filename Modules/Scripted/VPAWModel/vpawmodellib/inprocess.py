@@ -0,0 +1,62 @@
+"""
+Run pediatric_airway_atlas entry points inside the 3D Slicer process.  Experimental,
+and off by default; the warm worker (vpawmodellib.worker) keeps the pipeline loaded
+between runs without these problems.
+
+Once linkPediatricAirwayAtlas has installed the dependencies, 3D Slicer's own
+interpreter can import the pipeline, so a stage can be run with runpy instead of in a
+new interpreter, with no start-up or import cost after the first run.  However:
+
+- The module runs in a background thread of a process with a Qt event loop, so its
+  signal handlers, DataLoader worker processes, and console output are set up off the
+  main thread.
+- sys.argv and the working directory belong to the whole process.  Runs are serialized,
+  but while one runs, other code in 3D Slicer that uses relative paths sees the
+  pipeline's working directory.
+- A module that crashes the interpreter takes 3D Slicer down with it.
+
+Model checkpoints are not cached in this process, so that they do not stay in 3D
+Slicer's memory after the run.
+"""
+
+import logging
+import subprocess
+import threading
+
+from vpawmodellib.streaming import join_thread
+from vpawmodellib.worker import run_module_isolated
+
+
+def run_module_in_process(module_name, args, cwd, wait_callback=None):
+    """
+    Run `python -m module_name *args` in a background thread of this process and wait
+    for it to finish.
+
+    Args:
+        module_name: the module to run as __main__
+        args: sequence of command-line arguments
+        cwd: working directory for the run
+        wait_callback: Optionally, a function that is called repeatedly while the
+            module runs, e.g., to keep a GUI responsive.
+
+    Raises subprocess.CalledProcessError if the module exits with a non-zero status.
+    """
+    logging.warning(
+        f"Running {module_name} inside 3D Slicer, which is experimental; see"
+        + " vpawmodellib.inprocess",
+    )
+    response = dict()
+    thread = threading.Thread(
+        target=lambda: response.update(
+            run_module_isolated(module_name, list(args), cwd, alter_sys=False),
+        ),
+        name=f"vpaw-{module_name}",
+        daemon=True,
+    )
+    thread.start()
+    join_thread(thread, wait_callback)
+    returncode = response.get("returncode", 1)
+    if returncode != 0:
+        raise subprocess.CalledProcessError(
+            returncode, [module_name, *args], response.get("error"),
+        )
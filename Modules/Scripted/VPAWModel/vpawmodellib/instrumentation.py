@@ -0,0 +1,342 @@
+"""
+Per-stage timing and resource accounting for pipeline runs.
+
+Pipeline stages mostly run in child processes, so resource usage is measured for the
+processes that a stage runs in, and their descendants, but not for this process, in
+which other stages may be running at the same time.  With psutil those processes are
+sampled in a background thread, which also covers a persistent worker process that
+never exits.  Without psutil only children that have exited are accounted for, using
+os.times and, where available, resource.getrusage, and stages that run at the same
+time cannot be told apart.
+"""
+
+import contextlib
+import datetime
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from vpawcommonlib.formatting import BYTES_PER_KILOBYTE, format_bytes
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows
+    resource = None
+
+# Permissions of a pipeline report, which others sharing the data root may read
+REPORT_MODE = 0o644
+
+
+class ChildProcessMonitor:
+    """
+    Measures the CPU time, peak resident set size, and bytes read and written of the
+    watched processes and their descendants between calls to start() and stop(), so
+    that stages that run at the same time are not charged for each other's processes.
+    Without psutil that distinction cannot be made, and all children of this process
+    that exit in between are measured.
+    """
+
+    def __init__(self, interval=0.25):
+        """
+        Args:
+            interval: seconds between samples when psutil is available
+        """
+        self.interval = interval
+        self._thread = None
+        self._stopping = threading.Event()
+        self._lock = threading.Lock()
+        self._roots = set()
+
+    def start(self):
+        self._baseline = dict()
+        self._latest = dict()
+        self._peak_rss_bytes = None
+        self._max_process_rss_bytes = None
+        self._roots = set()
+        if psutil is not None:
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+        else:
+            self._start_times = os.times()
+            self._start_rusage = (
+                resource.getrusage(resource.RUSAGE_CHILDREN) if resource else None
+            )
+
+    def watch(self, pid):
+        """
+        Measure this process, e.g., the child running the stage, and its descendants.
+        Usage by the process before this call is not counted.
+        """
+        with self._lock:
+            self._roots.add(pid)
+        if psutil is not None:
+            self._sample(at_start=True)
+
+    def stop(self):
+        """
+        Return a dict with keys cpu_seconds, peak_rss_bytes (the peak of the combined
+        resident set sizes of the measured processes), max_process_rss_bytes (the
+        largest resident set size of any one of them), read_bytes, and write_bytes.
+        Values that cannot be measured on this platform, or at all if no process was
+        watched, are None.
+        """
+        if psutil is not None:
+            self._stopping.set()
+            self._thread.join()
+            self._thread = None
+            self._sample(at_start=False)
+            with self._lock:
+                if not self._roots:
+                    # The stage ran in this process
+                    return dict.fromkeys(
+                        (
+                            "cpu_seconds",
+                            "peak_rss_bytes",
+                            "max_process_rss_bytes",
+                            "read_bytes",
+                            "write_bytes",
+                        ),
+                    )
+                totals = [
+                    sum(
+                        self._latest[pid][i] - self._baseline.get(pid, (0, 0, 0))[i]
+                        for pid in self._latest
+                    )
+                    for i in range(3)
+                ]
+                return dict(
+                    cpu_seconds=totals[0],
+                    peak_rss_bytes=self._peak_rss_bytes,
+                    max_process_rss_bytes=self._max_process_rss_bytes,
+                    read_bytes=totals[1],
+                    write_bytes=totals[2],
+                )
+
+        stop_times = os.times()
+        usage = dict(
+            cpu_seconds=(stop_times.children_user - self._start_times.children_user)
+            + (stop_times.children_system - self._start_times.children_system),
+            peak_rss_bytes=None,
+            max_process_rss_bytes=None,
+            read_bytes=None,
+            write_bytes=None,
+        )
+        if self._start_rusage is not None:
+            stop_rusage = resource.getrusage(resource.RUSAGE_CHILDREN)
+            # ru_maxrss is the maximum over all children ever waited for, one process
+            # at a time, so it only says something about this stage if it grew during
+            # the stage.  macOS reports it in bytes, Linux in kilobytes.
+            if stop_rusage.ru_maxrss > self._start_rusage.ru_maxrss:
+                usage["max_process_rss_bytes"] = stop_rusage.ru_maxrss * (
+                    1 if sys.platform == "darwin" else BYTES_PER_KILOBYTE
+                )
+            # Block counts are in units of 512 bytes
+            usage["read_bytes"] = 512 * (
+                stop_rusage.ru_inblock - self._start_rusage.ru_inblock
+            )
+            usage["write_bytes"] = 512 * (
+                stop_rusage.ru_oublock - self._start_rusage.ru_oublock
+            )
+        return usage
+
+    def _run(self):
+        while not self._stopping.wait(self.interval):
+            self._sample(at_start=False)
+
+    def _processes(self):
+        with self._lock:
+            roots = list(self._roots)
+        processes = []
+        for pid in roots:
+            try:
+                root = psutil.Process(pid)
+                processes.append(root)
+                processes.extend(root.children(recursive=True))
+            except psutil.Error:
+                continue
+        return processes
+
+    def _sample(self, at_start):
+        total_rss = 0
+        for child in self._processes():
+            try:
+                with child.oneshot():
+                    cpu_times = child.cpu_times()
+                    rss = child.memory_info().rss
+                    io = child.io_counters() if hasattr(child, "io_counters") else None
+            except psutil.Error:
+                continue
+            sample = (
+                cpu_times.user + cpu_times.system,
+                io.read_bytes if io is not None else 0,
+                io.write_bytes if io is not None else 0,
+            )
+            total_rss += rss
+            with self._lock:
+                if at_start and child.pid not in self._latest:
+                    self._baseline[child.pid] = sample
+                self._latest[child.pid] = sample
+                self._max_process_rss_bytes = max(self._max_process_rss_bytes or 0, rss)
+        with self._lock:
+            if self._latest:
+                self._peak_rss_bytes = max(self._peak_rss_bytes or 0, total_rss)
+
+
+def pipeline_version(directory):
+    """
+    Return a description of the git revision of the pediatric_airway_atlas source
+    directory, or None if it cannot be determined.
+    """
+    try:
+        completed = subprocess.run(
+            ["git", "-C", str(directory), "describe", "--always", "--dirty"],
+            capture_output=True,
+            text=True,
+            timeout=10,
+            check=True,
+        )
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return completed.stdout.strip() or None
+
+
+class PipelineReport:
+    """
+    Collects a record for each stage of a pipeline run.  Each record has the stage
+    name, the patients it was run for and their number of CT voxels, its status, and
+    its wall time and the CPU time, peak RSS, and bytes read and written of the
+    processes that it ran in; see ChildProcessMonitor.  Work that a stage does within
+    this process is not measured, because other stages may be running in it too.
+    """
+
+    def __init__(self, metadata=None):
+        """
+        Args:
+            metadata: a JSON-compatible dict describing the run, e.g., its inputs and
+                the pipeline version
+        """
+        self.metadata = dict(metadata or {})
+        self.started = datetime.datetime.now().isoformat(timespec="seconds")
+        self.stages = []
+        self.status = None
+
+    @contextlib.contextmanager
+    def stage(self, name, patients, voxels=None, max_patient_voxels=None):
+        """
+        Context manager that records the resources used while its body runs.  It
+        provides the ChildProcessMonitor, so that the body can watch() the process that
+        does the work.
+
+        Args:
+            name: the stage, e.g., "landmark_conversion"
+            patients: the patient prefix the stage is run for; "" means all patients
+            voxels: the total number of CT voxels of those patients, if known
+            max_patient_voxels: the number of CT voxels of the largest of those
+                patients, if known
+        """
+        monitor = ChildProcessMonitor()
+        monitor.start()
+        start_wall = time.perf_counter()
+        status = "failed"
+        try:
+            yield monitor
+            status = "ok"
+        finally:
+            usage = monitor.stop()
+            record = dict(
+                stage=name,
+                patients=patients,
+                voxels=voxels,
+                max_patient_voxels=max_patient_voxels,
+                status=status,
+                wall_seconds=time.perf_counter() - start_wall,
+                cpu_seconds=usage["cpu_seconds"],
+                peak_rss_bytes=usage["peak_rss_bytes"],
+                max_process_rss_bytes=usage["max_process_rss_bytes"],
+                read_bytes=usage["read_bytes"],
+                write_bytes=usage["write_bytes"],
+            )
+            self.stages.append(record)
+
+    def as_dict(self):
+        return dict(
+            started=self.started,
+            status=self.status,
+            metadata=self.metadata,
+            stages=self.stages,
+        )
+
+    def write(self, directory, basename="pipeline_report"):
+        """
+        Write the report to `basename`.json in the directory, replacing any earlier
+        report, and append it as one line to `basename`_history.jsonl so that runs can
+        be compared over time.  Returns the name of the JSON file.
+
+        Runs in other processes, e.g., other shards of a batch job, may write to the
+        same directory at the same time, so the JSON file is replaced atomically, with
+        the last report written, and the history line is appended in a single write.
+        """
+        report = self.as_dict()
+        filename = os.path.join(directory, f"{basename}.json")
+        report_fd, temporary_filename = tempfile.mkstemp(
+            prefix=basename + ".", suffix=".tmp", dir=directory,
+        )
+        try:
+            with open(report_fd, "w") as report_file:
+                json.dump(report, report_file, indent=2)
+            # mkstemp makes the file readable by its owner only
+            os.chmod(temporary_filename, REPORT_MODE)
+            os.replace(temporary_filename, filename)
+        except BaseException:
+            if os.path.exists(temporary_filename):
+                os.remove(temporary_filename)
+            raise
+        history_fd = os.open(
+            os.path.join(directory, f"{basename}_history.jsonl"),
+            os.O_WRONLY | os.O_APPEND | os.O_CREAT,
+            0o666,
+        )
+        try:
+            os.write(history_fd, (json.dumps(report) + "\n").encode("utf-8"))
+        finally:
+            os.close(history_fd)
+        return filename
+
+    def summary(self):
+        """
+        Return a few lines of text that total each stage over all patients.
+        """
+        totals = dict()
+        for record in self.stages:
+            total = totals.setdefault(
+                record["stage"],
+                dict(count=0, wall=0.0, cpu=0.0, peak=None, read=None, write=None),
+            )
+            total["count"] += 1
+            total["wall"] += record["wall_seconds"]
+            total["cpu"] += record["cpu_seconds"] or 0.0
+            for key, field in (("read", "read_bytes"), ("write", "write_bytes")):
+                if record[field] is not None:
+                    total[key] = (total[key] or 0) + record[field]
+            if record["peak_rss_bytes"] is not None:
+                total["peak"] = max(total["peak"] or 0, record["peak_rss_bytes"])
+        # The peak is that of one run of the stage, i.e., of its processes combined
+        return "\n".join(
+            f"{name} (x{total['count']}): {total['wall']:.1f} s wall,"
+            + f" {total['cpu']:.1f} s CPU,"
+            + f" peak RSS of one run {format_bytes(total['peak'])},"
+            + f" read {format_bytes(total['read'])},"
+            + f" wrote {format_bytes(total['write'])}"
+            for name, total in totals.items()
+        )
@@ -0,0 +1,188 @@
+"""
+Convert landmarks from 3D Slicer .fcsv files to the voxel indices of their CT images.
+
+This does the work of pediatric_airway_atlas's
+conversion_utils.generate_pixel_space_landmarks within VPAW.  Only the NRRD headers of
+the images are read, and the landmarks of all patients are transformed together with a
+single batched matrix product, so a whole cohort takes seconds and none of the
+pipeline's dependencies are needed.
+
+Each landmarks/<name>.fcsv is written to <output directory>/<name>.p3 as a pickled
+dict from each landmark label to a float array of its continuous voxel index.  As in
+the pipeline's other P3 files, the axes are in (k, j, i) order, which is the order of a
+NumPy array of the image.  That layout is inferred rather than specified by the
+pipeline, so the output directory defaults to native_transformed_landmarks/ rather
+than to the transformed_landmarks/ that segmentation reads.  Use
+max_landmark_difference to check the output against that of the pipeline.
+"""
+
+import csv
+import logging
+import os
+import pickle
+
+import numpy as np
+
+from vpawcommonlib.nrrdheader import header_ijk_to_space, header_space, read_nrrd_header
+from vpawcommonlib.patients import patient_image_files
+
+# The order of the axes of the voxel indices that are written
+AXIS_ORDER = "kji"
+# The default output directory, within a data root
+NATIVE_OUTPUT_DIRECTORY = "native_transformed_landmarks"
+# The largest difference, in voxels, from the pipeline's landmarks that counts as a
+# match
+MATCH_TOLERANCE = 0.01
+# Maps between LPS and RAS coordinates, in either direction
+_FLIP_LPS_RAS = np.diag([-1.0, -1.0, 1.0, 1.0])
+
+
+def read_fcsv(filename):
+    """
+    Read the control points of a 3D Slicer markups .fcsv file.
+
+    Args:
+        filename: the file
+    Return: (labels, points, space) where labels is a list of str, points is an Nx3
+        float array, and space is "LPS" or "RAS".
+    """
+    space = "RAS"
+    labels, points = [], []
+    with open(filename, newline="") as fcsv_file:
+        columns = None
+        for row in csv.reader(fcsv_file):
+            if not row:
+                continue
+            if row[0].startswith("#"):
+                comment = ",".join(row).lstrip("#").strip()
+                if comment.startswith("CoordinateSystem"):
+                    value = comment.split("=", 1)[1].strip().upper()
+                    # Older files write 0 for RAS and 1 for LPS
+                    space = "LPS" if value in ("LPS", "1") else "RAS"
+                elif comment.startswith("columns"):
+                    columns = [
+                        name.strip() for name in comment.split("=", 1)[1].split(",")
+                    ]
+                continue
+            if columns is None:
+                # The column layout of every fcsv version
+                columns = ["id", "x", "y", "z"] + [""] * 7 + ["label"]
+            record = dict(zip(columns, row))
+            labels.append(record.get("label", ""))
+            points.append([float(record[axis]) for axis in ("x", "y", "z")])
+    return labels, np.array(points, dtype=float).reshape(-1, 3), space
+
+
+def space_to_ijk(image_filename, landmark_space):
+    """
+    Return the 4x4 matrix that maps homogeneous landmark coordinates, in
+    landmark_space ("LPS" or "RAS"), to the continuous voxel indices of an image.
+    """
+    fields = read_nrrd_header(image_filename)
+    image_space = header_space(fields)
+    if image_space is None:
+        raise ValueError(
+            f"{image_filename} has unsupported space {fields.get('space')!r}",
+        )
+    to_image_space = _FLIP_LPS_RAS if image_space != landmark_space else np.eye(4)
+    return np.linalg.inv(header_ijk_to_space(fields)) @ to_image_space
+
+
+def find_landmark_tasks(vPAWRootDirectory, patientPrefix=""):
+    """
+    Return a list of (fcsv_filename, image_filename) for the landmark files in the
+    landmarks/ directory of a data root that start with patientPrefix.  A landmark file
+    belongs to the patient whose prefix it starts with; files whose patient has no
+    image are skipped with a warning.
+    """
+    landmarks_dir = os.path.join(vPAWRootDirectory, "landmarks")
+    tasks = []
+    for basename in sorted(os.listdir(landmarks_dir)):
+        if not (basename.endswith(".fcsv") and basename.startswith(patientPrefix)):
+            continue
+        if "_" not in basename:
+            logging.warning(f"Skipping {basename}, which has no patient prefix")
+            continue
+        prefix = basename[: basename.index("_") + 1]
+        images = patient_image_files(vPAWRootDirectory, prefix)
+        if not images:
+            logging.warning(f"Skipping {basename}; there is no image for {prefix!r}")
+            continue
+        tasks.append((os.path.join(landmarks_dir, basename), images[0]))
+    return tasks
+
+
+def convert_landmarks(vPAWRootDirectory, patientPrefix="", output_directory=None):
+    """
+    Convert the landmark files of the patients selected by patientPrefix to voxel
+    indices, writing *.p3 files.
+
+    Args:
+        vPAWRootDirectory: a directory containing images/* and landmarks/*
+        patientPrefix: convert only files with this prefix.  Blank means all files.
+        output_directory: where to write the .p3 files; defaults to
+            NATIVE_OUTPUT_DIRECTORY in the data root
+    Return: the list of files written
+    """
+    if output_directory is None:
+        output_directory = os.path.join(vPAWRootDirectory, NATIVE_OUTPUT_DIRECTORY)
+    tasks = find_landmark_tasks(vPAWRootDirectory, patientPrefix)
+
+    # Gather every landmark, with the index of the transform that applies to it, so
+    # that all of them are transformed at once.
+    transforms = dict()
+    file_labels, file_points, transform_indices = [], [], []
+    for fcsv_filename, image_filename in tasks:
+        labels, points, space = read_fcsv(fcsv_filename)
+        key = (image_filename, space)
+        if key not in transforms:
+            transforms[key] = (len(transforms), space_to_ijk(image_filename, space))
+        file_labels.append(labels)
+        file_points.append(points)
+        transform_indices.append(np.full(len(points), transforms[key][0]))
+    if not tasks:
+        return []
+
+    matrices = np.stack([matrix for _, matrix in transforms.values()])
+    points = np.concatenate(file_points)
+    homogeneous = np.concatenate([points, np.ones((len(points), 1))], axis=1)
+    ijk = np.einsum(
+        "nab,nb->na", matrices[np.concatenate(transform_indices)], homogeneous,
+    )[:, :3]
+    indices = ijk[:, ["ijk".index(axis) for axis in AXIS_ORDER]]
+
+    os.makedirs(output_directory, exist_ok=True)
+    written = []
+    start = 0
+    for (fcsv_filename, _), labels in zip(tasks, file_labels):
+        stop = start + len(labels)
+        contents = dict(zip(labels, indices[start:stop]))
+        start = stop
+        output_filename = os.path.join(
+            output_directory,
+            os.path.splitext(os.path.basename(fcsv_filename))[0] + ".p3",
+        )
+        with open(output_filename, "wb") as output_file:
+            pickle.dump(contents, output_file)
+        written.append(output_filename)
+    return written
+
+
+def max_landmark_difference(filename, reference_filename):
+    """
+    Return the largest distance, in voxels, between the landmarks of two .p3 files,
+    or None if they do not have the same labels.
+    """
+    with open(filename, "rb") as f:
+        contents = pickle.load(f)
+    with open(reference_filename, "rb") as f:
+        reference = pickle.load(f)
+    if not isinstance(reference, dict) or set(contents) != set(reference):
+        return None
+    return max(
+        (
+            float(np.linalg.norm(np.asarray(contents[label]) - np.asarray(value)))
+            for label, value in reference.items()
+        ),
+        default=0.0,
+    )
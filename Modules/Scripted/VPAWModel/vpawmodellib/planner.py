@@ -0,0 +1,198 @@
+"""
+Estimate the duration and peak memory of a pipeline run before starting it.
+
+Only the NRRD headers of the CT images are read.  Each stage's duration is estimated
+from the seconds per CT voxel measured for that stage in earlier runs, as recorded in
+pipeline_report_history.jsonl in the data root; see
+vpawmodellib.instrumentation.PipelineReport.
+"""
+
+import json
+import logging
+import os
+
+from vpawcommonlib.formatting import format_bytes
+from vpawcommonlib.nrrdheader import header_voxel_count, read_nrrd_header
+from vpawcommonlib.patients import patient_image_files
+from vpawmodellib.governor import estimate_patient_memory_bytes
+
+PIPELINE_STAGES = ("landmark_conversion", "config_generation", "segmentation_and_atlas")
+HISTORY_FILENAME = "pipeline_report_history.jsonl"
+SECONDS_PER_MINUTE = 60
+SECONDS_PER_HOUR = 3600
+
+
+def read_stage_history(filenames):
+    """
+    Return the successful stage records, with voxel counts, of the pipeline reports in
+    the history files.  Missing files, unreadable lines, e.g., one cut short by a crash,
+    and lines or stage records that are not of the form that PipelineReport writes are
+    skipped.
+    """
+    records = []
+    for filename in filenames:
+        try:
+            with open(filename) as history_file:
+                lines = history_file.readlines()
+        except OSError:
+            continue
+        for line in lines:
+            try:
+                report = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            stages = report.get("stages") if isinstance(report, dict) else None
+            if not isinstance(stages, list):
+                continue
+            records.extend(
+                record
+                for record in stages
+                if isinstance(record, dict)
+                and isinstance(record.get("stage"), str)
+                and record.get("status") == "ok"
+                and isinstance(record.get("voxels"), int)
+                and record["voxels"] > 0
+                and isinstance(record.get("wall_seconds"), (int, float))
+            )
+    return records
+
+
+def stage_throughput(records):
+    """
+    Return a dict from each stage name in the records to a dict with its measured
+    seconds_per_voxel, its peak_rss_bytes_per_voxel (or None if no peak RSS was
+    measured), and the number of samples.
+    """
+    totals = dict()
+    for record in records:
+        total = totals.setdefault(
+            record["stage"],
+            dict(seconds=0.0, voxels=0, peak_rss_bytes_per_voxel=None, samples=0),
+        )
+        total["seconds"] += record["wall_seconds"]
+        total["voxels"] += record["voxels"]
+        total["samples"] += 1
+        if record.get("peak_rss_bytes") and record.get("max_patient_voxels"):
+            # The peak is set by the largest patient; keep the most pessimistic ratio.
+            ratio = record["peak_rss_bytes"] / record["max_patient_voxels"]
+            total["peak_rss_bytes_per_voxel"] = max(
+                total["peak_rss_bytes_per_voxel"] or 0.0, ratio,
+            )
+    return {
+        name: dict(
+            seconds_per_voxel=total["seconds"] / total["voxels"],
+            peak_rss_bytes_per_voxel=total["peak_rss_bytes_per_voxel"],
+            samples=total["samples"],
+        )
+        for name, total in totals.items()
+    }
+
+
+def plan_workload(vPAWRootDirectory, patientPrefixes, history_filenames=None):
+    """
+    Count the patients and CT voxels of a run and estimate its duration and peak
+    memory.
+
+    Args:
+        vPAWRootDirectory: a directory containing images/*
+        patientPrefixes: the prefixes of the patients to be run
+        history_filenames: pipeline report history files to take throughputs from.
+            By default, the one in vPAWRootDirectory.
+    Return: a JSON-compatible dict.  Estimates are None for stages that have not been
+        measured before.  Without measurements, the peak memory is estimated as in
+        vpawmodellib.governor.
+    """
+    patients = []
+    for prefix in patientPrefixes:
+        voxels = 0
+        filenames = patient_image_files(vPAWRootDirectory, prefix)
+        for filename in filenames:
+            try:
+                voxels += header_voxel_count(read_nrrd_header(filename))
+            except (OSError, ValueError, KeyError) as e:
+                logging.warning(f"Unable to read the header of {filename}: {e}")
+        patients.append(dict(prefix=prefix, images=len(filenames), voxels=voxels))
+    total_voxels = sum(patient["voxels"] for patient in patients)
+    largest = max(patients, key=lambda patient: patient["voxels"], default=None)
+
+    if history_filenames is None:
+        history_filenames = [os.path.join(vPAWRootDirectory, HISTORY_FILENAME)]
+    throughput = stage_throughput(read_stage_history(history_filenames))
+    stages = dict()
+    for name in PIPELINE_STAGES:
+        measured = throughput.get(name)
+        stages[name] = dict(
+            estimated_seconds=(
+                measured["seconds_per_voxel"] * total_voxels if measured else None
+            ),
+            estimated_peak_memory_bytes=(
+                measured["peak_rss_bytes_per_voxel"] * largest["voxels"]
+                if measured and measured["peak_rss_bytes_per_voxel"] and largest
+                else None
+            ),
+            samples=measured["samples"] if measured else 0,
+        )
+
+    durations = [stage["estimated_seconds"] for stage in stages.values()]
+    peaks = [
+        stage["estimated_peak_memory_bytes"]
+        for stage in stages.values()
+        if stage["estimated_peak_memory_bytes"] is not None
+    ]
+    if peaks:
+        peak_memory = max(peaks)
+    elif largest is not None:
+        peak_memory = estimate_patient_memory_bytes(
+            vPAWRootDirectory, largest["prefix"],
+        )
+    else:
+        peak_memory = None
+    return dict(
+        vpaw_root_directory=vPAWRootDirectory,
+        patients=patients,
+        patient_count=len(patients),
+        total_voxels=total_voxels,
+        largest_patient_voxels=largest["voxels"] if largest else 0,
+        stages=stages,
+        estimated_seconds=None if None in durations else sum(durations),
+        estimated_peak_memory_bytes=peak_memory,
+    )
+
+
+def format_duration(seconds):
+    """
+    Return a duration as, e.g., "2 h 05 min", or "unknown" for None.
+    """
+    if seconds is None:
+        return "unknown"
+    if seconds < SECONDS_PER_MINUTE:
+        return f"{seconds:.0f} s"
+    if seconds < SECONDS_PER_HOUR:
+        return f"{seconds / SECONDS_PER_MINUTE:.0f} min"
+    hours, remainder = divmod(int(seconds), SECONDS_PER_HOUR)
+    return f"{hours} h {remainder // SECONDS_PER_MINUTE:02d} min"
+
+
+def format_plan(plan):
+    """
+    Return a few lines of text that describe a plan from plan_workload.
+    """
+    lines = [
+        f"{plan['patient_count']} patients, {plan['total_voxels'] / 1e6:.0f} million"
+        + f" CT voxels (largest patient {plan['largest_patient_voxels'] / 1e6:.0f}"
+        + " million)",
+    ]
+    for name, stage in plan["stages"].items():
+        lines.append(
+            f"{name}: {format_duration(stage['estimated_seconds'])}"
+            + (
+                f" (from {stage['samples']} earlier measurements)"
+                if stage["samples"]
+                else " (not measured in earlier runs)"
+            ),
+        )
+    lines.append(
+        f"Estimated total: {format_duration(plan['estimated_seconds'])}, peak memory"
+        + f" {format_bytes(plan['estimated_peak_memory_bytes'])}",
+    )
+    return "\n".join(lines)
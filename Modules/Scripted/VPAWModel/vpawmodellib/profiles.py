@@ -0,0 +1,171 @@
+"""
+Named inference profiles for the segmentation configuration that VPAW Model writes for
+pediatric_airway_atlas.atlas_builder_configurable.
+"""
+
+import functools
+import glob
+import logging
+import os
+import shutil
+import subprocess
+import sys
+
+# Each profile overrides these entries of the segmentation configuration.  Sliding
+# window inference dominates the run time; the number of tiles grows roughly as
+# 1 / (1 - tiles_overlap) ** 3, so lowering the overlap is what makes a profile fast.
+# The voxels computed grow the same way whatever the crop size, because each tile
+# covers crop_size ** 3 voxels, so a smaller crop would not make a profile faster;
+# every profile keeps the crop size that the model was trained with.
+INFERENCE_PROFILES = {
+    "fast preview": dict(
+        crop_size=[192, 192, 192],
+        batch_size=4,
+        tiles_overlap=0.25,
+        tile_fusion_mode="constant",
+    ),
+    "balanced": dict(
+        crop_size=[192, 192, 192],
+        batch_size=8,
+        tiles_overlap=0.5,
+        tile_fusion_mode="gaussian",
+    ),
+    "full quality": dict(
+        crop_size=[192, 192, 192],
+        batch_size=8,
+        tiles_overlap=0.75,
+        tile_fusion_mode="gaussian",
+    ),
+}
+
+DEFAULT_INFERENCE_PROFILE = "full quality"
+
+# The GPUs that the segmentation configuration names, at most
+DEFAULT_TRAIN_DEVICES = [0, 1]
+# Directory with an entry for each GPU of the NVIDIA driver on Linux
+_NVIDIA_GPUS_DIRECTORY = "/proc/driver/nvidia/gpus"
+
+
+def apply_inference_profile(segment_yaml, profile_name):
+    """
+    Update a segmentation configuration dictionary in place with the settings of the
+    named inference profile, and return it.
+
+    Args:
+        segment_yaml: the dictionary that will be written as the segmentation config
+        profile_name: a key of INFERENCE_PROFILES
+    Return: segment_yaml
+    """
+    if profile_name not in INFERENCE_PROFILES:
+        raise ValueError(
+            f"Unknown inference profile {profile_name!r}; expected one of "
+            + ", ".join(repr(name) for name in INFERENCE_PROFILES),
+        )
+    profile = INFERENCE_PROFILES[profile_name]
+    segment_yaml["crop_size"] = list(profile["crop_size"])
+    segment_yaml.setdefault("training", dict())["batch_size"] = profile["batch_size"]
+    inference = segment_yaml.setdefault("inference", dict())
+    inference["tiles_overlap"] = profile["tiles_overlap"]
+    inference["tile_fusion_mode"] = profile["tile_fusion_mode"]
+    return segment_yaml
+
+
+@functools.cache
+def _driver_gpu_count():
+    if os.path.isdir(_NVIDIA_GPUS_DIRECTORY):
+        return len(os.listdir(_NVIDIA_GPUS_DIRECTORY))
+    nvidia_smi = shutil.which("nvidia-smi")
+    if nvidia_smi is None:
+        # Without the driver's tools, there is no CUDA on Linux or macOS, but Windows
+        # may not have nvidia-smi on the PATH
+        return None if sys.platform == "win32" else 0
+    try:
+        completed = subprocess.run(
+            [nvidia_smi, "-L"], capture_output=True, text=True, timeout=10, check=True,
+        )
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return sum(line.startswith("GPU ") for line in completed.stdout.splitlines())
+
+
+def visible_gpu_count():
+    """
+    Return the number of NVIDIA GPUs that the pipeline's child processes can use, or
+    None if that is unknown.  This asks the driver, rather than importing torch, which
+    takes too long to do in 3D Slicer.
+    """
+    visible = os.environ.get("CUDA_VISIBLE_DEVICES")
+    if visible is not None:
+        # CUDA ignores the devices after the first invalid one, e.g., "-1"
+        count = 0
+        for device in visible.split(","):
+            if not device.strip() or device.strip().startswith("-"):
+                break
+            count += 1
+        return count
+    return _driver_gpu_count()
+
+
+def segmentation_devices(gpu_count):
+    """
+    Return the train_devices entry of the segmentation configuration.
+
+    Args:
+        gpu_count: the number of GPUs, as from visible_gpu_count, or None if unknown
+    Return: DEFAULT_TRAIN_DEVICES, without the GPUs that do not exist.  Without any
+        GPU, or when their number is unknown, DEFAULT_TRAIN_DEVICES is returned as it
+        is, leaving the choice of device to pediatric_airway_atlas.
+    """
+    if gpu_count == 0:
+        logging.warning(
+            "No NVIDIA GPU was found; segmentation will be slow, if"
+            + " pediatric_airway_atlas can run it without a GPU at all",
+        )
+    if not gpu_count:
+        return list(DEFAULT_TRAIN_DEVICES)
+    return DEFAULT_TRAIN_DEVICES[:gpu_count]
+
+
+def find_computed_segmentation(vPAWRootDirectory, patientPrefix):
+    """
+    Return the file name of the computed segmentation for a patient, or None if there is
+    not exactly one.
+    """
+    candidates = glob.glob(
+        os.path.join(
+            glob.escape(vPAWRootDirectory),
+            "segmentations_computed",
+            glob.escape(patientPrefix) + "*",
+        ),
+    )
+    return candidates[0] if len(candidates) == 1 else None
+
+
+def read_segmentation_mask(filename):
+    """
+    Read a segmentation file as a boolean array that is True wherever any segment is
+    present.
+    """
+    # Cannot import nrrd at file scope because it might not yet be installed
+    import nrrd
+
+    data, header = nrrd.read(filename)
+    return data != 0
+
+
+def dice_coefficient(mask_a, mask_b):
+    """
+    Return the Dice similarity coefficient of two boolean arrays of the same shape.  Two
+    empty masks are considered identical.
+    """
+    # Imported here to keep numpy out of 3D Slicer's startup
+    import numpy as np
+
+    if mask_a.shape != mask_b.shape:
+        raise ValueError(
+            f"Cannot compare masks of shapes {mask_a.shape} and {mask_b.shape}",
+        )
+    total = np.count_nonzero(mask_a) + np.count_nonzero(mask_b)
+    if total == 0:
+        return 1.0
+    return 2.0 * np.count_nonzero(mask_a & mask_b) / total
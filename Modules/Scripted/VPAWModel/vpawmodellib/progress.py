@@ -0,0 +1,214 @@
+"""
+Progress of a pipeline run, parsed from the output of the pipeline's modules.
+
+The pipeline reports its progress with tqdm bars, whose lines look like
+
+    Inference:  45%|████▌     | 45/100 [00:12<00:15,  3.60it/s]
+
+Each run of a pipeline module is one step of the run; the tqdm bars within it give
+progress within the step.
+"""
+
+import re
+import threading
+import time
+
+TQDM_PATTERN = re.compile(
+    r"(?:(?P<description>[^|]*?):\s*)?(?P<percent>\d+)%\|[^|]*\|\s*"
+    + r"(?P<n>\d+)/(?P<total>\d+)\s*\[(?P<elapsed>[\d:]+)<(?P<remaining>[\d:?]+)",
+)
+# Percentage points of a tqdm bar between the lines of it that are logged
+LOG_PERCENT_STEP = 10
+SECONDS_PER_MINUTE = 60
+# Descriptions of the tqdm bars of the segmentation's sliding-window inference.  MONAI's
+# sliding_window_inference shows its bar without a description.
+INFERENCE_BAR_PATTERN = re.compile(r"^$|infer", re.IGNORECASE)
+
+
+def parse_tqdm(line):
+    """
+    Parse a line of tqdm output.
+
+    Return: None if the line is not a tqdm bar with a known total, otherwise a dict
+        with the bar's description, n, total, fraction, and elapsed_seconds and
+        remaining_seconds (None if unknown)
+    """
+    match = TQDM_PATTERN.search(line)
+    if match is None:
+        return None
+    n, total = int(match["n"]), int(match["total"])
+    return dict(
+        description=(match["description"] or "").strip(),
+        n=n,
+        total=total,
+        fraction=min(1.0, n / total) if total else 0.0,
+        elapsed_seconds=parse_duration(match["elapsed"]),
+        remaining_seconds=parse_duration(match["remaining"]),
+    )
+
+
+def parse_duration(text):
+    """
+    Return the seconds of a tqdm duration such as "01:02:03" or "02:03", or None for
+    "?".
+    """
+    if "?" in text:
+        return None
+    seconds = 0
+    for part in text.split(":"):
+        seconds = seconds * SECONDS_PER_MINUTE + int(part)
+    return seconds
+
+
+def format_seconds(seconds):
+    if seconds is None:
+        return "unknown"
+    minutes, seconds = divmod(int(seconds), SECONDS_PER_MINUTE)
+    hours, minutes = divmod(minutes, SECONDS_PER_MINUTE)
+    return f"{hours}:{minutes:02d}:{seconds:02d}"
+
+
+class BarTimer:
+    """
+    Times the tqdm bars in the output of a pipeline module whose descriptions match a
+    pattern, from the first line of output of such a bar to the last.  A bar writes a
+    line when it starts and when it ends, so this is the time that the bars' work took.
+    """
+
+    def __init__(self, pattern=INFERENCE_BAR_PATTERN):
+        self.pattern = pattern
+        self.first = None
+        self.last = None
+
+    def output(self, line):
+        bar = parse_tqdm(line)
+        if bar is None or not self.pattern.search(bar["description"]):
+            return
+        now = time.monotonic()
+        if self.first is None:
+            self.first = now
+        self.last = now
+
+    def seconds(self):
+        """
+        Return the seconds from the first line of a matching bar to the last, or None if
+        there was none.
+        """
+        return None if self.first is None else self.last - self.first
+
+
+class ProgressTracker:
+    """
+    Tracks the steps of a pipeline run, i.e., the runs of pipeline modules, and their
+    progress.  It may be updated from several threads.
+    """
+
+    def __init__(self, expected_steps, patient_prefixes=()):
+        """
+        Args:
+            expected_steps: the number of steps that the run will take
+            patient_prefixes: the patients of the run, which are recognized in the
+                output of a step that processes several patients
+        """
+        self.expected_steps = max(1, expected_steps)
+        self.started = time.monotonic()
+        self._lock = threading.Lock()
+        self._finished_steps = 0
+        # Keyed by (stage, patients)
+        self._active = dict()
+        self._patient_pattern = (
+            re.compile(
+                "|".join(re.escape(prefix) for prefix in patient_prefixes if prefix),
+            )
+            if any(patient_prefixes)
+            else None
+        )
+
+    def start(self, stage, patients):
+        with self._lock:
+            self._active[(stage, patients)] = dict(
+                stage=stage,
+                patients=patients,
+                patient=None,
+                description="",
+                fraction=0.0,
+                remaining_seconds=None,
+                logged_percent=None,
+            )
+
+    def finish(self, stage, patients):
+        with self._lock:
+            self._active.pop((stage, patients), None)
+            self._finished_steps += 1
+
+    def output(self, stage, patients, line):
+        """
+        Update the progress of a step from a line of its output.  Returns whether the
+        line is worth logging: every line except tqdm updates between LOG_PERCENT_STEP
+        percentage points.
+        """
+        bar = parse_tqdm(line)
+        with self._lock:
+            step = self._active.get((stage, patients))
+            if step is None:
+                return True
+            if bar is None:
+                if self._patient_pattern is not None:
+                    match = self._patient_pattern.search(line)
+                    if match:
+                        step["patient"] = match[0]
+                return True
+            step.update(
+                description=bar["description"],
+                fraction=bar["fraction"],
+                remaining_seconds=bar["remaining_seconds"],
+            )
+            percent = int(100 * bar["fraction"])
+            if (
+                step["logged_percent"] is not None
+                and bar["n"] < bar["total"]
+                and percent // LOG_PERCENT_STEP
+                == step["logged_percent"] // LOG_PERCENT_STEP
+            ):
+                return False
+            step["logged_percent"] = percent
+            return True
+
+    def snapshot(self):
+        """
+        Return a dict with the overall fraction done, the estimated seconds remaining
+        (None if unknown), and a copy of each active step.
+        """
+        with self._lock:
+            active = [dict(step) for step in self._active.values()]
+            done = self._finished_steps + sum(step["fraction"] for step in active)
+        fraction = min(1.0, done / self.expected_steps)
+        elapsed = time.monotonic() - self.started
+        return dict(
+            fraction=fraction,
+            remaining_seconds=elapsed * (1 - fraction) / fraction if fraction else None,
+            active=active,
+        )
+
+    def summary(self):
+        """
+        Return a line for each active step and one for the whole run.
+        """
+        snapshot = self.snapshot()
+        lines = []
+        for step in snapshot["active"]:
+            who = step["patient"] or step["patients"] or "all patients"
+            what = f" {step['description']}" if step["description"] else ""
+            lines.append(
+                f"{step['stage']} ({who}):{what} {100 * step['fraction']:.0f}%"
+                + (
+                    f", {format_seconds(step['remaining_seconds'])} left"
+                    if step["remaining_seconds"] is not None
+                    else ""
+                ),
+            )
+        lines.append(
+            f"Overall {100 * snapshot['fraction']:.0f}%, about"
+            + f" {format_seconds(snapshot['remaining_seconds'])} left",
+        )
+        return "\n".join(lines)
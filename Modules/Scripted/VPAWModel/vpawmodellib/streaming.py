@@ -0,0 +1,84 @@
+"""
+Run a sequence of per-patient stages so that different patients can be in different
+stages at the same time.
+
+With the stages run one after the other for the whole cohort, CPU-bound landmark
+conversion and segmentation inference never overlap.  Here each stage has its own
+thread and a patient is handed to the next stage as soon as it is done with the
+current one.  The stages do their work in child processes, so the threads mostly wait.
+"""
+
+import logging
+import queue
+import threading
+
+# Marks the end of the items in a queue
+_DONE = object()
+# Seconds between calls to a wait callback
+WAIT_INTERVAL = 0.1
+
+
+def join_thread(thread, wait_callback=None):
+    """
+    Wait for a thread to finish, calling wait_callback, if given, every WAIT_INTERVAL
+    seconds, e.g., to keep a GUI responsive.
+    """
+    while thread.is_alive():
+        thread.join(WAIT_INTERVAL)
+        if wait_callback is not None:
+            wait_callback()
+
+
+def run_streaming(items, stages, queue_size=2, wait_callback=None):
+    """
+    Pass each item through every stage, in order, with the stages running
+    concurrently.
+
+    Args:
+        items: a sequence of items, e.g., patient prefixes
+        stages: a sequence of (name, function) pairs.  function(item) returns True if
+            the item should continue to the next stage.  An exception counts as False.
+        queue_size: how many items may wait between two stages.  This bounds how far
+            an early stage can run ahead of a later one.
+        wait_callback: Optionally, a function that is called repeatedly while the
+            stages run.
+    Return: a dict from each item to None if it passed every stage, or otherwise to the
+        name of the stage at which it failed
+    """
+    results = dict()
+    results_lock = threading.Lock()
+    queues = [queue.Queue(maxsize=queue_size) for _ in range(len(stages) - 1)]
+
+    def record(item, failed_stage):
+        with results_lock:
+            results[item] = failed_stage
+
+    def run_stage(index):
+        name, function = stages[index]
+        inputs = iter(items) if index == 0 else iter(queues[index - 1].get, _DONE)
+        try:
+            for item in inputs:
+                try:
+                    succeeded = function(item)
+                except Exception:
+                    logging.exception(f"Stage {name} failed for {item!r}")
+                    succeeded = False
+                if not succeeded:
+                    record(item, name)
+                elif index + 1 < len(stages):
+                    queues[index].put(item)
+                else:
+                    record(item, None)
+        finally:
+            if index + 1 < len(stages):
+                queues[index].put(_DONE)
+
+    threads = [
+        threading.Thread(target=run_stage, args=(index,), name=name, daemon=True)
+        for index, (name, _) in enumerate(stages)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        join_thread(thread, wait_callback)
+    return results
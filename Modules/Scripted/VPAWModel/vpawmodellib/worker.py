@@ -0,0 +1,322 @@
+"""
+A long-lived Python process that runs pediatric_airway_atlas entry points on request.
+
+Running each pipeline stage with slicer.util._executePythonModule starts a fresh
+interpreter, which re-imports torch, monai, and pytorch_lightning and re-reads the
+model checkpoint every time.  The worker started by WarmWorker keeps those imports and
+the loaded checkpoints in memory between requests.
+
+This file is both the client (WarmWorker, used from within 3D Slicer) and the server
+(run as a script by the PythonSlicer executable).  It must not import slicer.
+"""
+
+import copy
+import json
+import logging
+import os
+import runpy
+import shutil
+import subprocess
+import sys
+import threading
+import traceback
+
+# Lines written by the worker that start with this prefix are protocol responses; all
+# other lines are output from the pipeline itself.
+RESPONSE_PREFIX = "@@vpaw-worker@@ "
+
+# Modules that are expensive to import and are used by every pipeline stage
+DEFAULT_PRELOAD_MODULES = ("torch", "monai", "pytorch_lightning")
+
+# sys.argv and the working directory belong to the whole process, so only one module
+# at a time can be run with run_module_isolated.
+_isolation_lock = threading.Lock()
+
+
+def python_slicer_executable():
+    """
+    Return the path of the Python interpreter that slicer.util._executePythonModule
+    would use.  Within 3D Slicer, sys.executable is the application, not an
+    interpreter, so it is not a fallback.
+    """
+    executable = shutil.which("PythonSlicer")
+    if not executable:
+        raise RuntimeError("PythonSlicer executable not found")
+    return executable
+
+
+class WarmWorker:
+    """
+    Client for a persistent worker process.  Requests are sent as JSON lines on the
+    worker's stdin; the worker's combined stdout and stderr are relayed to the log,
+    except for the lines that carry responses.
+    """
+
+    def __init__(
+        self, cwd, python_executable=None, preload_modules=DEFAULT_PRELOAD_MODULES,
+    ):
+        """
+        Args:
+            cwd: working directory for the worker, normally the pediatric_airway_atlas
+                source directory.  It is also put on the worker's sys.path.
+            python_executable: interpreter to run the worker with; defaults to
+                PythonSlicer.
+            preload_modules: modules to import as soon as the worker starts
+        """
+        self.cwd = str(cwd)
+        self.python_executable = python_executable or python_slicer_executable()
+        self.preload_modules = tuple(preload_modules)
+        self.process = None
+
+    def is_running(self):
+        return self.process is not None and self.process.poll() is None
+
+    def start(self):
+        """
+        Start the worker, if it is not already running, and wait until it has imported
+        the preload modules.
+        """
+        if self.is_running():
+            return
+        env = dict(os.environ)
+        env["PYTHONUNBUFFERED"] = "1"
+        startupinfo = None
+        if os.name == "nt":
+            # Hide the console window
+            startupinfo = subprocess.STARTUPINFO()
+            startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
+        self.process = subprocess.Popen(
+            [self.python_executable, os.path.abspath(__file__)],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            universal_newlines=True,
+            bufsize=1,
+            cwd=self.cwd,
+            env=env,
+            startupinfo=startupinfo,
+        )
+        response = self._request(
+            dict(command="preload", modules=self.preload_modules, cwd=self.cwd),
+        )
+        logging.info(
+            "Pipeline worker started; preloaded "
+            + (", ".join(response.get("preloaded", [])) or "nothing"),
+        )
+
+    def run_module(self, module_name, args, cwd=None, output_callback=None):
+        """
+        Run `python -m module_name *args` inside the worker.
+
+        Args:
+            module_name: the module to run as __main__
+            args: sequence of command-line arguments
+            cwd: working directory for this run; defaults to the worker's
+            output_callback: Optionally, a function that takes each line of output
+                from the module.  Defaults to print.
+
+        Raises subprocess.CalledProcessError if the module exits with a non-zero status.
+        """
+        self.start()
+        response = self._request(
+            dict(
+                command="run",
+                module=module_name,
+                args=list(args),
+                cwd=str(cwd) if cwd is not None else self.cwd,
+            ),
+            output_callback,
+        )
+        returncode = response.get("returncode", 1)
+        if returncode != 0:
+            raise subprocess.CalledProcessError(
+                returncode, [module_name, *args], response.get("error"),
+            )
+
+    def clear_checkpoint_cache(self):
+        """
+        Have the worker, if it is running, forget the model checkpoints that it has
+        cached.  Return the number of checkpoints forgotten.
+        """
+        if not self.is_running():
+            return 0
+        return self._request(dict(command="clear_checkpoint_cache")).get("cleared", 0)
+
+    def shutdown(self, timeout=10):
+        """
+        Ask the worker to exit, killing it if it does not exit promptly.
+        """
+        if not self.is_running():
+            self.process = None
+            return
+        try:
+            self.process.stdin.write(json.dumps(dict(command="shutdown")) + "\n")
+            self.process.stdin.close()
+            self.process.wait(timeout=timeout)
+        except (OSError, subprocess.TimeoutExpired):
+            self.process.kill()
+            self.process.wait()
+        self.process = None
+
+    def _request(self, request, output_callback=None):
+        if output_callback is None:
+            output_callback = print
+        try:
+            self.process.stdin.write(json.dumps(request) + "\n")
+            self.process.stdin.flush()
+        except OSError as e:
+            self.shutdown()
+            raise RuntimeError("The pipeline worker is no longer running") from e
+        for line in self.process.stdout:
+            if line.startswith(RESPONSE_PREFIX):
+                return json.loads(line[len(RESPONSE_PREFIX) :])
+            output_callback(line.rstrip("\n"))
+        # stdout closed without a response, so the worker has died.
+        returncode = self.process.wait()
+        self.process = None
+        raise RuntimeError(
+            f"The pipeline worker exited unexpectedly with status {returncode}",
+        )
+
+
+#
+# Worker side
+#
+
+
+def cache_checkpoint_loads():
+    """
+    Wrap torch.load so that each model checkpoint (.pth file) is read from disk only
+    once per process, as long as the file is not modified.  Calling this again has no
+    effect.  The cached checkpoints stay in memory until clear_checkpoint_cache is
+    called.
+    """
+    import torch
+
+    if getattr(torch.load, "vpaw_cached", False):
+        return
+    original_load = torch.load
+    cache = {}
+
+    def cached_load(f, *args, **kwargs):
+        if not (isinstance(f, (str, os.PathLike)) and os.fspath(f).endswith(".pth")):
+            return original_load(f, *args, **kwargs)
+        path = os.path.abspath(f)
+        key = (path, os.path.getmtime(path), repr(args), repr(sorted(kwargs.items())))
+        if key not in cache:
+            cache[key] = original_load(f, *args, **kwargs)
+        # A shallow copy protects the cached checkpoint from callers that pop entries
+        # from it; the tensors themselves are only read by load_state_dict.
+        return copy.copy(cache[key])
+
+    cached_load.vpaw_cached = True
+    cached_load.vpaw_cache = cache
+    torch.load = cached_load
+
+
+def clear_checkpoint_cache():
+    """
+    Forget the checkpoints cached by cache_checkpoint_loads, so that their memory can
+    be freed.  Return the number of checkpoints forgotten.
+    """
+    torch = sys.modules.get("torch")
+    cache = getattr(getattr(torch, "load", None), "vpaw_cache", None)
+    if cache is None:
+        return 0
+    count = len(cache)
+    cache.clear()
+    return count
+
+
+def _preload(request):
+    cwd = request.get("cwd")
+    if cwd and cwd not in sys.path:
+        sys.path.insert(0, cwd)
+    preloaded = []
+    for module_name in request.get("modules", ()):
+        try:
+            __import__(module_name)
+            preloaded.append(module_name)
+        except ImportError:
+            traceback.print_exc()
+    if "torch" in preloaded:
+        cache_checkpoint_loads()
+    return dict(preloaded=preloaded)
+
+
+def run_module_isolated(module_name, args, cwd=None, alter_sys=True):
+    """
+    Run `python -m module_name *args` in this interpreter, with sys.argv and the
+    working directory set for the module and restored afterwards.  Runs are
+    serialized.
+
+    Args:
+        module_name: the module to run as __main__
+        args: sequence of command-line arguments
+        cwd: working directory for the run, which is also put on sys.path
+        alter_sys: passed to runpy.run_module.  If True, sys.modules["__main__"] is
+            replaced during the run.
+    Return: a dict with the returncode and, on failure, an error message
+    """
+    with _isolation_lock:
+        saved_argv, saved_cwd = sys.argv, os.getcwd()
+        error = None
+        try:
+            if cwd:
+                os.chdir(cwd)
+                if cwd not in sys.path:
+                    sys.path.insert(0, cwd)
+            sys.argv = [module_name, *args]
+            runpy.run_module(module_name, run_name="__main__", alter_sys=alter_sys)
+            returncode = 0
+        except SystemExit as e:
+            if e.code is None or isinstance(e.code, int):
+                returncode = e.code or 0
+            else:
+                error = str(e.code)
+                returncode = 1
+        except Exception as e:
+            traceback.print_exc()
+            error = f"{type(e).__name__}: {e}"
+            returncode = 1
+        finally:
+            sys.argv = saved_argv
+            os.chdir(saved_cwd)
+    return dict(returncode=returncode, error=error)
+
+
+def _run(request):
+    return run_module_isolated(
+        request["module"], request.get("args", []), request.get("cwd"),
+    )
+
+
+def main():
+    # Do not let modules in this directory shadow those of the pipeline.
+    script_directory = os.path.dirname(os.path.abspath(__file__))
+    if sys.path and os.path.abspath(sys.path[0]) == script_directory:
+        sys.path.pop(0)
+
+    for line in sys.stdin:
+        if not line.strip():
+            continue
+        request = json.loads(line)
+        command = request.get("command")
+        if command == "shutdown":
+            break
+        if command == "preload":
+            response = _preload(request)
+        elif command == "run":
+            response = _run(request)
+        elif command == "clear_checkpoint_cache":
+            response = dict(cleared=clear_checkpoint_cache())
+        else:
+            response = dict(returncode=1, error=f"Unknown command {command!r}")
+        sys.stdout.flush()
+        sys.stderr.flush()
+        sys.__stdout__.write(RESPONSE_PREFIX + json.dumps(response) + "\n")
+        sys.__stdout__.flush()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""
+Tests of vpawvisualizelib.p3arrays: the .p3.npz format and prefer_p3_arrays.
+"""
+
+import os
+import pickle
+import tempfile
+import unittest
+
+import numpy as np
+from vpawvisualizelib.p3arrays import (
+    convert_data_root,
+    p3_arrays_filename,
+    prefer_p3_arrays,
+    read_p3_arrays,
+    write_p3_arrays,
+)
+
+
+def example_contents():
+    """
+    Return contents like those of a P3 file, with every supported kind of value.
+    """
+    return (
+        np.arange(12.0).reshape(4, 3),
+        dict(names=["a", "b"], count=np.int64(3), nothing=None, flag=True, ratio=0.5),
+        [
+            np.zeros((0, 2)),
+            np.array([1, 2], dtype=">i4"),
+            np.asfortranarray(np.arange(6, dtype=np.uint8).reshape(2, 3)),
+        ],
+    )
+
+
+def assert_same(actual, expected):
+    assert type(actual) is type(expected) or (
+        isinstance(expected, np.ndarray) and isinstance(actual, np.ndarray)
+    ), (actual, expected)
+    if isinstance(expected, np.ndarray):
+        assert actual.dtype == expected.dtype
+        np.testing.assert_array_equal(actual, expected)
+    elif isinstance(expected, (list, tuple)):
+        assert len(actual) == len(expected)
+        for actual_item, expected_item in zip(actual, expected):
+            assert_same(actual_item, expected_item)
+    elif isinstance(expected, dict):
+        assert list(actual) == list(expected)
+        for key in expected:
+            assert_same(actual[key], expected[key])
+    else:
+        assert actual == expected
+
+
+def set_mtime(filename, seconds):
+    os.utime(filename, (seconds, seconds))
+
+
+class P3ArraysTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def path(self, basename):
+        return os.path.join(self.directory.name, basename)
+
+    def test_round_trip(self):
+        filename = self.path("1_centerline.p3.npz")
+        write_p3_arrays(filename, example_contents())
+        for memory_map in (True, False):
+            assert_same(read_p3_arrays(filename, memory_map), example_contents())
+
+    def test_arrays_are_memory_mapped(self):
+        filename = self.path("1_centerline.p3.npz")
+        write_p3_arrays(filename, example_contents())
+        assert isinstance(read_p3_arrays(filename)[0], np.memmap)
+
+    def test_unsupported_values_are_rejected(self):
+        for contents in (np.array([object()]), {1, 2}):
+            try:
+                write_p3_arrays(self.path("bad.p3.npz"), contents)
+            except ValueError:
+                continue
+            self.fail(f"{contents!r} was written")
+
+    def test_convert_data_root(self):
+        os.makedirs(self.path("centerline"))
+        p3_filename = self.path(os.path.join("centerline", "1_centerline.p3"))
+        with open(p3_filename, "wb") as p3_file:
+            pickle.dump(example_contents(), p3_file)
+        with open(p3_filename, "rb") as p3_file:
+            unpickled = pickle.load(p3_file)
+        response = convert_data_root(self.directory.name)
+        assert response["converted"] == [p3_arrays_filename(p3_filename)]
+        assert_same(read_p3_arrays(p3_arrays_filename(p3_filename)), unpickled)
+        response = convert_data_root(self.directory.name)
+        assert response["up_to_date"] == [p3_filename]
+
+    def test_prefer_current_p3_arrays(self):
+        p3_filename = self.path("1_centerline.p3")
+        arrays_filename = p3_arrays_filename(p3_filename)
+        for filename in (p3_filename, arrays_filename):
+            with open(filename, "wb"):
+                pass
+        set_mtime(p3_filename, 1000)
+        set_mtime(arrays_filename, 2000)
+        other = self.path("1_CT.nrrd")
+        assert prefer_p3_arrays([other, p3_filename, arrays_filename]) == [
+            other,
+            arrays_filename,
+        ]
+
+    def test_stale_p3_arrays_are_dropped(self):
+        p3_filename = self.path("1_centerline.p3")
+        arrays_filename = p3_arrays_filename(p3_filename)
+        for filename in (p3_filename, arrays_filename):
+            with open(filename, "wb"):
+                pass
+        set_mtime(arrays_filename, 1000)
+        set_mtime(p3_filename, 2000)
+        assert prefer_p3_arrays([arrays_filename, p3_filename]) == [p3_filename]
+
+    def test_unpaired_files_are_kept(self):
+        p3_filename = self.path("1_centerline.p3")
+        arrays_filename = self.path("2_centerline.p3.npz")
+        assert prefer_p3_arrays([p3_filename, arrays_filename]) == [
+            p3_filename,
+            arrays_filename,
+        ]
+
+
+if __name__ == "__main__":
+    unittest.main()
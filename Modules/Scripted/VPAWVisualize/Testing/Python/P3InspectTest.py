@@ -0,0 +1,101 @@
+"""
+Tests of vpawvisualizelib.p3inspect, which interprets pickle opcodes symbolically.
+"""
+
+import collections
+import os
+import pickle
+import tempfile
+import unittest
+
+import numpy as np
+from vpawvisualizelib.p3arrays import p3_arrays_filename, write_p3_arrays
+from vpawvisualizelib.p3inspect import MAX_READ_ARGUMENT_BYTES, describe_p3_file
+
+CENTERLINE_DESCRIPTION = (
+    "(ndarray(float64, shape=(120, 3)), ndarray(int16, shape=(5000,)),"
+    + " {'spacing': float32 scalar, 'names': ['a', 'b']})"
+)
+
+
+def centerline_contents():
+    return (
+        np.zeros((120, 3)),
+        np.arange(5000, dtype=np.int16),
+        dict(spacing=np.float32(1.5), names=["a", "b"]),
+    )
+
+
+class P3InspectTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def write_pickle(self, contents, protocol=pickle.DEFAULT_PROTOCOL, name="1_.p3"):
+        filename = os.path.join(self.directory.name, name)
+        with open(filename, "wb") as p3_file:
+            pickle.dump(contents, p3_file, protocol=protocol)
+        return filename
+
+    def write_bytes(self, data):
+        filename = os.path.join(self.directory.name, "1_.p3")
+        with open(filename, "wb") as p3_file:
+            p3_file.write(data)
+        return filename
+
+    def assert_unsupported(self, filename):
+        try:
+            describe_p3_file(filename)
+        except ValueError:
+            return
+        self.fail(f"{filename} was described")
+
+    def test_arrays_in_every_protocol(self):
+        for protocol in range(pickle.HIGHEST_PROTOCOL + 1):
+            filename = self.write_pickle(
+                centerline_contents(), protocol, name=f"{protocol}.p3",
+            )
+            assert describe_p3_file(filename) == CENTERLINE_DESCRIPTION, protocol
+
+    def test_p3_arrays_are_described_like_p3_files(self):
+        filename = p3_arrays_filename(os.path.join(self.directory.name, "1_.p3"))
+        write_p3_arrays(filename, centerline_contents())
+        assert describe_p3_file(filename) == CENTERLINE_DESCRIPTION
+
+    def test_long_data_is_skipped(self):
+        length = MAX_READ_ARGUMENT_BYTES + 1
+        filename = self.write_pickle(dict(data=b"x" * length))
+        assert describe_p3_file(filename) == f"{{'data': <{length} bytes>}}"
+
+    def test_other_objects_are_described_without_importing_them(self):
+        # GLOBAL of a module that does not exist, EMPTY_TUPLE, NEWOBJ, STOP
+        filename = self.write_bytes(b"\x80\x02cnot_a_module\nThing\n)\x81.")
+        assert describe_p3_file(filename) == "<not_a_module.Thing object>"
+
+    def test_items_of_other_objects_are_dropped(self):
+        filename = self.write_pickle(
+            dict(ordered=collections.OrderedDict(a=1), queue=collections.deque([1])),
+        )
+        assert describe_p3_file(filename) == (
+            "{'ordered': <collections.OrderedDict object>,"
+            + " 'queue': <collections.deque object>}"
+        )
+
+    def test_long_containers_are_abbreviated(self):
+        filename = self.write_pickle(list(range(100)))
+        assert describe_p3_file(filename).endswith(", ... 100 items]")
+
+    def test_unsupported_pickles(self):
+        self.assert_unsupported(self.write_bytes(pickle.dumps([1, 2])[:-3]))
+        # PERSID
+        self.assert_unsupported(self.write_bytes(b"Pid\n."))
+
+    def test_description_follows_changes_to_the_file(self):
+        filename = self.write_pickle([1])
+        assert describe_p3_file(filename) == "[1]"
+        filename = self.write_pickle([1, 2])
+        assert describe_p3_file(filename) == "[1, 2]"
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,98 @@
+"""
+Tests of vpawvisualizelib.staging.StagingCache, with a local directory standing in for
+the network share.
+"""
+
+import os
+import tempfile
+import unittest
+
+from vpawvisualizelib.staging import StagingCache
+
+FILE_BYTES = 1000
+
+
+class StagingCacheTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.data_root = os.path.join(directory.name, "share", "data")
+        self.outside = os.path.join(directory.name, "local.nrrd")
+        self.cache = StagingCache(os.path.join(directory.name, "cache"), 10**6)
+
+    def write_subject(self, prefix, fill=b"x"):
+        filenames = []
+        for directory in ("images", "segmentations_computed"):
+            os.makedirs(os.path.join(self.data_root, directory), exist_ok=True)
+            filename = os.path.join(self.data_root, directory, prefix + "CT.nrrd")
+            with open(filename, "wb") as subject_file:
+                subject_file.write(fill * FILE_BYTES)
+            filenames.append(filename)
+        return filenames
+
+    def test_stage_copies_the_files_of_a_subject(self):
+        filenames = self.write_subject("1_")
+        subject_directory = self.cache.subject_directory(self.data_root, "1_")
+        staged = self.cache.stage(self.data_root, "1_", filenames)
+        assert staged == [
+            os.path.join(subject_directory, "images", "1_CT.nrrd"),
+            os.path.join(subject_directory, "segmentations_computed", "1_CT.nrrd"),
+        ]
+        for original, copy in zip(filenames, staged):
+            with open(original, "rb") as original_file, open(copy, "rb") as copy_file:
+                assert copy_file.read() == original_file.read()
+            assert os.stat(copy).st_mtime_ns == os.stat(original).st_mtime_ns
+
+    def test_files_outside_the_data_root_or_missing_are_not_staged(self):
+        filenames = self.write_subject("1_")
+        missing = os.path.join(self.data_root, "images", "1_missing.nrrd")
+        staged = self.cache.stage(
+            self.data_root, "1_", [self.outside, missing, filenames[0]],
+        )
+        assert staged[:2] == [self.outside, missing]
+        assert staged[2] != filenames[0]
+
+    def test_changed_files_are_staged_again(self):
+        filenames = self.write_subject("1_")
+        staged = self.cache.stage(self.data_root, "1_", filenames)
+        self.write_subject("1_", fill=b"y")
+        os.utime(filenames[0], (0, 0))
+        self.cache.stage(self.data_root, "1_", filenames)
+        with open(staged[0], "rb") as staged_file:
+            assert staged_file.read() == b"y" * FILE_BYTES
+
+    def test_least_recently_staged_subjects_are_evicted(self):
+        self.cache.max_bytes = 3 * 2 * FILE_BYTES
+        directories = dict()
+        for seconds, prefix in enumerate(("1_", "2_", "3_")):
+            self.cache.stage(self.data_root, prefix, self.write_subject(prefix))
+            directories[prefix] = self.cache.subject_directory(self.data_root, prefix)
+            os.utime(directories[prefix], (seconds, seconds))
+        # Staging a fourth subject evicts the least recently staged one
+        self.cache.stage(self.data_root, "4_", self.write_subject("4_"))
+        assert not os.path.exists(directories["1_"])
+        assert os.path.exists(directories["2_"])
+        # The current subject is kept even when the cache is over its size
+        self.cache.max_bytes = 0
+        removed = self.cache.evict()
+        assert sorted(removed) == [directories["2_"], directories["3_"]]
+        assert os.path.exists(self.cache.subject_directory(self.data_root, "4_"))
+
+    def test_prefetch_stages_without_changing_the_current_subject(self):
+        self.cache.stage(self.data_root, "1_", self.write_subject("1_"))
+        filenames = self.write_subject("2_")
+        self.cache.prefetch(self.data_root, "2_", lambda: filenames).join()
+        assert self.cache.current == self.cache.subject_directory(self.data_root, "1_")
+        assert not self.cache.prefetches
+        for directory in ("images", "segmentations_computed"):
+            assert os.path.exists(
+                os.path.join(
+                    self.cache.subject_directory(self.data_root, "2_"),
+                    directory,
+                    "2_CT.nrrd",
+                ),
+            )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,121 @@
+"""
+Tests of vpawvisualizelib.transcode, which writes uncompressed copies of NRRD files.
+"""
+
+import gzip
+import os
+import tempfile
+import unittest
+import zlib
+
+import numpy as np
+from vpawvisualizelib.transcode import (
+    fast_copy_filename,
+    is_transcodable,
+    prefer_fast_copies,
+    transcode_data_root,
+    transcode_file,
+)
+
+SIZES = (4, 3, 2)
+
+
+def nrrd_header(encoding):
+    return (
+        "NRRD0004\n# A comment\ntype: short\ndimension: 3\n"
+        + f"sizes: {' '.join(str(size) for size in SIZES)}\n"
+        + f"encoding: {encoding}\nendian: little\nkey:=value\n\n"
+    ).encode("ascii")
+
+
+def voxel_data():
+    return np.arange(np.prod(SIZES), dtype="<i2").tobytes()
+
+
+class TranscodeTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.data_root = os.path.join(directory.name, "data")
+        self.cache = os.path.join(directory.name, "cache")
+        os.makedirs(os.path.join(self.data_root, "images"))
+
+    def write_nrrd(self, basename, data, encoding="gzip"):
+        filename = os.path.join(self.data_root, "images", basename)
+        with open(filename, "wb") as nrrd_file:
+            nrrd_file.write(nrrd_header(encoding) + data)
+        return filename
+
+    def copy_filename(self, filename):
+        return fast_copy_filename(filename, self.data_root, self.cache)
+
+    def assert_raw_copy(self, filename):
+        with open(self.copy_filename(filename), "rb") as copy_file:
+            assert copy_file.read() == nrrd_header("raw") + voxel_data()
+        assert (
+            os.stat(self.copy_filename(filename)).st_mtime_ns
+            == os.stat(filename).st_mtime_ns
+        )
+
+    def test_transcode_file(self):
+        filename = self.write_nrrd("1_CT.nrrd", gzip.compress(voxel_data()))
+        timings = transcode_file(filename, self.copy_filename(filename))
+        assert timings["bytes"] == len(voxel_data())
+        self.assert_raw_copy(filename)
+
+    def test_multi_member_gzip(self):
+        data = voxel_data()
+        middle = len(data) // 2
+        filename = self.write_nrrd(
+            "1_CT.nrrd", gzip.compress(data[:middle]) + gzip.compress(data[middle:]),
+        )
+        transcode_file(filename, self.copy_filename(filename))
+        self.assert_raw_copy(filename)
+
+    def test_zlib_stream(self):
+        filename = self.write_nrrd("1_CT.nrrd", zlib.compress(voxel_data()))
+        transcode_file(filename, self.copy_filename(filename))
+        self.assert_raw_copy(filename)
+
+    def test_short_data_leaves_no_copy(self):
+        filename = self.write_nrrd("1_CT.nrrd", gzip.compress(voxel_data()[:-2]))
+        try:
+            transcode_file(filename, self.copy_filename(filename))
+        except ValueError:
+            pass
+        else:
+            self.fail("short data was transcoded")
+        assert os.listdir(os.path.dirname(self.copy_filename(filename))) == []
+
+    def test_is_transcodable(self):
+        assert is_transcodable(self.write_nrrd("1_CT.nrrd", gzip.compress(b"")))
+        assert not is_transcodable(self.write_nrrd("2_CT.nrrd", b"", "raw"))
+        assert not is_transcodable(
+            self.write_nrrd("1_CT.preview.nrrd", gzip.compress(b"")),
+        )
+
+    def test_transcode_data_root(self):
+        gzipped = self.write_nrrd("1_CT.nrrd", gzip.compress(voxel_data()))
+        raw = self.write_nrrd("1_raw.nrrd", voxel_data(), "raw")
+        other = self.write_nrrd("2_CT.nrrd", gzip.compress(voxel_data()))
+        broken = self.write_nrrd("1_broken.nrrd", b"not gzip")
+        response = transcode_data_root(self.data_root, "1_", self.cache)
+        assert response["transcoded"] == [self.copy_filename(gzipped)]
+        assert list(response["failed"]) == [broken]
+        assert response["bytes"] == len(voxel_data())
+        assert not os.path.exists(self.copy_filename(other))
+        response = transcode_data_root(self.data_root, "1_", self.cache)
+        assert response["up_to_date"] == [gzipped]
+        assert prefer_fast_copies(
+            [gzipped, raw, other], self.data_root, self.cache,
+        ) == [self.copy_filename(gzipped), raw, other]
+
+    def test_stale_copies_are_not_preferred(self):
+        filename = self.write_nrrd("1_CT.nrrd", gzip.compress(voxel_data()))
+        transcode_data_root(self.data_root, directory=self.cache)
+        os.utime(filename, (0, 0))
+        assert prefer_fast_copies([filename], self.data_root, self.cache) == [filename]
+
+
+if __name__ == "__main__":
+    unittest.main()
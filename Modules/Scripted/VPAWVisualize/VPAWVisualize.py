@@ -3,57 +3,107 @@ import numpy as np
 import os
 from pathlib import Path
 import pickle as pk
+import time
 import slicer
 import slicer.ScriptedLoadableModule
 import slicer.util
 import vtk
 import qt
 import ctk
+from vpawcommonlib.formatting import format_bytes
+from vpawcommonlib.patients import list_patient_prefixes
+from vpawcommonlib.profiling import profiled
+from vpawcommonlib.tracing import trace_vtk_events, traced
+from vpawvisualizelib.centerline import create_centerline_model, update_centerline_model
 from vpawvisualizelib.isosurfaces import isosurfaces_from_volume
-
-
-def summary_repr(contents):
+from vpawvisualizelib.memory import (
+    configured_memory_ledger,
+    format_node_memory,
+    resident_set_size,
+)
+from vpawvisualizelib.nodepool import (
+    CLONED_VOLUME,
+    IJK_TO_RAS_TRANSFORM,
+    NodePool,
+    file_kind,
+    read_into_node,
+)
+from vpawvisualizelib.p3arrays import (
+    P3_ARRAYS_EXTENSION,
+    convert_data_root,
+    prefer_p3_arrays,
+    read_p3_arrays,
+)
+from vpawvisualizelib.p3inspect import describe_p3_file
+from vpawvisualizelib.progressive import (
+    STRIDE_ATTRIBUTE,
+    full_resolution_ijk_to_ras,
+    full_resolution_spacing,
+    load_progressively,
+    preview_is_current,
+    readable_in_background,
+    without_previews,
+    write_preview,
+)
+from vpawvisualizelib.scene import (
+    batch_process_state,
+    batched_scene_updates,
+    count_events,
+    event_sources,
+    format_event_counts,
+)
+from vpawvisualizelib.staging import configured_staging_cache
+from vpawvisualizelib.transcode import (
+    format_throughput,
+    prefer_fast_copies,
+    transcode_data_root,
+)
+
+# Subdirectory of a data root for results computed by VPAWVisualizeLogic.precomputeSubject
+PRECOMPUTED_DIRECTORY = "precomputed"
+# The VPAWVisualizeLogic attribute that holds the node loaded from each directory
+ROLE_BY_DIRECTORY = dict(
+    sols="laplace_sol_node",
+    images="input_image_node",
+    centerline="centerline_node",
+    segmentations_computed="segmentation_node",
+    laplace_masked="laplace_sol_masked_node",
+    isosurfaces="laplace_isosurface_node",
+)
+# The directories of the files that precomputed results are computed from
+PRECOMPUTED_INPUT_DIRECTORIES = ("sols", "segmentations_computed")
+
+
+def without_stale_precomputed(filenames, dataDirectory):
     """
-    Like Python `repr`, returns a string representing the contents.  However, numpy
-    arrays are summarized as their shape and unknown types are summarized by their type.
-
-    Parameters
-    ----------
-    contents : Python object
-
-    Returns
-    -------
-    A string representation of a summary of the object
+    Return filenames without the files under dataDirectory/precomputed/ that are older
+    than one of the listed files they are computed from, e.g., because the pipeline
+    was run again for the subject, so that they are computed again instead.
     """
-    if isinstance(contents, list):
-        return "[" + ", ".join([summary_repr(elem) for elem in contents]) + "]"
-    elif isinstance(contents, tuple):
-        if len(contents) == 1:
-            return "(" + summary_repr(contents[0]) + ",)"
-        else:
-            return "(" + ", ".join([summary_repr(elem) for elem in contents]) + ")"
-    elif isinstance(contents, dict):
-        return (
-            "{"
-            + ", ".join(
-                [
-                    summary_repr(key) + ": " + summary_repr(value)
-                    for (key, value) in contents.items()
-                ],
-            )
-            + "}"
-        )
-    elif isinstance(contents, set):
-        if len(contents) == 0:
-            return repr(set())
-        else:
-            return "{" + ", ".join([summary_repr(elem) for elem in contents]) + "}"
-    elif isinstance(contents, (int, float, np.float32, np.float64, bool, str)):
-        return repr(contents)
-    elif isinstance(contents, np.ndarray):
-        return repr(type(contents)) + ".shape=" + summary_repr(contents.shape)
-    else:
-        return repr(type(contents))
+    precomputed_dir = os.path.join(
+        os.path.abspath(dataDirectory), PRECOMPUTED_DIRECTORY,
+    )
+    inputs_mtime = max(
+        (
+            os.path.getmtime(filename)
+            for filename in filenames
+            if Path(filename).parent.name in PRECOMPUTED_INPUT_DIRECTORIES
+            and not os.path.abspath(filename).startswith(precomputed_dir + os.sep)
+        ),
+        default=None,
+    )
+    if inputs_mtime is None:
+        return list(filenames)
+    response = []
+    for filename in filenames:
+        if (
+            os.path.abspath(filename).startswith(precomputed_dir + os.sep)
+            and os.path.getmtime(filename) < inputs_mtime
+        ):
+            logging.warning(f"Ignoring {filename}, which is older than its inputs")
+            continue
+        response.append(filename)
+    return response
 
 
 #
@@ -71,8 +121,8 @@ class VPAWVisualize(slicer.ScriptedLoadableModule.ScriptedLoadableModule):
         slicer.ScriptedLoadableModule.ScriptedLoadableModule.__init__(self, parent)
         self.parent.title = "VPAW Visualize"
         self.parent.categories = ["VPAW"]
-        # TODO: add here list of module names that this module requires
-        self.parent.dependencies = []
+        # VPAWCommon provides vpawcommonlib
+        self.parent.dependencies = ["VPAWCommon"]
         self.parent.contributors = [
             "Andinet Enquobahrie (Kitware, Inc.)",
             "Shreeraj Jadhav (Kitware, Inc.)",
@@ -140,6 +190,7 @@ class VPAWVisualizeWidget(
         self._parameterNode = None
         self._updatingGUIFromParameterNode = False
 
+    @profiled
     def setup(self):
         """
         Called when the user opens the module the first time and the widget is
@@ -167,6 +218,12 @@ class VPAWVisualizeWidget(
         viewNode.SetOrientationMarkerType(
             slicer.vtkMRMLAbstractViewNode.OrientationMarkerTypeAxes,
         )
+        # If tracing is on, record each render of the 3D view
+        trace_vtk_events(
+            slicer.app.layoutManager().threeDWidget(0).threeDView().renderWindow(),
+            "render 3D view",
+            "render",
+        )
 
         # Create logic class.  Logic implements all computations that should be possible
         # to run in batch mode, without a graphical user interface.
@@ -193,15 +250,30 @@ class VPAWVisualizeWidget(
         self.ui.DataDirectory.connect(
             "validInputChanged(bool)", self.updateParameterNodeFromGUI,
         )
+        self.ui.reuseNodesCheckBox.connect(
+            "toggled(bool)", self.updateParameterNodeFromGUI,
+        )
+        self.ui.centerlineAsModelCheckBox.connect(
+            "toggled(bool)", self.updateParameterNodeFromGUI,
+        )
+        self.ui.progressiveLoadingCheckBox.connect(
+            "toggled(bool)", self.updateParameterNodeFromGUI,
+        )
 
         # Buttons
         self.ui.HomeButton.connect("clicked(bool)", self.onHomeButton)
         self.ui.VPAWModelButton.connect("clicked(bool)", self.onVPAWModelButton)
         self.ui.showButton.connect("clicked(bool)", self.onShowButton)
+        self.ui.convertP3FilesButton.connect(
+            "clicked(bool)", self.onConvertP3FilesButton,
+        )
         self.ui.computeIsosurfacesButton.connect(
             "clicked(bool)", self.onComputeIsosurfacesButton,
         )
         self.updateComputeIsosurfacesButtonEnabledness()
+        self.ui.refreshDiagnosticsButton.connect(
+            "clicked(bool)", self.updateDiagnostics,
+        )
 
         # Sliders
         self.ui.segmentationOpacitySlider.connect(
@@ -225,6 +297,7 @@ class VPAWVisualizeWidget(
         """
         self.removeObservers()
 
+    @profiled
     def enter(self):
         """
         Called each time the user opens this module.
@@ -320,6 +393,15 @@ class VPAWVisualizeWidget(
             "DataDirectory",
         )
         self.ui.PatientPrefix.text = self._parameterNode.GetParameter("PatientPrefix")
+        self.ui.reuseNodesCheckBox.checked = (
+            self._parameterNode.GetParameter("ReuseNodes") == "true"
+        )
+        self.ui.centerlineAsModelCheckBox.checked = (
+            self._parameterNode.GetParameter("CenterlineAsModel") == "true"
+        )
+        self.ui.progressiveLoadingCheckBox.checked = (
+            self._parameterNode.GetParameter("ProgressiveLoading") == "true"
+        )
 
         # Update buttons states and tooltips
         if (
@@ -343,6 +425,23 @@ class VPAWVisualizeWidget(
                 "data directory and patient prefix."
             )
             self.ui.showButton.enabled = False
+        if os.path.isdir(self.ui.DataDirectory.currentPath):
+            self.ui.convertP3FilesButton.toolTip = (
+                "Write a memory-mappable .p3.npz copy of each .p3 file in"
+                + f" {self.ui.DataDirectory.currentPath!r}"
+                + (
+                    f" with prefix {self.ui.PatientPrefix.text!r}"
+                    if self.ui.PatientPrefix.text != ""
+                    else ""
+                )
+                + ", which Show then reads instead"
+            )
+            self.ui.convertP3FilesButton.enabled = True
+        else:
+            self.ui.convertP3FilesButton.toolTip = (
+                "Conversion is disabled; first select a valid data directory."
+            )
+            self.ui.convertP3FilesButton.enabled = False
 
         # All the GUI updates are done
         self._updatingGUIFromParameterNode = False
@@ -363,6 +462,17 @@ class VPAWVisualizeWidget(
             "DataDirectory", self.ui.DataDirectory.currentPath,
         )
         self._parameterNode.SetParameter("PatientPrefix", self.ui.PatientPrefix.text)
+        self._parameterNode.SetParameter(
+            "ReuseNodes", "true" if self.ui.reuseNodesCheckBox.checked else "false",
+        )
+        self._parameterNode.SetParameter(
+            "CenterlineAsModel",
+            "true" if self.ui.centerlineAsModelCheckBox.checked else "false",
+        )
+        self._parameterNode.SetParameter(
+            "ProgressiveLoading",
+            "true" if self.ui.progressiveLoadingCheckBox.checked else "false",
+        )
 
         self._parameterNode.EndModify(wasModified)
 
@@ -385,6 +495,8 @@ class VPAWVisualizeWidget(
         """
         slicer.util.selectModule("VPAWModel")
 
+    @profiled
+    @traced
     def onShowButton(self):
         """
         When the user clicks the Show button, find the requested files and load them in
@@ -400,16 +512,59 @@ class VPAWVisualizeWidget(
             )
             if len(list_of_files) == 0:
                 raise FileNotFoundError("No patient found with the given prefix.")
+            list_of_files = self.logic.stageSubject(
+                self.ui.DataDirectory.currentPath,
+                self.ui.PatientPrefix.text,
+                list_of_files,
+            )
+            self.logic.reuse_nodes = self.ui.reuseNodesCheckBox.checked
+            self.logic.centerline_as_model = self.ui.centerlineAsModelCheckBox.checked
+            self.logic.progressive_loading = self.ui.progressiveLoadingCheckBox.checked
             self.logic.clearSubject()
             self.logic.loadNodesToSubjectHierarchy(
                 list_of_files, self.ui.PatientPrefix.text,
             )
+            # The tree was refreshed once, at the end of loading
+            header = self.ui.subjectHierarchyTree.header()
+            header.resizeSections(header.ResizeToContents)
             self.logic.arrangeView()
             self.updateComputeIsosurfacesButtonEnabledness()
             self.onSegmentationOpacitySliderValueChanged(
                 self.ui.segmentationOpacitySlider.value,
             )
+            self.updateDiagnostics()
+            self.logic.prefetchNextSubject(
+                self.ui.DataDirectory.currentPath, self.ui.PatientPrefix.text,
+            )
 
+    def onConvertP3FilesButton(self):
+        """
+        Convert the P3 files of the data directory, or of the patient if a prefix is
+        given, to the .p3.npz format.
+        """
+        response = None
+        with slicer.util.tryWithErrorDisplay(
+            "Failed to convert P3 files.", waitCursor=True,
+        ):
+            response = self.logic.convertP3Files(
+                self.ui.DataDirectory.currentPath, self.ui.PatientPrefix.text,
+            )
+        if response is None:
+            # The error has been displayed
+            return
+        slicer.util.infoDisplay(
+            f"Converted {len(response['converted'])} P3 files;"
+            + f" {len(response['up_to_date'])} were already converted and"
+            + f" {len(response['failed'])} could not be converted.",
+            windowTitle="Convert P3 files",
+            detailedText="\n".join(
+                f"{filename}: {reason}"
+                for filename, reason in response["failed"].items()
+            ),
+        )
+
+    @profiled
+    @traced
     def onComputeIsosurfacesButton(self):
         """
         Compute isosurfaces of the laplace sol'n image
@@ -433,11 +588,18 @@ class VPAWVisualizeWidget(
                 self.logic.compute_isosurfaces(
                     self.ui.numberOfIsosurfaceValues.value, progress_callback,
                 )
+                self.updateDiagnostics()
             finally:
                 # revert to showing button
                 self.ui.computeIsosurfacesStackedWidget.setCurrentIndex(0)
                 self.updateComputeIsosurfacesButtonEnabledness()
 
+    def updateDiagnostics(self):
+        """
+        Show the memory used by the current subject in the Diagnostics panel.
+        """
+        self.ui.memoryDiagnosticsText.setPlainText(self.logic.memoryReport())
+
     def onSegmentationOpacitySliderValueChanged(self, value: int):
         self.logic.set_segmentation_node_opacity(
             value / self.ui.segmentationOpacitySlider.maximum,
@@ -484,6 +646,21 @@ class VPAWVisualizeLogic(slicer.ScriptedLoadableModule.ScriptedLoadableModuleLog
         member variables.
         """
         slicer.ScriptedLoadableModule.ScriptedLoadableModuleLogic.__init__(self)
+        # Whether switching subjects reads the next subject's data into the nodes of
+        # the current one, rather than removing them and creating new ones
+        self.reuse_nodes = False
+        # Whether loading a subject runs in the scene's batch-process state; set to
+        # False to compare the load times and event counts that are logged
+        self.batch_scene_updates = True
+        # Whether centerlines are loaded as polyline models rather than markups curves,
+        # which are slow to draw and interact with when the centerline is dense
+        self.centerline_as_model = False
+        # Whether the input image is shown as a low-resolution preview until it has
+        # been read
+        self.progressive_loading = False
+        self.node_pool = NodePool()
+        # Local copies of subjects' files, if a staging directory is configured
+        self.staging_cache = configured_staging_cache()
         self.clearSubject()
 
     def setDefaultParameters(self, parameterNode):
@@ -494,6 +671,12 @@ class VPAWVisualizeLogic(slicer.ScriptedLoadableModule.ScriptedLoadableModuleLog
             parameterNode.SetParameter("Threshold", "100.0")
         if not parameterNode.GetParameter("Invert"):
             parameterNode.SetParameter("Invert", "false")
+        if not parameterNode.GetParameter("ReuseNodes"):
+            parameterNode.SetParameter("ReuseNodes", "false")
+        if not parameterNode.GetParameter("CenterlineAsModel"):
+            parameterNode.SetParameter("CenterlineAsModel", "false")
+        if not parameterNode.GetParameter("ProgressiveLoading"):
+            parameterNode.SetParameter("ProgressiveLoading", "false")
 
     def find_files_with_prefix(self, path, prefix, include_subjectless=False):
         """
@@ -549,6 +732,7 @@ class VPAWVisualizeLogic(slicer.ScriptedLoadableModule.ScriptedLoadableModuleLog
             ]
         return response
 
+    @traced
     def find_and_sort_files_with_prefix(self, dataDirectory, patientPrefix):
         """
         Find all file names within `path` recursively that start with `prefix`, and sort
@@ -579,8 +763,6 @@ class VPAWVisualizeLogic(slicer.ScriptedLoadableModule.ScriptedLoadableModuleLog
         if patientPrefix is None:
             patientPrefix = ""
 
-        import time
-
         startTime = time.time()
         logging.info("Processing started")
 
@@ -591,13 +773,74 @@ class VPAWVisualizeLogic(slicer.ScriptedLoadableModule.ScriptedLoadableModuleLog
         list_of_records.sort(key=lambda record: record[1])
         # Remove modification times
         list_of_files = [record[0] for record in list_of_records]
+        # Read converted P3 files instead of the originals
+        list_of_files = prefer_p3_arrays(list_of_files)
+        # Precomputed results of earlier pipeline runs are computed again
+        list_of_files = without_stale_precomputed(list_of_files, dataDirectory)
+        # Previews are loaded only in place of their images
+        list_of_files = without_previews(list_of_files)
+        # Read uncompressed copies of volumes instead of the originals
+        list_of_files = prefer_fast_copies(list_of_files, dataDirectory)
 
         stopTime = time.time()
         logging.info(f"Processing completed in {stopTime-startTime:.2f} seconds")
 
         return list_of_files
 
-    def loadFromP3File(self, filename, properties):
+    @traced
+    def stageSubject(self, dataDirectory, patientPrefix, list_of_files):
+        """
+        Copy the files of a subject to the staging cache, if there is one, so that they
+        are loaded from local disk; see vpawvisualizelib.staging.
+
+        Parameters
+        ----------
+        dataDirectory : str
+            The data root
+        patientPrefix : str
+            The subject's prefix
+        list_of_files : list of str
+            The subject's files, as found by find_and_sort_files_with_prefix
+
+        Returns
+        -------
+        The files to load, in the same order: the staged copies, or the originals if
+        there is no staging cache
+        """
+        if self.staging_cache is None:
+            return list_of_files
+        return self.staging_cache.stage(dataDirectory, patientPrefix, list_of_files)
+
+    def prefetchSubject(self, dataDirectory, patientPrefix):
+        """
+        Stage the files of a subject in the background, if there is a staging cache, so
+        that showing the subject later does not wait for the network.  Returns the
+        background thread, or None.
+        """
+        if self.staging_cache is None or not patientPrefix:
+            return None
+        return self.staging_cache.prefetch(
+            dataDirectory,
+            patientPrefix,
+            lambda: self.find_and_sort_files_with_prefix(dataDirectory, patientPrefix),
+        )
+
+    def prefetchNextSubject(self, dataDirectory, patientPrefix):
+        """
+        Prefetch the patient after patientPrefix in the images/ directory of the data
+        root, the one most likely to be shown next.  Returns the background thread, or
+        None.
+        """
+        if self.staging_cache is None:
+            return None
+        try:
+            prefixes = list_patient_prefixes(dataDirectory)
+        except OSError:
+            return None
+        later = [prefix for prefix in prefixes if prefix > patientPrefix]
+        return self.prefetchSubject(dataDirectory, later[0]) if later else None
+
+    def loadFromP3File(self, filename, properties, node=None):
         """
         Load a node based upon a P3 file, in lieu of a 3D Slicer "slicer.util.load*"
         function.
@@ -609,41 +852,72 @@ class VPAWVisualizeLogic(slicer.ScriptedLoadableModule.ScriptedLoadableModuleLog
         properties : dict
             A dictionary of properties that otherwise would be passed to most
             slicer.util.load* functions, but in this case is parsed for anything useful
+        node : vtkMRMLNode
+            If given, a node of the right type whose data is replaced, rather than a new
+            node being created
 
         Returns
         -------
         A 3D Slicer node object representing the data
         """
-        with open(filename, "rb") as f:
-            contents = pk.load(f)
-
-        if Path(filename).parent.stem == "centerline":
-            return self.loadCenterlineFromP3FileContents(contents)
-
-        print(f"File type for {filename} is not currently supported")
-        print(f"{filename} contains {summary_repr(contents)}")
+        if Path(filename).parent.stem != "centerline":
+            # Describe the contents without loading them; the description is cached
+            # until the file changes
+            print(f"File type for {filename} is not currently supported")
+            try:
+                print(f"{filename} contains {describe_p3_file(filename)}")
+            except (OSError, ValueError) as e:
+                print(f"Unable to inspect {filename}: {e}")
+            return None
+
+        if filename.endswith(P3_ARRAYS_EXTENSION):
+            # Arrays are memory-mapped, so only what is used is read
+            contents = read_p3_arrays(filename)
+        else:
+            with open(filename, "rb") as f:
+                contents = pk.load(f)
 
-        return None
+        return self.loadCenterlineFromP3FileContents(contents, node)
 
-    def loadCenterlineFromP3FileContents(self, contents):
+    def loadCenterlineFromP3FileContents(self, contents, centerline_node=None):
         """
         Load a centerline using the data object written into a P3 file named
         "####_CENTERLINE.p3"
 
         Parameters
         ----------
-        contents : a pair of arrays (centerline_points, centerline_normals).  Currently
-            we only use centerline_points, piecing them together into a curve node.
+        contents : a pair of arrays (centerline_points, centerline_normals).  For a
+            curve node only centerline_points is used, piecing them together into a
+            curve.  If self.centerline_as_model, they are instead a polyline model with
+            the normals as point data; see vpawvisualizelib.centerline.
+        centerline_node : vtkMRMLMarkupsCurveNode or vtkMRMLModelNode
+            If given, an existing centerline whose points are replaced
 
         Returns
         -------
-        A vtkMRMLMarkupsCurveNode
+        A vtkMRMLMarkupsCurveNode, or a vtkMRMLModelNode if self.centerline_as_model
         """
         centerline_points, centerline_normals = contents
 
         # The axis ordering is not IJK to begin with, hence this permuation
         centerline_points = centerline_points[:, [2, 1, 0]]
 
+        if self.centerline_as_model:
+            centerline_normals = centerline_normals[:, [2, 1, 0]]
+            if centerline_node is None:
+                return create_centerline_model(centerline_points, centerline_normals)
+            update_centerline_model(
+                centerline_node, centerline_points, centerline_normals,
+            )
+            return centerline_node
+
+        if centerline_node is not None:
+            # Its display properties were set when it was created
+            slicer.util.updateMarkupsControlPointsFromArray(
+                centerline_node, centerline_points,
+            )
+            return centerline_node
+
         centerline_node = slicer.mrmlScene.AddNewNodeByClass("vtkMRMLMarkupsCurveNode")
         centerline_node.SetName("Centerline")
         slicer.util.updateMarkupsControlPointsFromArray(
@@ -657,6 +931,7 @@ class VPAWVisualizeLogic(slicer.ScriptedLoadableModule.ScriptedLoadableModuleLog
         centerline_node.GetDisplayNode().SetPropertiesLabelVisibility(False)
         return centerline_node
 
+    @traced
     def loadOneNode(self, filename, basename_repr, props):
         """
         Create a 3D Slicer node object for the data in a file
@@ -680,15 +955,15 @@ class VPAWVisualizeLogic(slicer.ScriptedLoadableModule.ScriptedLoadableModuleLog
         # before checking for ".nrrd".
         if filename.endswith(".seg.nrrd"):
             node = slicer.util.loadSegmentation(filename, properties=props)
-            node.CreateClosedSurfaceRepresentation()
+            self.create_closed_surface(node)
         elif filename.endswith(".nrrd"):
             directory = os.path.basename(os.path.dirname(filename))
             if directory == "images":
-                node = slicer.util.loadVolume(filename, properties=props)
+                node = self.loadInputImage(filename, props)
                 self.show_nodes.append(node)
             elif directory == "segmentations_computed":
                 node = slicer.util.loadSegmentation(filename, properties=props)
-                node.CreateClosedSurfaceRepresentation()
+                self.create_closed_surface(node)
             else:
                 # Guess
                 node = slicer.util.loadVolume(filename, properties=props)
@@ -698,8 +973,10 @@ class VPAWVisualizeLogic(slicer.ScriptedLoadableModule.ScriptedLoadableModuleLog
             node.LockedOn()  # don't allow mouse interaction to move control points
         elif filename.endswith(".mha") or filename.endswith(".png"):
             node = slicer.util.loadVolume(filename, properties=props)
-        elif filename.endswith(".p3"):
+        elif filename.endswith(".p3") or filename.endswith(".p3.npz"):
             node = self.loadFromP3File(filename, properties=props)
+        elif filename.endswith(".vtk") or filename.endswith(".vtp"):
+            node = slicer.util.loadNodeFromFile(filename, "ModelFile", props)
         elif filename.endswith(".xls"):
             print(f"File type for {basename_repr} is not currently supported")
             node = None
@@ -708,6 +985,51 @@ class VPAWVisualizeLogic(slicer.ScriptedLoadableModule.ScriptedLoadableModuleLog
             node = None
         return node
 
+    def loadInputImage(self, filename, props):
+        """
+        Load the input image.  If self.progressive_loading, its low-resolution preview
+        is shown at once and replaced by the full image once that has been read in the
+        background; see vpawvisualizelib.progressive.
+
+        Parameters
+        ----------
+        filename : str
+            The image file
+        props : dict
+            Properties for slicer.util.loadVolume
+
+        Returns
+        -------
+        A vtkMRMLScalarVolumeNode
+        """
+        if not self.progressive_loading:
+            return slicer.util.loadVolume(filename, properties=props)
+        if preview_is_current(filename) and readable_in_background(filename):
+            return load_progressively(
+                filename,
+                props,
+                on_loaded=lambda node: logging.info(
+                    f"Replaced the preview of {filename} with the full image",
+                ),
+            )
+        node = slicer.util.loadVolume(filename, properties=props)
+        try:
+            # For the next time that the image is loaded
+            write_preview(node, filename)
+        except (OSError, ValueError) as e:
+            logging.warning(f"Unable to write a preview of {filename}: {e}")
+        return node
+
+    def create_closed_surface(self, segmentationNode):
+        """
+        Create the closed surface representation of a segmentation node, recording the
+        memory that it uses.
+        """
+        with self.memory_ledger.stage(
+            "CreateClosedSurfaceRepresentation", segmentationNode.GetName(),
+        ):
+            segmentationNode.CreateClosedSurfaceRepresentation()
+
     def clearSubject(self):
         """
         Set VPAWVisualizeLogic to initial state before any subject was loaded, and clear
@@ -723,14 +1045,35 @@ class VPAWVisualizeLogic(slicer.ScriptedLoadableModule.ScriptedLoadableModuleLog
         self.laplace_sol_node = None
         self.laplace_sol_masked_node = None
         self.laplace_isosurface_node = None
+        # The memory used by each stage of loading and processing this subject, if
+        # memory accounting is enabled; see vpawvisualizelib.memory
+        self.memory_ledger = configured_memory_ledger()
         self.clearSubjectHierarchy()
 
     def clearSubjectHierarchy(self):
         """
-        Remove all nodes from the 3D Slicer subject hierarchy
+        Remove all nodes from the 3D Slicer subject hierarchy, except the pooled nodes if
+        nodes are reused, which are moved to the top level to await the next subject.
         """
-        slicer.mrmlScene.GetSubjectHierarchyNode().RemoveAllItems(True)
+        shNode = slicer.mrmlScene.GetSubjectHierarchyNode()
         self.show_nodes = list()
+        if not self.reuse_nodes:
+            shNode.RemoveAllItems(True)
+            self.node_pool.clear()
+            return
+        sceneItem = shNode.GetSceneItemID()
+        pooledItems = set()
+        with batch_process_state():
+            for node in self.node_pool.nodes():
+                item = shNode.GetItemByDataNode(node)
+                if item != shNode.GetInvalidItemID():
+                    shNode.SetItemParent(item, sceneItem)
+                    pooledItems.add(item)
+            itemIds = vtk.vtkIdList()
+            shNode.GetItemChildren(sceneItem, itemIds, False)
+            for index in range(itemIds.GetNumberOfIds()):
+                if itemIds.GetId(index) not in pooledItems:
+                    shNode.RemoveItem(itemIds.GetId(index), True, True)
 
     def subjectIsCurrentlyLoaded(self) -> bool:
         """
@@ -772,22 +1115,63 @@ class VPAWVisualizeLogic(slicer.ScriptedLoadableModule.ScriptedLoadableModuleLog
         basename_repr = repr(basename)
         props = {"name": basename, "singleFile": True, "show": False}
 
-        node = self.loadOneNode(filename, basename_repr, props)
+        role = ROLE_BY_DIRECTORY.get(Path(filename).parent.stem)
+        pooled = self.reuse_nodes and role is not None
+        with self.memory_ledger.stage("loadOneNode", basename):
+            node = self.reloadPooledNode(role, filename) if pooled else None
+            if node is None:
+                node = self.loadOneNode(filename, basename_repr, props)
+                if pooled and node is not None:
+                    self.node_pool.add(role, self.pooledNodeKind(role, filename), node)
         if node is None:
             return
 
-        dirname = Path(filename).parent.stem
-        if dirname == "sols":
-            self.laplace_sol_node = node
-        elif dirname == "images":
-            self.input_image_node = node
-        elif dirname == "centerline":
-            self.centerline_node = node
-        elif dirname == "segmentations_computed":
-            self.segmentation_node = node
+        if role is not None:
+            setattr(self, role, node)
 
         self.put_node_under_subject(node)
 
+    def pooledNodeKind(self, role, filename):
+        """
+        Return the kind of the node that a file is loaded into, so that a pooled node
+        is reused only for the same kind; see vpawvisualizelib.nodepool.
+        """
+        if role == "centerline_node" and self.centerline_as_model:
+            return file_kind(filename) + " model"
+        return file_kind(filename)
+
+    def reloadPooledNode(self, role, filename):
+        """
+        Read a file into the pooled node for its role, if there is one that was loaded
+        from the same kind of file.
+
+        Parameters
+        ----------
+        role : str
+            The VPAWVisualizeLogic attribute for the node, e.g., "laplace_sol_node"
+        filename : str
+            The data source for the node
+
+        Returns
+        -------
+        The pooled node, or None if there is none to reuse
+        """
+        node = self.node_pool.node(role, self.pooledNodeKind(role, filename))
+        if node is None:
+            return None
+        if filename.endswith(".p3") or filename.endswith(".p3.npz"):
+            self.loadFromP3File(filename, properties=dict(), node=node)
+        else:
+            read_into_node(node, filename)
+            # The full image was read, even if the node showed a preview before
+            node.RemoveAttribute(STRIDE_ATTRIBUTE)
+            if node.IsA("vtkMRMLSegmentationNode"):
+                self.create_closed_surface(node)
+        if role == "input_image_node":
+            self.show_nodes.append(node)
+        return node
+
+    @traced
     def loadNodesToSubjectHierarchy(self, list_of_files, subject_name):
         """
         Load data from files into nodes and put the nodes in the 3D Slicer subject
@@ -800,6 +1184,29 @@ class VPAWVisualizeLogic(slicer.ScriptedLoadableModule.ScriptedLoadableModuleLog
         subject_name : str
             Name for folder in subject hierarchy to contain the nodes
         """
+        batched = self.batch_scene_updates or self.reuse_nodes
+        startTime = time.perf_counter()
+        # Every step below fires scene events, so the scene is kept in its
+        # batch-process state with rendering paused, and the tree views and views are
+        # updated once, at the end.  Pooled nodes also show the previous subject until
+        # their data is replaced.
+        with count_events(event_sources()) as eventCounts, batched_scene_updates(
+            batched,
+        ):
+            self.populateSubjectHierarchy(list_of_files, subject_name)
+        logging.info(
+            f"Loaded subject {subject_name} in {time.perf_counter() - startTime:.2f} s"
+            + f" with {'batched' if batched else 'unbatched'} scene"
+            + f" updates, {format_event_counts(eventCounts)}",
+        )
+        if self.memory_ledger.enabled:
+            logging.info(f"Memory of subject {subject_name}:\n" + self.memoryReport())
+
+    def populateSubjectHierarchy(self, list_of_files, subject_name):
+        """
+        Create the subject item, load the files into nodes under it, derive the nodes
+        computed from them, and show them all.  See loadNodesToSubjectHierarchy.
+        """
         self.subject_id = subject_name
 
         # The subject hierarchy node can contain subject (patient), study (optionally),
@@ -811,20 +1218,19 @@ class VPAWVisualizeLogic(slicer.ScriptedLoadableModule.ScriptedLoadableModuleLog
             shNode.GetSceneItemID(), subject_name,
         )
 
-        # slicer knows how to find the subject hierarchy tree view.
-        shTV = slicer.qMRMLSubjectHierarchyTreeView()
-        # Tell the subject hierarchy tree view about its enclosing scene.
-        shTV.setMRMLScene(slicer.mrmlScene)
-        # Tell the subject hierarchy tree view that its root item is the subject item.
-        shTV.setRootItem(self.subject_item_id)
-
+        self.node_pool.begin_subject()
         for filename in list_of_files:
             self.loadOneNodeToSubjectHierarchy(shNode, self.subject_item_id, filename)
 
         # further processing that can occur now that all nodes are loaded
         self.create_input_ijk2ras_as_node()
         self.fix_image_origins_and_spacings()
-        self.restrict_laplace_sol_to_segmentation()
+        if self.laplace_sol_masked_node is None:
+            # It was not precomputed
+            with self.memory_ledger.stage("restrict_laplace_sol_to_segmentation"):
+                self.restrict_laplace_sol_to_segmentation()
+        if self.reuse_nodes:
+            self.node_pool.release_unused()
 
         # Recursively set visibility and expanded properties of each item
         def recurseVisibility(item, visibility, expanded):
@@ -845,11 +1251,34 @@ class VPAWVisualizeLogic(slicer.ScriptedLoadableModule.ScriptedLoadableModuleLog
 
         recurseVisibility(self.subject_item_id, True, True)
 
-        # Resize columns of the SubjectHierarchyTreeView
-        shTV.header().resizeSections(shTV.header().ResizeToContents)
-        # Force re-displaying of the SubjectHierarchyTreeView
-        slicer.mrmlScene.StartState(slicer.vtkMRMLScene.ImportState)
-        slicer.mrmlScene.EndState(slicer.vtkMRMLScene.ImportState)
+    def subjectNodes(self):
+        """
+        Return the data nodes under the currently loaded subject in the subject
+        hierarchy.
+        """
+        if self.subject_item_id is None:
+            return []
+        shNode = slicer.mrmlScene.GetSubjectHierarchyNode()
+        itemIds = vtk.vtkIdList()
+        shNode.GetItemChildren(self.subject_item_id, itemIds, True)
+        nodes = [
+            shNode.GetItemDataNode(itemIds.GetId(index))
+            for index in range(itemIds.GetNumberOfIds())
+        ]
+        return [node for node in nodes if node is not None]
+
+    def memoryReport(self):
+        """
+        Return text describing the memory used by each stage of loading and processing
+        the current subject, and the memory held by each of its nodes.
+        """
+        return (
+            f"3D Slicer RSS: {format_bytes(resident_set_size())}\n"
+            + "\nStages:\n"
+            + self.memory_ledger.format()
+            + "\n\nNodes:\n"
+            + format_node_memory(self.subjectNodes())
+        )
 
     def create_input_ijk2ras_as_node(self):
         """
@@ -857,14 +1286,28 @@ class VPAWVisualizeLogic(slicer.ScriptedLoadableModule.ScriptedLoadableModuleLog
         """
         if self.input_image_node is None:
             raise RuntimeError("Could not find input image node.")
-        ijkToRas = vtk.vtkMatrix4x4()
-        self.input_image_node.GetIJKToRASMatrix(ijkToRas)
-        ijkToRas_node = slicer.mrmlScene.AddNewNodeByClass("vtkMRMLLinearTransformNode")
+        # The centerline is in the voxel coordinates of the full image, even if a
+        # preview of it is shown for now
+        ijkToRas = full_resolution_ijk_to_ras(self.input_image_node)
+        ijkToRas_node = (
+            self.node_pool.node("input_ijk_to_ras", IJK_TO_RAS_TRANSFORM)
+            if self.reuse_nodes
+            else None
+        )
+        if ijkToRas_node is None:
+            ijkToRas_node = slicer.mrmlScene.AddNewNodeByClass(
+                "vtkMRMLLinearTransformNode",
+            )
+            if self.reuse_nodes:
+                self.node_pool.add(
+                    "input_ijk_to_ras", IJK_TO_RAS_TRANSFORM, ijkToRas_node,
+                )
         ijkToRas_node.SetName(f"{self.input_image_node.GetName()}_IJK_to_RAS")
         ijkToRas_node.SetMatrixTransformToParent(ijkToRas)
         self.put_node_under_subject(ijkToRas_node)
         self.input_ijk_to_ras = ijkToRas_node
 
+    @traced
     def fix_image_origins_and_spacings(self):
         """
         Some nodes rely on others for origin and spacing info, because it wasn't
@@ -881,10 +1324,11 @@ class VPAWVisualizeLogic(slicer.ScriptedLoadableModule.ScriptedLoadableModuleLog
             raise RuntimeError("Could not find centerline node.")
 
         self.laplace_sol_node.SetOrigin(self.input_image_node.GetOrigin())
-        self.laplace_sol_node.SetSpacing(self.input_image_node.GetSpacing())
+        self.laplace_sol_node.SetSpacing(full_resolution_spacing(self.input_image_node))
 
         self.centerline_node.SetAndObserveTransformNodeID(self.input_ijk_to_ras.GetID())
 
+    @traced
     def restrict_laplace_sol_to_segmentation(self):
         """
         If the laplace solution and the segmentation node both exist, mask the laplace
@@ -911,14 +1355,28 @@ class VPAWVisualizeLogic(slicer.ScriptedLoadableModule.ScriptedLoadableModuleLog
         sol_masked_array = np.copy(sol_array)
         sol_masked_array[seg_array == 0] = np.nan
 
-        sol_masked_node = slicer.modules.volumes.logic().CloneVolume(
-            self.laplace_sol_node,
-            self.laplace_sol_node.GetName() + "_restrictedToSegmentation",
+        sol_masked_name = self.laplace_sol_node.GetName() + "_restrictedToSegmentation"
+        sol_masked_node = (
+            self.node_pool.node("laplace_sol_masked_node", CLONED_VOLUME)
+            if self.reuse_nodes
+            else None
         )
+        if sol_masked_node is None:
+            sol_masked_node = slicer.modules.volumes.logic().CloneVolume(
+                self.laplace_sol_node, sol_masked_name,
+            )
+            if self.reuse_nodes:
+                self.node_pool.add(
+                    "laplace_sol_masked_node", CLONED_VOLUME, sol_masked_node,
+                )
+        else:
+            sol_masked_node.SetName(sol_masked_name)
+            sol_masked_node.CopyOrientation(self.laplace_sol_node)
         slicer.util.updateVolumeFromArray(sol_masked_node, sol_masked_array)
         self.put_node_under_subject(sol_masked_node)
         self.laplace_sol_masked_node = sol_masked_node
 
+    @traced
     def arrangeView(self):
         """
         Make the 3D Slicer viewing panels default to something reasonable
@@ -945,6 +1403,7 @@ class VPAWVisualizeLogic(slicer.ScriptedLoadableModule.ScriptedLoadableModuleLog
         if self.segmentation_node is not None:
             self.segmentation_node.GetDisplayNode().SetOpacity3D(opacity)
 
+    @traced
     def compute_isosurfaces(self, num_isosurface_values: int, progress_callback=None):
         """
         Compute isosurfaces of the laplace solution image, if one exists.  Raises
@@ -973,11 +1432,14 @@ class VPAWVisualizeLogic(slicer.ScriptedLoadableModule.ScriptedLoadableModuleLog
         isosurface_values[0] += 0.02
         isosurface_values[-1] -= 0.02
 
-        laplace_isosurface_node = isosurfaces_from_volume(
-            self.laplace_sol_masked_node,
-            isosurface_values,
-            progress_callback=progress_callback,
-        )
+        with self.memory_ledger.stage(
+            "isosurfaces_from_volume", f"{num_isosurface_values} values",
+        ):
+            laplace_isosurface_node = isosurfaces_from_volume(
+                self.laplace_sol_masked_node,
+                isosurface_values,
+                progress_callback=progress_callback,
+            )
         laplace_isosurface_node.SetName(
             f"{self.laplace_sol_node.GetName()}_isosurfaces",
         )
@@ -985,6 +1447,145 @@ class VPAWVisualizeLogic(slicer.ScriptedLoadableModule.ScriptedLoadableModuleLog
         laplace_isosurface_node.GetDisplayNode().SetVisibility(True)
         self.put_node_under_subject(laplace_isosurface_node)
         self.laplace_isosurface_node = laplace_isosurface_node
+        if self.memory_ledger.enabled:
+            logging.info(
+                f"Memory of subject {self.subject_id}:\n" + self.memoryReport(),
+            )
+
+    def convertP3Files(self, dataDirectory, patientPrefix=""):
+        """
+        Write a .p3.npz copy of each .p3 file of a data root that is not already
+        converted; see vpawvisualizelib.p3arrays.  Can be used without GUI widget.
+
+        Parameters
+        ----------
+        dataDirectory : str
+            The data root
+        patientPrefix : str
+            Convert only files with this prefix.  Blank means all files.
+
+        Returns
+        -------
+        A dict with lists of the files "converted" and "up_to_date", and a dict "failed"
+        from each file that could not be converted to the reason
+        """
+        if not os.path.isdir(dataDirectory):
+            raise ValueError(
+                f"Data directory (value={dataDirectory!r}) is not valid",
+            )
+        response = convert_data_root(dataDirectory, patientPrefix or "")
+        logging.info(
+            f"Converted {len(response['converted'])} P3 files in {dataDirectory}"
+            + f" ({len(response['up_to_date'])} up to date,"
+            + f" {len(response['failed'])} failed)",
+        )
+        return response
+
+    def transcodeVolumes(self, dataDirectory, patientPrefix="", cacheDirectory=None):
+        """
+        Write an uncompressed copy of each gzip-compressed volume of a data root whose
+        copy is not up to date, which find_and_sort_files_with_prefix then lists
+        instead; see vpawvisualizelib.transcode.  Can be used without GUI widget.
+
+        Parameters
+        ----------
+        dataDirectory : str
+            The data root
+        patientPrefix : str
+            Transcode only files with this prefix.  Blank means all files.
+        cacheDirectory : str
+            The directory of the copies.  By default, the one named by
+            VPAW_VOLUME_CACHE_DIRECTORY or the setting VPAW/VolumeCacheDirectory.
+
+        Returns
+        -------
+        A dict with lists of the copies "transcoded" and the files "up_to_date", a dict
+        "failed" from each file that could not be transcoded to the reason, and the
+        number of "bytes" of voxel data transcoded with the "gzip_seconds" and
+        "raw_seconds" that it took to decode them from each encoding
+        """
+        if not os.path.isdir(dataDirectory):
+            raise ValueError(
+                f"Data directory (value={dataDirectory!r}) is not valid",
+            )
+        response = transcode_data_root(
+            dataDirectory, patientPrefix or "", cacheDirectory,
+        )
+        logging.info(
+            f"Transcoded {len(response['transcoded'])} volumes in {dataDirectory}"
+            + f" ({len(response['up_to_date'])} up to date,"
+            + f" {len(response['failed'])} failed). "
+            + format_throughput(response),
+        )
+        return response
+
+    @traced
+    def precomputeSubject(self, dataDirectory, patientPrefix, num_isosurface_values):
+        """
+        Load a subject, then save its masked Laplace solution and its isosurface model
+        under dataDirectory/precomputed/, so that later loads of the subject can skip
+        computing them.  Results that are newer than the files they were computed from
+        are kept.  Can be used without GUI widget.
+
+        Parameters
+        ----------
+        dataDirectory : str
+            The data root
+        patientPrefix : str
+            The prefix of exactly one patient, e.g., "1000_"
+        num_isosurface_values : int
+            Number of isosurface values
+
+        Returns
+        -------
+        The list of files written
+        """
+        list_of_files = self.find_and_sort_files_with_prefix(
+            dataDirectory, patientPrefix,
+        )
+        if len(list_of_files) == 0:
+            raise FileNotFoundError(f"No patient found with prefix {patientPrefix!r}")
+        self.clearSubject()
+        self.loadNodesToSubjectHierarchy(list_of_files, patientPrefix)
+
+        # Precomputed results are named after the Laplace solution file
+        sol_filename = self.laplace_sol_node.GetStorageNode().GetFileName()
+        sol_stem = os.path.basename(sol_filename).split(".")[0]
+        inputs_mtime = max(
+            os.path.getmtime(node.GetStorageNode().GetFileName())
+            for node in (self.laplace_sol_node, self.segmentation_node)
+        )
+
+        def up_to_date(filename):
+            return (
+                os.path.exists(filename) and os.path.getmtime(filename) >= inputs_mtime
+            )
+
+        precomputed_dir = os.path.join(dataDirectory, PRECOMPUTED_DIRECTORY)
+        masked_filename = os.path.join(
+            precomputed_dir,
+            "laplace_masked",
+            f"{sol_stem}_restrictedToSegmentation.nrrd",
+        )
+        isosurfaces_filename = os.path.join(
+            precomputed_dir, "isosurfaces", f"{sol_stem}_isosurfaces.vtk",
+        )
+        written = []
+        if not up_to_date(masked_filename):
+            os.makedirs(os.path.dirname(masked_filename), exist_ok=True)
+            if not slicer.util.saveNode(self.laplace_sol_masked_node, masked_filename):
+                raise OSError(f"Unable to write {masked_filename}")
+            written.append(masked_filename)
+        if not up_to_date(isosurfaces_filename):
+            if not self.isosurface_exists() or written:
+                self.compute_isosurfaces(num_isosurface_values)
+            os.makedirs(os.path.dirname(isosurfaces_filename), exist_ok=True)
+            if not slicer.util.saveNode(
+                self.laplace_isosurface_node, isosurfaces_filename,
+            ):
+                raise OSError(f"Unable to write {isosurfaces_filename}")
+            written.append(isosurfaces_filename)
+        return written
 
     def isosurface_exists(self) -> bool:
         """
@@ -0,0 +1,95 @@
+"""
+A centerline as a model node: a single polyline through its points.
+
+A markups curve with a control point for each centerline point is slow to render and
+interact with when the centerline is dense.  A model node holding a polyline is drawn
+as one line, and its points and normals are VTK arrays that share memory with the
+numpy arrays that they are built from.  Unlike a markups curve, such a model cannot be
+edited, and tools that take a curve, e.g., to measure along it, do not accept it.
+"""
+
+import numpy as np
+import slicer
+import vtk
+from vtk.util import numpy_support
+
+# Name of the point data array holding the centerline normals
+NORMALS_ARRAY_NAME = "CenterlineNormals"
+# Width in pixels of the centerline when drawn as a line
+LINE_WIDTH = 3
+# Color of the centerline
+COLOR = (1.0, 0.5, 0.0)
+
+
+def _vtk_view(array, array_type=None):
+    """
+    Return a VTK array that shares memory with a contiguous numpy array.  The VTK array
+    keeps a reference to the numpy array, so the memory lives as long as either does.
+    """
+    return numpy_support.numpy_to_vtk(array, deep=False, array_type=array_type)
+
+
+def centerline_polydata(points, normals=None):
+    """
+    Return a vtkPolyData with one polyline through the centerline points.
+
+    Args:
+        points: an N x 3 array of the points, in order along the centerline
+        normals: optionally, an N x 3 array of the normals of the centerline at the
+            points, which is kept as the point data array "CenterlineNormals"
+    Return: the vtkPolyData
+    """
+    # Copies only if the array is not already contiguous float64, e.g., if it is a
+    # permuted view
+    points = np.ascontiguousarray(points, dtype=np.float64)
+    if points.ndim != 2 or points.shape[1] != 3:  # noqa: PLR2004
+        raise ValueError(f"Expected an N x 3 array of points, not {points.shape}")
+    vtk_points = vtk.vtkPoints()
+    vtk_points.SetData(_vtk_view(points))
+
+    # One cell, the polyline through all the points in order
+    id_type = numpy_support.get_numpy_array_type(vtk.VTK_ID_TYPE)
+    offsets = np.array([0, len(points)], dtype=id_type)
+    connectivity = np.arange(len(points), dtype=id_type)
+    lines = vtk.vtkCellArray()
+    lines.SetData(
+        _vtk_view(offsets, vtk.VTK_ID_TYPE), _vtk_view(connectivity, vtk.VTK_ID_TYPE),
+    )
+
+    polydata = vtk.vtkPolyData()
+    polydata.SetPoints(vtk_points)
+    polydata.SetLines(lines)
+    if normals is not None:
+        normals = np.ascontiguousarray(normals, dtype=np.float64)
+        if normals.shape != points.shape:
+            raise ValueError(
+                f"Expected {points.shape} centerline normals, not {normals.shape}",
+            )
+        vtk_normals = _vtk_view(normals)
+        vtk_normals.SetName(NORMALS_ARRAY_NAME)
+        polydata.GetPointData().AddArray(vtk_normals)
+    return polydata
+
+
+def update_centerline_model(model_node, points, normals=None):
+    """
+    Replace the polyline of a centerline model node; see centerline_polydata.
+    """
+    model_node.SetAndObservePolyData(centerline_polydata(points, normals))
+
+
+def create_centerline_model(points, normals=None, name="Centerline"):
+    """
+    Return a new vtkMRMLModelNode showing the centerline as a line; see
+    centerline_polydata.
+    """
+    model_node = slicer.mrmlScene.AddNewNodeByClass("vtkMRMLModelNode", name)
+    update_centerline_model(model_node, points, normals)
+    model_node.CreateDefaultDisplayNodes()
+    display_node = model_node.GetDisplayNode()
+    display_node.SetColor(*COLOR)
+    display_node.SetLineWidth(LINE_WIDTH)
+    # Show where the centerline crosses the slices, too
+    display_node.SetVisibility2D(True)
+    return model_node
+
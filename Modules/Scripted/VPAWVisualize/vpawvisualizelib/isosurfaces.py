@@ -1,7 +1,9 @@
 import vtk
 import slicer
+from vpawcommonlib.tracing import trace_vtk_events, traced
 
 
+@traced
 def isosurfaces_from_volume(
     vol_node, thresholds, decimate_target_reduction=0.25, progress_callback=None,
 ):
@@ -50,6 +52,7 @@ def isosurfaces_from_volume(
     flying_edges.AddObserver(
         vtk.vtkCommand.ProgressEvent, create_vtk_progress_callback(0, 50),
     )
+    trace_vtk_events(flying_edges)
 
     transformer = vtk.vtkTransformPolyDataFilter()
     transformer.SetInputConnection(flying_edges.GetOutputPort())
@@ -57,6 +60,7 @@ def isosurfaces_from_volume(
     transformer.AddObserver(
         vtk.vtkCommand.ProgressEvent, create_vtk_progress_callback(50, 55),
     )
+    trace_vtk_events(transformer)
 
     decimator = vtk.vtkDecimatePro()
     decimator.SetInputConnection(transformer.GetOutputPort())
@@ -68,6 +72,7 @@ def isosurfaces_from_volume(
     decimator.AddObserver(
         vtk.vtkCommand.ProgressEvent, create_vtk_progress_callback(55, 80),
     )
+    trace_vtk_events(decimator)
 
     normals = vtk.vtkPolyDataNormals()
     normals.SetComputePointNormals(True)
@@ -77,12 +82,14 @@ def isosurfaces_from_volume(
     normals.AddObserver(
         vtk.vtkCommand.ProgressEvent, create_vtk_progress_callback(80, 95),
     )
+    trace_vtk_events(normals)
 
     stripper = vtk.vtkStripper()
     stripper.SetInputConnection(normals.GetOutputPort())
     stripper.AddObserver(
         vtk.vtkCommand.ProgressEvent, create_vtk_progress_callback(95, 100),
     )
+    trace_vtk_events(stripper)
 
     stripper.Update()
     mesh = stripper.GetOutput()
@@ -0,0 +1,248 @@
+"""
+Opt-in memory accounting for loading a subject and generating its surfaces.
+
+Memory accounting is enabled by setting the environment variable VPAW_MEMORY_ACCOUNTING
+or, failing that, the application setting VPAW/MemoryAccounting to "1", "true", "yes",
+or "on".  Otherwise configured_memory_ledger returns a ledger that measures nothing.
+
+Two measures are taken around each stage.  The change in the resident set size (RSS)
+of 3D Slicer covers everything, including VTK and ITK allocations, but memory that is
+freed may not be returned to the operating system.  The tracemalloc peak covers only
+allocations made through Python, which include numpy arrays, but it shows transient
+copies that the RSS delta misses.
+"""
+
+import contextlib
+import logging
+import os
+import time
+import tracemalloc
+
+import slicer
+from vpawcommonlib.formatting import format_bytes
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+ENVIRONMENT_VARIABLE = "VPAW_MEMORY_ACCOUNTING"
+SETTINGS_KEY = "VPAW/MemoryAccounting"
+_ENABLED_VALUES = ("1", "true", "yes", "on")
+# vtkDataObject.GetActualMemorySize reports kibibytes
+BYTES_PER_KIBIBYTE = 1024
+
+
+def memory_accounting_enabled():
+    """
+    Whether memory accounting is enabled, by an environment variable or, failing that,
+    an application setting.
+    """
+    value = os.environ.get(ENVIRONMENT_VARIABLE, "")
+    if not value:
+        try:
+            import qt
+
+            value = str(qt.QSettings().value(SETTINGS_KEY, "") or "")
+        except ImportError:
+            # Not running within 3D Slicer
+            pass
+    return value.strip().lower() in _ENABLED_VALUES
+
+
+def configured_memory_ledger():
+    """
+    Return a MemoryLedger if memory accounting is enabled, else a NullMemoryLedger.
+    """
+    return MemoryLedger() if memory_accounting_enabled() else NullMemoryLedger()
+
+
+def resident_set_size():
+    """
+    Return the current resident set size of this process in bytes, or None if it
+    cannot be determined.
+    """
+    if psutil is not None:
+        return psutil.Process().memory_info().rss
+    try:
+        # Linux without psutil
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class MemoryLedger:
+    """
+    Records the memory used by each stage, in the order in which the stages finish.
+    Stages may nest; an outer stage's figures include those of the stages within it.
+    Use from the main thread only.
+    """
+
+    enabled = True
+
+    def __init__(self):
+        self.records = list()
+        self._open = list()
+
+    @contextlib.contextmanager
+    def stage(self, name, detail=""):
+        """
+        Context manager that measures the memory used by its body as stage `name`, and
+        logs the result.
+
+        Args:
+            name: the stage, e.g., "loadOneNode"
+            detail: what the stage worked on, e.g., a filename
+        """
+        started_tracing = not tracemalloc.is_tracing()
+        if started_tracing:
+            tracemalloc.start()
+        traced, peak = tracemalloc.get_traced_memory()
+        if self._open:
+            # Resetting the peak below would otherwise lose the enclosing stage's peak
+            self._open[-1]["peak"] = max(self._open[-1]["peak"], peak)
+        tracemalloc.reset_peak()
+        current = dict(peak=traced)
+        self._open.append(current)
+        rss_before = resident_set_size()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            rss_after = resident_set_size()
+            traced_after, peak = tracemalloc.get_traced_memory()
+            self._open.pop()
+            peak = max(current["peak"], peak)
+            if self._open:
+                self._open[-1]["peak"] = max(self._open[-1]["peak"], peak)
+            if started_tracing:
+                tracemalloc.stop()
+            record = dict(
+                stage=name,
+                detail=detail,
+                seconds=seconds,
+                rss_delta_bytes=(
+                    rss_after - rss_before
+                    if rss_before is not None and rss_after is not None
+                    else None
+                ),
+                rss_after_bytes=rss_after,
+                python_peak_bytes=peak - traced,
+                python_retained_bytes=traced_after - traced,
+            )
+            self.records.append(record)
+            logging.info("Memory: " + format_stage_record(record))
+
+    def format(self):
+        """
+        Return a table of the recorded stages, one per line.
+        """
+        if not self.records:
+            return "No stages recorded"
+        return "\n".join(format_stage_record(record) for record in self.records)
+
+
+class NullMemoryLedger:
+    """
+    A MemoryLedger that measures nothing, for when memory accounting is not enabled.
+    """
+
+    enabled = False
+    records = ()
+
+    def stage(self, name, detail=""):
+        """
+        Return a context manager that does nothing.
+        """
+        return contextlib.nullcontext()
+
+    def format(self):
+        """
+        Return a line telling how to enable memory accounting.
+        """
+        return f"Not recorded; set {ENVIRONMENT_VARIABLE}=1 or {SETTINGS_KEY} to record"
+
+
+def format_stage_record(record):
+    """
+    Return a line describing one stage recorded by a MemoryLedger.
+    """
+    what = record["stage"] + (f" ({record['detail']})" if record["detail"] else "")
+    delta = record["rss_delta_bytes"]
+    return (
+        f"{what}: RSS {'+' if delta is not None and delta >= 0 else ''}"
+        + f"{format_bytes(delta)} to {format_bytes(record['rss_after_bytes'])},"
+        + f" Python peak {format_bytes(record['python_peak_bytes'])},"
+        + f" {record['seconds']:.2f} s"
+    )
+
+
+def _data_object_bytes(data_object, seen):
+    """
+    Return the memory of a vtkDataObject in bytes, counting each object only once.
+    """
+    if data_object is None:
+        return 0
+    address = data_object.GetAddressAsString("vtkObject")
+    if address in seen:
+        return 0
+    seen.add(address)
+    return data_object.GetActualMemorySize() * BYTES_PER_KIBIBYTE
+
+
+def node_memory(node, seen=None):
+    """
+    Return (image_bytes, polydata_bytes) held by an MRML node.  Segmentations are
+    counted by their binary labelmap and closed surface representations; labelmaps that
+    are shared by several segments are counted once.
+
+    Args:
+        node: a vtkMRMLNode
+        seen: a set of the addresses of data objects already counted, to be updated
+    """
+    if seen is None:
+        seen = set()
+    if node.IsA("vtkMRMLVolumeNode"):
+        return _data_object_bytes(node.GetImageData(), seen), 0
+    if node.IsA("vtkMRMLModelNode"):
+        return 0, _data_object_bytes(node.GetMesh(), seen)
+    if node.IsA("vtkMRMLSegmentationNode"):
+        segmentation = node.GetSegmentation()
+        converter = slicer.vtkSegmentationConverter
+        labelmap_name = converter.GetBinaryLabelmapRepresentationName()
+        surface_name = converter.GetClosedSurfaceRepresentationName()
+        image_bytes = polydata_bytes = 0
+        for index in range(segmentation.GetNumberOfSegments()):
+            segment = segmentation.GetNthSegment(index)
+            image_bytes += _data_object_bytes(
+                segment.GetRepresentation(labelmap_name), seen,
+            )
+            polydata_bytes += _data_object_bytes(
+                segment.GetRepresentation(surface_name), seen,
+            )
+        return image_bytes, polydata_bytes
+    return 0, 0
+
+
+def format_node_memory(nodes):
+    """
+    Return a table of the image and polydata memory of each node, and their total.
+    """
+    seen = set()
+    lines = []
+    total_image_bytes = total_polydata_bytes = 0
+    for node in nodes:
+        image_bytes, polydata_bytes = node_memory(node, seen)
+        total_image_bytes += image_bytes
+        total_polydata_bytes += polydata_bytes
+        lines.append(
+            f"{node.GetName()}: image {format_bytes(image_bytes)},"
+            + f" polydata {format_bytes(polydata_bytes)}",
+        )
+    lines.append(
+        f"Total: image {format_bytes(total_image_bytes)},"
+        + f" polydata {format_bytes(total_polydata_bytes)}",
+    )
+    return "\n".join(lines)
@@ -0,0 +1,132 @@
+"""
+Reuse of MRML nodes from one subject to the next.
+
+Removing every node of a subject and creating new ones for the next, each with its
+display and storage nodes and the scene events that go with them, is a large fixed cost
+of switching subjects.  A NodePool instead keeps one node for each standard role, such
+as "laplace_sol_node", and the next subject's data is read into that node in place.
+"""
+
+import os
+
+import slicer
+
+# Kinds of nodes that are computed rather than read from a file
+CLONED_VOLUME = "CloneVolume"
+IJK_TO_RAS_TRANSFORM = "IJKToRAS"
+# File extensions of more than one part, longest first
+_COMPOUND_EXTENSIONS = (".seg.nrrd", ".p3.npz")
+
+
+def file_kind(filename):
+    """
+    Return the extension of filename, e.g., ".seg.nrrd", which determines the type of
+    node that it is loaded into.
+    """
+    for extension in _COMPOUND_EXTENSIONS:
+        if filename.endswith(extension):
+            return extension
+    return os.path.splitext(filename)[1]
+
+
+def read_into_node(node, filename):
+    """
+    Replace the data of node, e.g., the image of a volume node or the segments of a
+    segmentation node, with the data in filename, using the node's storage node.
+    Raises OSError if the file cannot be read.
+    """
+    storage_node = node.GetStorageNode()
+    if storage_node is None:
+        node.AddDefaultStorageNode()
+        storage_node = node.GetStorageNode()
+    if storage_node is None:
+        raise OSError(f"{node.GetClassName()} nodes cannot be read from a file")
+    if storage_node.IsA("vtkMRMLVolumeArchetypeStorageNode"):
+        # Read only this file, not a series of similarly named files
+        storage_node.SetSingleFile(True)
+    if node.IsA("vtkMRMLSegmentationNode"):
+        node.GetSegmentation().RemoveAllSegments()
+    storage_node.SetFileName(filename)
+    if not storage_node.ReadData(node):
+        raise OSError(f"Unable to read {filename} into {node.GetName()}")
+    node.SetName(os.path.basename(filename))
+
+
+class NodePool:
+    """
+    Keeps one node for each role, along with the kind of source that it was created
+    from, e.g., a file extension, so that it is reused only for the same kind of data.
+    """
+
+    def __init__(self):
+        # Maps a role to (node, kind)
+        self.entries = dict()
+        # The roles that the current subject has filled
+        self.used_roles = set()
+
+    def node(self, role, kind):
+        """
+        Return the pooled node for role if it was created from the same kind of source,
+        is still in the scene, and is not already used by the current subject, else
+        None.  A returned node counts as used by the current subject.
+        """
+        node, pooled_kind = self.entries.get(role, (None, None))
+        if node is None or pooled_kind != kind or role in self.used_roles:
+            return None
+        if not slicer.mrmlScene.IsNodePresent(node):
+            del self.entries[role]
+            return None
+        self.used_roles.add(role)
+        return node
+
+    def add(self, role, kind, node):
+        """
+        Pool node for role, removing from the scene any other node pooled for it.  If
+        the current subject already uses the pooled node, e.g., because the subject has
+        two images, node is not pooled.
+        """
+        if role in self.used_roles:
+            return
+        previous, _ = self.entries.get(role, (None, None))
+        if (
+            previous is not None
+            and previous is not node
+            and slicer.mrmlScene.IsNodePresent(previous)
+        ):
+            slicer.mrmlScene.RemoveNode(previous)
+        self.entries[role] = (node, kind)
+        self.used_roles.add(role)
+
+    def nodes(self):
+        """
+        Return the pooled nodes that are still in the scene.
+        """
+        return [
+            node
+            for node, _ in self.entries.values()
+            if slicer.mrmlScene.IsNodePresent(node)
+        ]
+
+    def begin_subject(self):
+        """
+        Start tracking which roles the next subject fills.
+        """
+        self.used_roles = set()
+
+    def release_unused(self):
+        """
+        Remove from the scene and the pool the nodes of roles that the current subject
+        did not fill, so that no data of an earlier subject is left showing.
+        """
+        for role in list(self.entries):
+            if role not in self.used_roles:
+                node, _ = self.entries.pop(role)
+                if slicer.mrmlScene.IsNodePresent(node):
+                    slicer.mrmlScene.RemoveNode(node)
+
+    def clear(self):
+        """
+        Forget all pooled nodes, without removing them from the scene.
+        """
+        self.entries = dict()
+        self.used_roles = set()
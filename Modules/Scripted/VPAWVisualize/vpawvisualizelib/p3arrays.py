@@ -0,0 +1,228 @@
+"""
+A compact, memory-mappable replacement for the pickled P3 files of the pipeline.
+
+A P3 file is a pickle of a small structure, such as a tuple or dict, whose leaves are
+numpy arrays.  Its replacement, written next to it as <name>.p3.npz, is an uncompressed
+numpy .npz archive: each array is stored as a .npy member, and the structure is stored
+as the JSON member structure.json, with each array replaced by a reference to its
+member.  Reading it never unpickles anything, and because the members are stored
+uncompressed, each array is memory-mapped in place, so only the parts that are used are
+read from disk.
+"""
+
+import json
+import logging
+import os
+import pickle
+import struct
+import zipfile
+
+import numpy as np
+
+P3_EXTENSION = ".p3"
+P3_ARRAYS_EXTENSION = ".p3.npz"
+STRUCTURE_MEMBER = "structure.json"
+FORMAT_VERSION = 1
+# The fixed-size part of a zip local file header, which ends with the lengths of the
+# member name and extra field that follow it
+_LOCAL_HEADER = struct.Struct("<4s2B4HL2L2H")
+_LOCAL_HEADER_SIGNATURE = b"PK\x03\x04"
+
+
+def p3_arrays_filename(p3_filename):
+    """
+    Return the filename of the converted version of a .p3 file.
+    """
+    return p3_filename + ".npz"
+
+
+def _encode(value, arrays):
+    """
+    Return a JSON-compatible description of value, adding its arrays to `arrays`.
+    """
+    if isinstance(value, np.ndarray):
+        if value.dtype.hasobject:
+            raise ValueError("arrays of Python objects are not supported")
+        name = f"a{len(arrays)}"
+        arrays[name] = value
+        return dict(array=name)
+    if isinstance(value, np.generic):
+        return dict(_encode(np.asarray(value), arrays), scalar=True)
+    if isinstance(value, (list, tuple)):
+        kind = "list" if isinstance(value, list) else "tuple"
+        return {kind: [_encode(item, arrays) for item in value]}
+    if isinstance(value, dict):
+        return dict(
+            dict=[
+                [_encode(key, arrays), _encode(item, arrays)]
+                for key, item in value.items()
+            ],
+        )
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return dict(value=value)
+    raise ValueError(f"values of type {type(value).__name__} are not supported")
+
+
+def _decode(description, load_array):
+    if "array" in description:
+        array = load_array(description["array"])
+        return array[()] if description.get("scalar") else array
+    if "list" in description:
+        return [_decode(item, load_array) for item in description["list"]]
+    if "tuple" in description:
+        return tuple(_decode(item, load_array) for item in description["tuple"])
+    if "dict" in description:
+        return {
+            _decode(key, load_array): _decode(item, load_array)
+            for key, item in description["dict"]
+        }
+    return description["value"]
+
+
+def write_p3_arrays(filename, contents):
+    """
+    Write contents, the unpickled contents of a P3 file, to filename in the .p3.npz
+    format.  Raises ValueError if the contents hold something other than arrays,
+    numbers, strings, None, and lists, tuples, and dicts of them.
+    """
+    arrays = dict()
+    structure = dict(version=FORMAT_VERSION, contents=_encode(contents, arrays))
+    temporary_filename = filename + ".tmp"
+    with zipfile.ZipFile(temporary_filename, "w", zipfile.ZIP_STORED) as archive:
+        archive.writestr(STRUCTURE_MEMBER, json.dumps(structure))
+        for name, array in arrays.items():
+            with archive.open(name + ".npy", "w", force_zip64=True) as member:
+                np.lib.format.write_array(member, array, allow_pickle=False)
+    os.replace(temporary_filename, filename)
+
+
+def read_p3_structure(filename):
+    """
+    Return the structure of a .p3.npz file, as written to its structure.json member,
+    without reading any arrays.
+    """
+    with zipfile.ZipFile(filename) as archive:
+        return json.loads(archive.read(STRUCTURE_MEMBER))
+
+
+def _memory_map_member(filename, archive_file, info):
+    """
+    Return a read-only memory map of a .npy member that is stored uncompressed.
+    """
+    archive_file.seek(info.header_offset)
+    header = _LOCAL_HEADER.unpack(archive_file.read(_LOCAL_HEADER.size))
+    if header[0] != _LOCAL_HEADER_SIGNATURE:
+        raise ValueError(f"{filename} has a corrupt entry for {info.filename}")
+    name_length, extra_length = header[-2:]
+    archive_file.seek(
+        info.header_offset + _LOCAL_HEADER.size + name_length + extra_length,
+    )
+    version = np.lib.format.read_magic(archive_file)
+    if version == (1, 0):
+        shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(archive_file)
+    else:
+        shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(archive_file)
+    if dtype.hasobject:
+        raise ValueError(f"{filename} has an array of Python objects")
+    if 0 in shape:
+        return np.empty(shape, dtype=dtype)
+    return np.memmap(
+        filename,
+        dtype=dtype,
+        mode="r",
+        shape=shape,
+        order="F" if fortran_order else "C",
+        offset=archive_file.tell(),
+    )
+
+
+def read_p3_arrays(filename, memory_map=True):
+    """
+    Read a .p3.npz file.
+
+    Args:
+        filename: the file
+        memory_map: if True, arrays are memory-mapped rather than read, so that only
+            the parts of them that are used are read from disk
+    Return: the contents, as they were in the original P3 file
+    """
+    structure = read_p3_structure(filename)
+    if structure.get("version") != FORMAT_VERSION:
+        raise ValueError(
+            f"{filename} has unsupported format version {structure.get('version')}",
+        )
+    with zipfile.ZipFile(filename) as archive, open(filename, "rb") as archive_file:
+
+        def load_array(name):
+            info = archive.getinfo(name + ".npy")
+            if memory_map and info.compress_type == zipfile.ZIP_STORED:
+                return _memory_map_member(filename, archive_file, info)
+            with archive.open(info) as member:
+                return np.lib.format.read_array(member, allow_pickle=False)
+
+        return _decode(structure["contents"], load_array)
+
+
+def convert_p3_file(p3_filename):
+    """
+    Write the .p3.npz version of a .p3 file, unless it is already up to date.
+
+    Return: the filename written, or None if the existing one is up to date
+    """
+    output_filename = p3_arrays_filename(p3_filename)
+    if os.path.exists(output_filename) and os.path.getmtime(
+        output_filename,
+    ) >= os.path.getmtime(p3_filename):
+        return None
+    with open(p3_filename, "rb") as p3_file:
+        contents = pickle.load(p3_file)
+    write_p3_arrays(output_filename, contents)
+    return output_filename
+
+
+def convert_data_root(data_root, prefix=""):
+    """
+    Convert every .p3 file under a data root whose name starts with prefix.
+
+    Args:
+        data_root: the directory to search, recursively
+        prefix: convert only files with this prefix.  Blank means all files.
+    Return: a dict with lists of the files "converted" and "up_to_date", and a dict
+        "failed" from each file that could not be converted to the reason
+    """
+    response = dict(converted=[], up_to_date=[], failed=dict())
+    for directory, _, basenames in os.walk(data_root):
+        for basename in sorted(basenames):
+            if not (basename.endswith(P3_EXTENSION) and basename.startswith(prefix)):
+                continue
+            p3_filename = os.path.join(directory, basename)
+            try:
+                written = convert_p3_file(p3_filename)
+            except (OSError, ValueError, pickle.UnpicklingError, EOFError) as e:
+                logging.warning(f"Unable to convert {p3_filename}: {e}")
+                response["failed"][p3_filename] = str(e)
+                continue
+            if written is None:
+                response["up_to_date"].append(p3_filename)
+            else:
+                response["converted"].append(written)
+    return response
+
+
+def prefer_p3_arrays(filenames):
+    """
+    Return filenames with one file for each .p3 file that is listed with its .p3.npz
+    version: the .p3.npz version if it is up to date, else the .p3 file.
+    """
+    listed = set(filenames)
+    dropped = set()
+    for filename in filenames:
+        arrays_filename = p3_arrays_filename(filename)
+        if not filename.endswith(P3_EXTENSION) or arrays_filename not in listed:
+            continue
+        if os.path.getmtime(arrays_filename) >= os.path.getmtime(filename):
+            dropped.add(filename)
+        else:
+            # Stale; the .p3 file has changed since it was converted
+            dropped.add(arrays_filename)
+    return [filename for filename in filenames if filename not in dropped]
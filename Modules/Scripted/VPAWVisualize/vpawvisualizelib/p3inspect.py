@@ -0,0 +1,389 @@
+"""
+Describe the contents of P3 files without loading their arrays.
+
+A pickled P3 file is not unpickled.  Instead its opcodes are interpreted symbolically,
+with pickletools' descriptions of them: objects are never constructed, imports never
+happen, and the raw bytes of large arrays are skipped over on disk rather than read.
+numpy arrays and scalars are recognized from the calls that would rebuild them.  For a
+.p3.npz file (see vpawvisualizelib.p3arrays) only the structure and the .npy headers
+are read.  Descriptions are cached for as long as a file's modification time and size
+are unchanged.
+"""
+
+import os
+import pickletools
+import zipfile
+
+import numpy as np
+
+from vpawvisualizelib.p3arrays import P3_ARRAYS_EXTENSION, read_p3_structure
+
+# Length-prefixed arguments longer than this are skipped rather than read
+MAX_READ_ARGUMENT_BYTES = 4096
+# Items shown of a long list, tuple, or dict
+MAX_SHOWN_ITEMS = 10
+# Longer strings are shown by their length
+MAX_SHOWN_CHARACTERS = 80
+_LENGTH_PREFIX_BYTES = {
+    pickletools.TAKEN_FROM_ARGUMENT1: (1, False),
+    pickletools.TAKEN_FROM_ARGUMENT4: (4, True),
+    pickletools.TAKEN_FROM_ARGUMENT4U: (4, False),
+    pickletools.TAKEN_FROM_ARGUMENT8U: (8, False),
+}
+_NUMPY_MODULES = ("numpy.core.multiarray", "numpy._core.multiarray")
+_NUMPY_NUMERIC_MODULES = ("numpy.core.numeric", "numpy._core.numeric")
+
+# Maps a filename to ((mtime_ns, size), description)
+_cache = dict()
+
+
+class _Mark:
+    pass
+
+
+class _Skipped:
+    """
+    Stands for a bytes or str argument that was not read.
+    """
+
+    def __init__(self, length):
+        self.length = length
+
+
+class _Global:
+    def __init__(self, module, name):
+        self.module = module
+        self.name = name
+
+
+class _Call:
+    """
+    Stands for the object that a pickle would construct by calling `function`.
+    """
+
+    def __init__(self, function, args):
+        self.function = function
+        self.args = args
+        self.state = None
+
+
+class _ArraySummary:
+    def __init__(self, dtype, shape):
+        self.dtype = dtype
+        self.shape = tuple(shape)
+
+    def __repr__(self):
+        return f"ndarray({self.dtype}, shape={self.shape})"
+
+
+class _Opaque:
+    """
+    Stands for a value that is only described, e.g., "<12000 bytes>".
+    """
+
+    def __init__(self, text):
+        self.text = text
+
+    def __repr__(self):
+        return self.text
+
+
+class _ScalarSummary:
+    def __init__(self, dtype):
+        self.dtype = dtype
+
+    def __repr__(self):
+        return f"{self.dtype} scalar"
+
+
+def _read_argument(pickle_file, argument):
+    """
+    Read the argument of an opcode, skipping long length-prefixed data.
+    """
+    if argument.n not in _LENGTH_PREFIX_BYTES:
+        return argument.reader(pickle_file)
+    size, signed = _LENGTH_PREFIX_BYTES[argument.n]
+    position = pickle_file.tell()
+    length = int.from_bytes(pickle_file.read(size), "little", signed=signed)
+    if length <= MAX_READ_ARGUMENT_BYTES:
+        pickle_file.seek(position)
+        return argument.reader(pickle_file)
+    pickle_file.seek(length, os.SEEK_CUR)
+    return _Skipped(length)
+
+
+def _pop_to_mark(stack):
+    index = len(stack) - 1
+    while not isinstance(stack[index], _Mark):
+        index -= 1
+    items = stack[index + 1 :]
+    del stack[index:]
+    return items
+
+
+def _pop_tuple(stack, count):
+    items = tuple(stack[-count:]) if count else ()
+    del stack[len(stack) - count :]
+    stack.append(items)
+
+
+def _pop_call(stack):
+    args = stack.pop()
+    stack.append(_Call(stack.pop(), args))
+
+
+def _build(stack):
+    state = stack.pop()
+    if isinstance(stack[-1], _Call):
+        stack[-1].state = state
+
+
+# SETITEM(S) and APPEND(S) also fill objects that are only described, such as an
+# OrderedDict; their items are dropped
+
+
+def _set_item(stack):
+    value = stack.pop()
+    key = stack.pop()
+    if isinstance(stack[-1], dict):
+        stack[-1][key] = value
+
+
+def _set_items(stack):
+    items = _pop_to_mark(stack)
+    if isinstance(stack[-1], dict):
+        stack[-1].update(zip(items[::2], items[1::2]))
+
+
+def _append(stack):
+    item = stack.pop()
+    if isinstance(stack[-1], list):
+        stack[-1].append(item)
+
+
+def _extend(stack):
+    items = _pop_to_mark(stack)
+    if isinstance(stack[-1], list):
+        stack[-1].extend(items)
+
+
+def _stack_global(stack):
+    name = stack.pop()
+    stack.append(_Global(stack.pop(), name))
+
+
+def _pop_call_ex(stack):
+    # The keyword arguments are ignored
+    stack.pop()
+    _pop_call(stack)
+
+
+# How each supported opcode that does not simply push its argument changes the stack
+# and memo
+_OPERATIONS = dict(
+    MARK=lambda stack, memo, argument: stack.append(_Mark()),
+    POP=lambda stack, memo, argument: stack.pop(),
+    POP_MARK=lambda stack, memo, argument: _pop_to_mark(stack),
+    DUP=lambda stack, memo, argument: stack.append(stack[-1]),
+    PUT=lambda stack, memo, argument: memo.__setitem__(argument, stack[-1]),
+    MEMOIZE=lambda stack, memo, argument: memo.__setitem__(len(memo), stack[-1]),
+    GET=lambda stack, memo, argument: stack.append(memo[argument]),
+    NONE=lambda stack, memo, argument: stack.append(None),
+    NEWTRUE=lambda stack, memo, argument: stack.append(True),
+    NEWFALSE=lambda stack, memo, argument: stack.append(False),
+    EMPTY_LIST=lambda stack, memo, argument: stack.append([]),
+    EMPTY_DICT=lambda stack, memo, argument: stack.append({}),
+    # Sets are shown as lists
+    EMPTY_SET=lambda stack, memo, argument: stack.append([]),
+    EMPTY_TUPLE=lambda stack, memo, argument: _pop_tuple(stack, 0),
+    TUPLE1=lambda stack, memo, argument: _pop_tuple(stack, 1),
+    TUPLE2=lambda stack, memo, argument: _pop_tuple(stack, 2),
+    TUPLE3=lambda stack, memo, argument: _pop_tuple(stack, 3),
+    TUPLE=lambda stack, memo, argument: stack.append(tuple(_pop_to_mark(stack))),
+    FROZENSET=lambda stack, memo, argument: stack.append(_pop_to_mark(stack)),
+    LIST=lambda stack, memo, argument: stack.append(_pop_to_mark(stack)),
+    DICT=lambda stack, memo, argument: stack.append(
+        dict(zip(*[iter(_pop_to_mark(stack))] * 2)),
+    ),
+    APPEND=lambda stack, memo, argument: _append(stack),
+    APPENDS=lambda stack, memo, argument: _extend(stack),
+    ADDITEMS=lambda stack, memo, argument: _extend(stack),
+    SETITEM=lambda stack, memo, argument: _set_item(stack),
+    SETITEMS=lambda stack, memo, argument: _set_items(stack),
+    GLOBAL=lambda stack, memo, argument: stack.append(_Global(*argument.split(" ", 1))),
+    STACK_GLOBAL=lambda stack, memo, argument: _stack_global(stack),
+    REDUCE=lambda stack, memo, argument: _pop_call(stack),
+    NEWOBJ=lambda stack, memo, argument: _pop_call(stack),
+    NEWOBJ_EX=lambda stack, memo, argument: _pop_call_ex(stack),
+    BUILD=lambda stack, memo, argument: _build(stack),
+)
+_OPERATIONS.update(
+    BINPUT=_OPERATIONS["PUT"],
+    LONG_BINPUT=_OPERATIONS["PUT"],
+    BINGET=_OPERATIONS["GET"],
+    LONG_BINGET=_OPERATIONS["GET"],
+)
+
+
+def _interpret(pickle_file):
+    """
+    Return a symbolic version of the object in a pickle file, in which _Global and
+    _Call stand for the imports and calls that unpickling would do.
+    """
+    stack, memo = [], dict()
+    while True:
+        code = pickle_file.read(1)
+        if not code:
+            raise ValueError("truncated pickle")
+        opcode = pickletools.code2op.get(code.decode("latin-1"))
+        if opcode is None:
+            raise ValueError(f"unknown pickle opcode {code!r}")
+        argument = (
+            _read_argument(pickle_file, opcode.arg) if opcode.arg is not None else None
+        )
+        if opcode.name == "STOP":
+            return stack.pop()
+        if opcode.name in _OPERATIONS:
+            _OPERATIONS[opcode.name](stack, memo, argument)
+        elif opcode.name in ("PROTO", "FRAME"):
+            continue
+        elif (
+            opcode.stack_before
+            or len(opcode.stack_after) != 1
+            or opcode.stack_after[0] is pickletools.anyobject
+        ):
+            # E.g., INST, PERSID, EXT1, and NEXT_BUFFER
+            raise ValueError(f"pickle opcode {opcode.name} is not supported")
+        else:
+            # Opcodes that push their argument, e.g., BININT and SHORT_BINUNICODE
+            stack.append(argument)
+
+
+def _is_global(value, modules, name):
+    return isinstance(value, _Global) and value.module in modules and value.name == name
+
+
+def _dtype_name(value):
+    """
+    Return the name of the dtype that a symbolic numpy.dtype call would construct.
+    """
+    if isinstance(value, _Call) and value.args and isinstance(value.args[0], str):
+        byte_order = (
+            value.state[1]
+            if isinstance(value.state, tuple) and len(value.state) > 1
+            else "="
+        )
+        try:
+            return str(np.dtype(value.args[0]).newbyteorder(byte_order))
+        except (TypeError, ValueError):
+            return value.args[0]
+    return "unknown dtype"
+
+
+def _summarize(value):
+    """
+    Replace the symbolic numpy arrays and scalars in value with summaries of them.
+    """
+    if isinstance(value, _Call):
+        function = value.function
+        if (
+            _is_global(function, _NUMPY_MODULES, "_reconstruct")
+            and isinstance(value.state, tuple)
+            and len(value.state) >= 3  # noqa: PLR2004
+        ):
+            return _ArraySummary(_dtype_name(value.state[2]), value.state[1])
+        if _is_global(function, _NUMPY_NUMERIC_MODULES, "_frombuffer"):
+            return _ArraySummary(_dtype_name(value.args[1]), value.args[2])
+        if _is_global(function, _NUMPY_MODULES, "scalar"):
+            return _ScalarSummary(_dtype_name(value.args[0]))
+        if isinstance(function, _Global):
+            return _Opaque(f"<{function.module}.{function.name} object>")
+        return _Opaque("<object>")
+    if isinstance(value, _Skipped):
+        return _Opaque(f"<{value.length} bytes>")
+    if isinstance(value, (list, tuple)):
+        return type(value)(_summarize(item) for item in value)
+    if isinstance(value, dict):
+        return {_summarize(key): _summarize(item) for key, item in value.items()}
+    return value
+
+
+def _describe(value):
+    """
+    Return a repr-like string of a summarized value, abbreviating long containers.
+    """
+    if isinstance(value, (list, tuple)):
+        items = [_describe(item) for item in value[:MAX_SHOWN_ITEMS]]
+        if len(value) > MAX_SHOWN_ITEMS:
+            items.append(f"... {len(value)} items")
+        if isinstance(value, tuple):
+            return "(" + ", ".join(items) + ("," if len(value) == 1 else "") + ")"
+        return "[" + ", ".join(items) + "]"
+    if isinstance(value, dict):
+        items = [
+            _describe(key) + ": " + _describe(item)
+            for key, item in list(value.items())[:MAX_SHOWN_ITEMS]
+        ]
+        if len(value) > MAX_SHOWN_ITEMS:
+            items.append(f"... {len(value)} items")
+        return "{" + ", ".join(items) + "}"
+    if isinstance(value, (str, bytes)) and len(value) > MAX_SHOWN_CHARACTERS:
+        return f"<{type(value).__name__} of length {len(value)}>"
+    return repr(value)
+
+
+def _summarize_p3_arrays(filename):
+    """
+    Return the summarized contents of a .p3.npz file, reading only its .npy headers.
+    """
+    structure = read_p3_structure(filename)
+    with zipfile.ZipFile(filename) as archive:
+
+        def summarize(description):
+            if "array" in description:
+                with archive.open(description["array"] + ".npy") as member:
+                    version = np.lib.format.read_magic(member)
+                    read_header = (
+                        np.lib.format.read_array_header_1_0
+                        if version == (1, 0)
+                        else np.lib.format.read_array_header_2_0
+                    )
+                    shape, _, dtype = read_header(member)
+                if description.get("scalar"):
+                    return _ScalarSummary(str(dtype))
+                return _ArraySummary(str(dtype), shape)
+            if "list" in description:
+                return [summarize(item) for item in description["list"]]
+            if "tuple" in description:
+                return tuple(summarize(item) for item in description["tuple"])
+            if "dict" in description:
+                return {
+                    summarize(key): summarize(item) for key, item in description["dict"]
+                }
+            return description["value"]
+
+        return summarize(structure["contents"])
+
+
+def describe_p3_file(filename):
+    """
+    Return a one-line description of the contents of a .p3 or .p3.npz file, such as
+    "(ndarray(float64, shape=(120, 3)), ndarray(float64, shape=(120, 3)))", without
+    loading its arrays.  Raises ValueError if the file cannot be interpreted.
+    """
+    status = os.stat(filename)
+    key = (status.st_mtime_ns, status.st_size)
+    cached = _cache.get(filename)
+    if cached is not None and cached[0] == key:
+        return cached[1]
+    if filename.endswith(P3_ARRAYS_EXTENSION):
+        summary = _summarize_p3_arrays(filename)
+    else:
+        with open(filename, "rb") as pickle_file:
+            try:
+                summary = _summarize(_interpret(pickle_file))
+            except (IndexError, KeyError, AttributeError, TypeError) as e:
+                raise ValueError(f"{filename} is not a supported pickle: {e}") from e
+    description = _describe(summary)
+    _cache[filename] = (key, description)
+    return description
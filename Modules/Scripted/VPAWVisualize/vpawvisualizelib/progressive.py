@@ -0,0 +1,282 @@
+"""
+Progressive loading of a volume: a low-resolution preview first, then the full volume.
+
+The preview is a copy of the volume with every PREVIEW_STRIDE-th voxel along each
+axis, i.e., 1/64 of the voxels, written uncompressed next to the volume as
+<name>.nrrd.preview.nrrd the first time that the volume is loaded.  Later loads show
+the preview at once, with the same origin and extent as the full volume, while a
+background thread reads and decompresses the full volume; the preview's image data is
+then replaced in the main thread.
+
+While a volume node shows a preview its "VPAW.PreviewStride" attribute is set, and
+full_resolution_ijk_to_ras and full_resolution_spacing give the geometry of the full
+volume, which other nodes, e.g., the centerline, are registered to.
+"""
+
+import logging
+import os
+import threading
+import zlib
+
+import numpy as np
+import qt
+import slicer
+import vtk
+from vpawcommonlib.nrrdheader import header_sizes, read_nrrd_header
+from vpawcommonlib.patients import PREVIEW_SUFFIX
+from vpawcommonlib.tracing import span
+
+PREVIEW_STRIDE = 4
+STRIDE_ATTRIBUTE = "VPAW.PreviewStride"
+# How often the main thread checks whether a full volume has been read
+POLL_MILLISECONDS = 50
+SPATIAL_DIMENSIONS = 3
+# Bytes of the file read at once when looking for the end of the header
+_HEADER_CHUNK_BYTES = 65536
+
+# NRRD "type" names of numpy dtypes, as written to previews
+_NRRD_TYPES = {
+    np.dtype(np.int8): "signed char",
+    np.dtype(np.uint8): "uchar",
+    np.dtype(np.int16): "short",
+    np.dtype(np.uint16): "ushort",
+    np.dtype(np.int32): "int",
+    np.dtype(np.uint32): "uint",
+    np.dtype(np.float32): "float",
+    np.dtype(np.float64): "double",
+}
+# numpy dtypes of the NRRD "type" names that a full volume may have
+_DTYPES = {
+    **{name: dtype for dtype, name in _NRRD_TYPES.items()},
+    **dict.fromkeys(("int8", "int8_t"), np.dtype(np.int8)),
+    **dict.fromkeys(("unsigned char", "uint8", "uint8_t"), np.dtype(np.uint8)),
+    **dict.fromkeys(
+        ("short int", "signed short", "signed short int", "int16", "int16_t"),
+        np.dtype(np.int16),
+    ),
+    **dict.fromkeys(
+        ("unsigned short", "unsigned short int", "uint16", "uint16_t"),
+        np.dtype(np.uint16),
+    ),
+    **dict.fromkeys(("signed int", "int32", "int32_t"), np.dtype(np.int32)),
+    **dict.fromkeys(("unsigned int", "uint32", "uint32_t"), np.dtype(np.uint32)),
+}
+_ENCODINGS = ("raw", "gzip", "gz")
+
+
+def preview_filename(filename):
+    return filename + PREVIEW_SUFFIX
+
+
+def without_previews(filenames):
+    """
+    Return filenames without the previews written by write_preview.
+    """
+    return [filename for filename in filenames if not filename.endswith(PREVIEW_SUFFIX)]
+
+
+def preview_is_current(filename):
+    """
+    Whether the preview of a volume file exists and is newer than the file.
+    """
+    preview = preview_filename(filename)
+    return os.path.exists(preview) and os.path.getmtime(preview) >= os.path.getmtime(
+        filename,
+    )
+
+
+def write_preview(volume_node, filename):
+    """
+    Write the preview of a full-resolution scalar volume node that was loaded from
+    filename.
+    """
+    array = slicer.util.arrayFromVolume(volume_node)
+    dtype = array.dtype.newbyteorder("<")
+    if dtype.newbyteorder("=") not in _NRRD_TYPES or array.ndim != SPATIAL_DIMENSIONS:
+        raise ValueError(f"{filename} is not a supported scalar volume")
+    # arrayFromVolume is indexed (k, j, i)
+    preview = np.ascontiguousarray(
+        array[::PREVIEW_STRIDE, ::PREVIEW_STRIDE, ::PREVIEW_STRIDE], dtype=dtype,
+    )
+    ijk_to_ras = vtk.vtkMatrix4x4()
+    volume_node.GetIJKToRASMatrix(ijk_to_ras)
+    # NRRD files are written in LPS
+    lps_sign = (-1, -1, 1)
+    directions = " ".join(
+        "("
+        + ",".join(
+            repr(lps_sign[row] * ijk_to_ras.GetElement(row, column) * PREVIEW_STRIDE)
+            for row in range(SPATIAL_DIMENSIONS)
+        )
+        + ")"
+        for column in range(SPATIAL_DIMENSIONS)
+    )
+    origin = ",".join(
+        repr(lps_sign[row] * ijk_to_ras.GetElement(row, 3))
+        for row in range(SPATIAL_DIMENSIONS)
+    )
+    header = (
+        "NRRD0004\n"
+        + f"type: {_NRRD_TYPES[dtype.newbyteorder('=')]}\n"
+        + "dimension: 3\n"
+        + "space: left-posterior-superior\n"
+        + f"sizes: {' '.join(str(size) for size in reversed(preview.shape))}\n"
+        + f"space directions: {directions}\n"
+        + "kinds: domain domain domain\n"
+        + "endian: little\n"
+        + "encoding: raw\n"
+        + f"space origin: ({origin})\n"
+        + f"vpaw preview stride:={PREVIEW_STRIDE}\n"
+        + "\n"
+    )
+    output_filename = preview_filename(filename)
+    with open(output_filename + ".tmp", "wb") as preview_file:
+        preview_file.write(header.encode("latin-1"))
+        preview_file.write(preview.tobytes())
+    os.replace(output_filename + ".tmp", output_filename)
+    return output_filename
+
+
+def _data_offset(filename):
+    """
+    Return the offset of the data of a NRRD file, just after the blank line that ends
+    its header.
+    """
+    with open(filename, "rb") as nrrd_file:
+        start = nrrd_file.read(_HEADER_CHUNK_BYTES)
+    for separator in (b"\n\n", b"\r\n\r\n"):
+        index = start.find(separator)
+        if index >= 0:
+            return index + len(separator)
+    raise ValueError(f"The header of {filename} is too long")
+
+
+def readable_in_background(filename):
+    """
+    Whether read_volume_array can read a volume file, i.e., whether it is a .nrrd file
+    of a single scalar 3D volume with its data attached, raw or gzip compressed.
+    """
+    if not filename.endswith(".nrrd"):
+        return False
+    try:
+        fields = read_nrrd_header(filename)
+    except (OSError, ValueError):
+        return False
+    return (
+        fields.get("encoding", "").lower() in _ENCODINGS
+        and " ".join(fields.get("type", "").lower().split()) in _DTYPES
+        and fields.get("dimension") == str(SPATIAL_DIMENSIONS)
+        and not {"data file", "datafile", "line skip", "byte skip"} & set(fields)
+    )
+
+
+def read_volume_array(filename):
+    """
+    Read the voxels of a volume file accepted by readable_in_background, as an array
+    indexed (k, j, i) like slicer.util.arrayFromVolume.  zlib releases the GIL while
+    decompressing, so this can run in a background thread.
+    """
+    fields = read_nrrd_header(filename)
+    dtype = _DTYPES[" ".join(fields["type"].lower().split())]
+    if dtype.itemsize > 1:
+        dtype = dtype.newbyteorder(
+            ">" if fields.get("endian", "little").lower() == "big" else "<",
+        )
+    with open(filename, "rb") as nrrd_file:
+        nrrd_file.seek(_data_offset(filename))
+        data = nrrd_file.read()
+    if fields["encoding"].lower() != "raw":
+        # wbits=MAX_WBITS | 32 accepts gzip and zlib streams
+        data = zlib.decompress(data, zlib.MAX_WBITS | 32)
+    sizes = header_sizes(fields)
+    array = np.frombuffer(data, dtype=dtype, count=int(np.prod(sizes)))
+    return array.reshape(tuple(reversed(sizes))).astype(
+        dtype.newbyteorder("="), copy=False,
+    )
+
+
+def _stride(volume_node):
+    return int(volume_node.GetAttribute(STRIDE_ATTRIBUTE) or 1)
+
+
+def full_resolution_ijk_to_ras(volume_node):
+    """
+    Return the IJK to RAS matrix of a volume node's full-resolution volume, even while
+    it shows a preview.
+    """
+    matrix = vtk.vtkMatrix4x4()
+    volume_node.GetIJKToRASMatrix(matrix)
+    stride = _stride(volume_node)
+    for row in range(SPATIAL_DIMENSIONS):
+        for column in range(SPATIAL_DIMENSIONS):
+            matrix.SetElement(row, column, matrix.GetElement(row, column) / stride)
+    return matrix
+
+
+def full_resolution_spacing(volume_node):
+    """
+    Return the spacing of a volume node's full-resolution volume, even while it shows
+    a preview.
+    """
+    stride = _stride(volume_node)
+    return tuple(spacing / stride for spacing in volume_node.GetSpacing())
+
+
+def load_progressively(filename, properties, on_loaded=None):
+    """
+    Show the preview of a volume file at once, and replace it with the full volume
+    once that has been read in the background.  Requires a running Qt event loop.
+
+    Args:
+        filename: the volume file, which must have a current preview and be
+            readable_in_background
+        properties: as for slicer.util.loadVolume
+        on_loaded: optionally, a function called with the volume node once it holds
+            the full volume
+    Return: the new volume node, showing the preview
+    """
+    volume_node = slicer.util.loadVolume(preview_filename(filename), properties)
+    volume_node.SetAttribute(STRIDE_ATTRIBUTE, str(PREVIEW_STRIDE))
+    ijk_to_ras = full_resolution_ijk_to_ras(volume_node)
+    storage_node = volume_node.GetStorageNode()
+    result = dict()
+
+    def read():
+        with span("read full-resolution volume", "load", file=filename):
+            try:
+                result["array"] = read_volume_array(filename)
+            except (OSError, ValueError, zlib.error) as e:
+                result["error"] = e
+
+    thread = threading.Thread(
+        target=read, name="read " + os.path.basename(filename), daemon=True,
+    )
+
+    def swap_when_read():
+        if thread.is_alive():
+            qt.QTimer.singleShot(POLL_MILLISECONDS, swap_when_read)
+            return
+        if not (
+            slicer.mrmlScene.IsNodePresent(volume_node)
+            and volume_node.GetAttribute(STRIDE_ATTRIBUTE)
+            and volume_node.GetStorageNode() is storage_node
+            and storage_node.GetFileName() == preview_filename(filename)
+        ):
+            # The node was removed, or has since been loaded with other data
+            return
+        if "error" in result:
+            logging.warning(
+                f"Unable to read {filename}; showing its preview: {result['error']}",
+            )
+            return
+        with span("swap in full-resolution volume", "load", file=filename):
+            slicer.util.updateVolumeFromArray(volume_node, result.pop("array"))
+            volume_node.SetIJKToRASMatrix(ijk_to_ras)
+            volume_node.RemoveAttribute(STRIDE_ATTRIBUTE)
+            storage_node.SetFileName(filename)
+        if on_loaded is not None:
+            on_loaded(volume_node)
+
+    thread.start()
+    qt.QTimer.singleShot(POLL_MILLISECONDS, swap_when_read)
+    return volume_node
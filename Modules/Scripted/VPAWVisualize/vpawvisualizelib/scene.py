@@ -0,0 +1,125 @@
+"""
+Batching of MRML scene updates, and counting of the events that they fire.
+
+Each node that is added, moved in the subject hierarchy, or shown fires scene events,
+and each event updates the observing tree views and views.  In the scene's
+batch-process state, with rendering paused, those updates happen once, at the end.
+"""
+
+import collections
+import contextlib
+
+import slicer
+import vtk
+
+# Event counts shown by format_event_counts
+MAX_SHOWN_EVENTS = 5
+
+
+@contextlib.contextmanager
+def batch_process_state(scene=None):
+    """
+    Context manager that puts the scene in its batch-process state, so that views and
+    widgets update once at the end rather than after every change to a node.
+    """
+    if scene is None:
+        scene = slicer.mrmlScene
+    scene.StartState(slicer.vtkMRMLScene.BatchProcessState)
+    try:
+        yield
+    finally:
+        scene.EndState(slicer.vtkMRMLScene.BatchProcessState)
+
+
+@contextlib.contextmanager
+def paused_rendering():
+    """
+    Context manager that pauses the rendering of all views, if there are any.
+    """
+    if not hasattr(slicer.app, "pauseRender"):
+        # No views, e.g., in batch processing
+        yield
+        return
+    slicer.app.pauseRender()
+    try:
+        yield
+    finally:
+        slicer.app.resumeRender()
+
+
+@contextlib.contextmanager
+def batched_scene_updates(enabled=True):
+    """
+    Context manager that, if enabled, runs its body in the scene's batch-process state
+    with rendering paused.
+    """
+    if not enabled:
+        yield
+        return
+    with paused_rendering(), batch_process_state():
+        yield
+
+
+def event_sources():
+    """
+    Return a dict of the objects whose events updating the scene fires, by name: the
+    scene, its subject hierarchy, and the render window of each view.
+    """
+    sources = dict(
+        scene=slicer.mrmlScene,
+        subject_hierarchy=slicer.mrmlScene.GetSubjectHierarchyNode(),
+    )
+    layoutManager = (
+        slicer.app.layoutManager() if hasattr(slicer.app, "layoutManager") else None
+    )
+    if layoutManager is not None:
+        for index in range(layoutManager.threeDViewCount):
+            sources[f"3D view {index} render window"] = (
+                layoutManager.threeDWidget(index).threeDView().renderWindow()
+            )
+        for name in layoutManager.sliceViewNames():
+            sources[f"{name} slice view render window"] = (
+                layoutManager.sliceWidget(name).sliceView().renderWindow()
+            )
+    return sources
+
+
+@contextlib.contextmanager
+def count_events(sources):
+    """
+    Context manager that counts the events fired by VTK objects during its body.
+
+    Args:
+        sources: a dict of the objects to observe, by name
+    Return: a collections.Counter from "<name> <event>", e.g., "scene NodeAddedEvent",
+        to the number of times that the event fired
+    """
+    counts = collections.Counter()
+    observations = []
+    for name, source in sources.items():
+
+        def on_event(caller, event, name=name):
+            counts[f"{name} {event}"] += 1
+
+        observations.append(
+            (source, source.AddObserver(vtk.vtkCommand.AnyEvent, on_event)),
+        )
+    try:
+        yield counts
+    finally:
+        for source, tag in observations:
+            source.RemoveObserver(tag)
+
+
+def format_event_counts(counts):
+    """
+    Return a line with the total of the event counts and the most frequent events.
+    """
+    return (
+        f"{sum(counts.values())} events"
+        + (" (" if counts else "")
+        + ", ".join(
+            f"{event}: {count}" for event, count in counts.most_common(MAX_SHOWN_EVENTS)
+        )
+        + (")" if counts else "")
+    )
@@ -0,0 +1,306 @@
+"""
+A local-disk staging cache for data roots on network shares.
+
+When the data root is on NFS or SMB, every load of a subject reads its hundreds of
+megabytes over the network again.  A StagingCache instead copies a subject's files, in
+parallel, to a local directory, at
+
+    <cache directory>/<data root name>-<hash of its path>/<subject prefix>/<path>
+
+where <path> is the file's path relative to the data root, so that the directory names
+that identify what a file holds are kept.  The subject is then loaded from there.  A
+staged file is reused while its size and modification time match the original's, and
+copies keep the original's modification time, so comparisons with the modification
+times of precomputed results are unchanged.
+
+The cache keeps at most its configured number of bytes.  When it holds more, the
+subjects that were staged least recently are removed.  prefetch stages a subject in
+the background, e.g., the next patient while the current one is viewed.
+"""
+
+import hashlib
+import logging
+import os
+import queue
+import shutil
+import threading
+import time
+import urllib.parse
+
+from vpawcommonlib.profiling import configured_directory
+from vpawcommonlib.tracing import span
+
+ENVIRONMENT_VARIABLE = "VPAW_STAGING_DIRECTORY"
+SETTINGS_KEY = "VPAW/StagingDirectory"
+SIZE_ENVIRONMENT_VARIABLE = "VPAW_STAGING_GIGABYTES"
+SIZE_SETTINGS_KEY = "VPAW/StagingGigabytes"
+DEFAULT_GIGABYTES = 20
+# Files copied at once; network file systems serve parallel reads faster than one
+COPY_THREADS = 8
+BYTES_PER_GIGABYTE = 1024**3
+# Hex digits of the hash of the data root's path in the name of its directory
+_ROOT_HASH_DIGITS = 12
+
+
+def configured_size():
+    """
+    Return the configured size of the staging cache in bytes, from an environment
+    variable or, failing that, an application setting, else DEFAULT_GIGABYTES.
+    """
+    gigabytes = os.environ.get(SIZE_ENVIRONMENT_VARIABLE, "")
+    if not gigabytes:
+        try:
+            import qt
+
+            gigabytes = qt.QSettings().value(SIZE_SETTINGS_KEY, "") or ""
+        except ImportError:
+            # Not running within 3D Slicer
+            pass
+    try:
+        return int(float(gigabytes or DEFAULT_GIGABYTES) * BYTES_PER_GIGABYTE)
+    except ValueError:
+        logging.warning(
+            f"Staging cache size {gigabytes!r} is not a number of gigabytes;"
+            + f" using {DEFAULT_GIGABYTES}",
+        )
+        return DEFAULT_GIGABYTES * BYTES_PER_GIGABYTE
+
+
+def configured_staging_cache():
+    """
+    Return a StagingCache in the configured directory, or None if none is configured.
+    """
+    directory = configured_directory(ENVIRONMENT_VARIABLE, SETTINGS_KEY)
+    return None if directory is None else StagingCache(directory, configured_size())
+
+
+def is_current(filename, staged_filename):
+    """
+    Whether staged_filename exists and has the size and modification time of filename.
+    """
+    try:
+        original = os.stat(filename)
+        staged = os.stat(staged_filename)
+    except OSError:
+        return False
+    return (
+        staged.st_size == original.st_size
+        and staged.st_mtime_ns == original.st_mtime_ns
+    )
+
+
+def _copy(filename, staged_filename):
+    """
+    Copy filename, with its modification time, so that a partial copy is never seen.
+    """
+    os.makedirs(os.path.dirname(staged_filename), exist_ok=True)
+    temporary_filename = staged_filename + ".tmp"
+    try:
+        shutil.copy2(filename, temporary_filename)
+        os.replace(temporary_filename, staged_filename)
+    except BaseException:
+        if os.path.exists(temporary_filename):
+            os.remove(temporary_filename)
+        raise
+
+
+def copy_files(pairs, threads=COPY_THREADS):
+    """
+    Copy files in parallel.
+
+    Args:
+        pairs: a list of (filename, staged_filename)
+        threads: the number of files copied at once
+    Return: a dict from each filename that could not be copied to the OSError
+    """
+    pending = queue.Queue()
+    for pair in pairs:
+        pending.put(pair)
+    failed = dict()
+
+    def copy_pending():
+        while True:
+            try:
+                filename, staged_filename = pending.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                with span("stage file", "load", file=filename):
+                    _copy(filename, staged_filename)
+            except OSError as e:
+                failed[filename] = e
+
+    workers = [
+        threading.Thread(target=copy_pending, name=f"vpaw-stage-{index}", daemon=True)
+        for index in range(min(threads, len(pairs)))
+    ]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return failed
+
+
+def _directory_size(directory):
+    return sum(
+        os.path.getsize(os.path.join(walk_directory, basename))
+        for walk_directory, _, basenames in os.walk(directory)
+        for basename in basenames
+    )
+
+
+class StagingCache:
+    """
+    Local copies of the files of subjects, keyed by data root and subject prefix, with
+    the least recently staged subjects removed once the copies exceed max_bytes.
+    """
+
+    def __init__(self, directory, max_bytes, threads=COPY_THREADS):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.threads = threads
+        # The subject directory last staged other than by prefetch, which is never
+        # evicted because it is likely being shown
+        self.current = None
+        # Maps the subject directory of each prefetch that is running to its thread
+        self.prefetches = dict()
+        self.lock = threading.Lock()
+
+    def subject_directory(self, data_root, prefix):
+        """
+        Return the directory of the staged files of a subject.
+        """
+        if not prefix:
+            raise ValueError("Only the files of a subject prefix can be staged")
+        data_root = os.path.abspath(data_root)
+        digest = hashlib.sha1(data_root.encode("utf-8")).hexdigest()[:_ROOT_HASH_DIGITS]
+        return os.path.join(
+            self.directory,
+            os.path.basename(data_root) + "-" + digest,
+            urllib.parse.quote(prefix, safe=""),
+        )
+
+    def stage(self, data_root, prefix, filenames, current=True):
+        """
+        Copy the files of a subject that are not already staged and up to date.
+
+        Args:
+            data_root: the data root that the subject is in
+            prefix: the subject's prefix
+            filenames: the subject's files; those outside data_root, e.g., copies that
+                are already local, are not staged
+            current: whether the subject is about to be shown, so that it is not
+                evicted until another subject is
+        Return: the list of the staged files, in the order of filenames, with the
+            original of each file that is outside data_root or could not be copied
+        """
+        subject_directory = self.subject_directory(data_root, prefix)
+        with self.lock:
+            prefetch = self.prefetches.get(subject_directory)
+            if current:
+                self.current = subject_directory
+        if prefetch is not None and prefetch is not threading.current_thread():
+            # Let the prefetch finish rather than copy the same files at once
+            prefetch.join()
+
+        staged_filenames = []
+        to_copy = []
+        for filename in filenames:
+            relative = os.path.relpath(filename, data_root)
+            if relative.startswith(os.pardir + os.sep) or os.path.isabs(relative):
+                staged_filenames.append(filename)
+                continue
+            staged_filename = os.path.join(subject_directory, relative)
+            staged_filenames.append(staged_filename)
+            if not is_current(filename, staged_filename):
+                to_copy.append((filename, staged_filename))
+
+        start = time.time()
+        with span("stage subject", "load", prefix=prefix, files=len(to_copy)):
+            failed = copy_files(to_copy, self.threads)
+        if to_copy:
+            logging.info(
+                f"Staged {len(to_copy) - len(failed)} files of {prefix!r}"
+                + f" in {time.time() - start:.2f} seconds"
+                + f" ({len(filenames) - len(to_copy)} already staged)",
+            )
+        for filename, e in failed.items():
+            logging.warning(f"Unable to stage {filename}; reading the original: {e}")
+        if os.path.isdir(subject_directory):
+            # The modification time of a subject directory is when it was last used
+            os.utime(subject_directory)
+        self.evict(keep=(subject_directory,))
+        return [
+            original if original in failed else staged
+            for original, staged in zip(filenames, staged_filenames)
+        ]
+
+    def prefetch(self, data_root, prefix, list_files):
+        """
+        Stage a subject in a background thread, unless it is already being prefetched.
+
+        Args:
+            data_root: the data root that the subject is in
+            prefix: the subject's prefix
+            list_files: a function, called in the background thread, that returns the
+                subject's files, e.g., because listing them on a network share is slow
+        Return: the thread
+        """
+        subject_directory = self.subject_directory(data_root, prefix)
+
+        def run():
+            try:
+                self.stage(data_root, prefix, list_files(), current=False)
+            except (OSError, ValueError) as e:
+                logging.warning(f"Unable to prefetch {prefix!r} in {data_root}: {e}")
+            finally:
+                with self.lock:
+                    del self.prefetches[subject_directory]
+
+        with self.lock:
+            if subject_directory in self.prefetches:
+                return self.prefetches[subject_directory]
+            thread = threading.Thread(
+                target=run, name="vpaw-prefetch " + prefix, daemon=True,
+            )
+            self.prefetches[subject_directory] = thread
+        thread.start()
+        return thread
+
+    def evict(self, keep=()):
+        """
+        Remove the least recently staged subjects until the cache holds at most
+        max_bytes, other than those in keep, the current subject, and subjects being
+        prefetched.  Return the list of the subject directories removed.
+        """
+        if not os.path.isdir(self.directory):
+            return []
+        with self.lock:
+            kept = {*keep, self.current, *self.prefetches}
+        subjects = []
+        for root_name in os.listdir(self.directory):
+            root_directory = os.path.join(self.directory, root_name)
+            if not os.path.isdir(root_directory):
+                continue
+            for prefix_name in os.listdir(root_directory):
+                subject_directory = os.path.join(root_directory, prefix_name)
+                subjects.append(
+                    (
+                        os.path.getmtime(subject_directory),
+                        subject_directory,
+                        _directory_size(subject_directory),
+                    ),
+                )
+        total = sum(size for _, _, size in subjects)
+        removed = []
+        for _, subject_directory, size in sorted(subjects):
+            if total <= self.max_bytes:
+                break
+            if subject_directory in kept:
+                continue
+            shutil.rmtree(subject_directory, ignore_errors=True)
+            total -= size
+            removed.append(subject_directory)
+        if removed:
+            logging.info(f"Evicted {len(removed)} subjects from the staging cache")
+        return removed
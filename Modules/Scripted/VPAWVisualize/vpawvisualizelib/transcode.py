@@ -0,0 +1,258 @@
+"""
+Uncompressed copies of the gzip-compressed volumes of a data root, for faster loading.
+
+The images, Laplace solutions, and segmentations of a data root are .nrrd files with
+gzip-compressed data, and inflating them, which zlib does in a single thread, is most
+of the time that it takes to load them.  transcode_data_root writes a copy of each of
+them with "encoding: raw" and otherwise the same header, key/value pairs included, to a
+cache directory, at the same path relative to the data root, so that the directory
+names that identify what a file holds are kept.  A raw copy is read at disk speed and
+can be memory-mapped.  NRRD readers, including 3D Slicer's, support no compression that
+inflates faster than gzip, so raw is the only fast encoding.
+
+A copy is given the modification time of its original, and is up to date only while the
+two are the same, so that comparisons with the modification times of precomputed
+results are unchanged by reading the copy instead.
+"""
+
+import hashlib
+import logging
+import os
+import time
+import zlib
+
+from vpawcommonlib.formatting import format_bytes
+from vpawcommonlib.nrrdheader import (
+    header_bytes_per_voxel,
+    header_voxel_count,
+    read_nrrd_header,
+)
+from vpawcommonlib.patients import PREVIEW_SUFFIX
+from vpawcommonlib.profiling import configured_directory
+
+ENVIRONMENT_VARIABLE = "VPAW_VOLUME_CACHE_DIRECTORY"
+SETTINGS_KEY = "VPAW/VolumeCacheDirectory"
+NRRD_EXTENSION = ".nrrd"
+# Bytes read from the original at once while inflating it
+CHUNK_BYTES = 4 * 1024 * 1024
+# Hex digits of the hash of the data root's path in the name of its cache directory
+_ROOT_HASH_DIGITS = 12
+# Lower bound of durations that throughputs are computed from
+_MIN_SECONDS = 1e-9
+_COMPRESSED_ENCODINGS = ("gzip", "gz")
+_DETACHED_FIELDS = {"data file", "datafile", "line skip", "byte skip"}
+
+
+def cache_directory():
+    """
+    Return the directory of the uncompressed copies, or None if none is configured.
+    """
+    return configured_directory(ENVIRONMENT_VARIABLE, SETTINGS_KEY)
+
+
+def root_cache_directory(data_root, directory=None):
+    """
+    Return the directory of the uncompressed copies of a data root, which is named
+    after the data root and a hash of its absolute path, or None if no cache directory
+    is given or configured.
+    """
+    directory = directory or cache_directory()
+    if directory is None:
+        return None
+    data_root = os.path.abspath(data_root)
+    digest = hashlib.sha1(data_root.encode("utf-8")).hexdigest()[:_ROOT_HASH_DIGITS]
+    return os.path.join(directory, os.path.basename(data_root) + "-" + digest)
+
+
+def fast_copy_filename(filename, data_root, directory=None):
+    """
+    Return the name of the uncompressed copy of a file of a data root, or None if no
+    cache directory is given or configured.
+    """
+    root_directory = root_cache_directory(data_root, directory)
+    if root_directory is None:
+        return None
+    return os.path.join(root_directory, os.path.relpath(filename, data_root))
+
+
+def fast_copy_is_current(filename, copy_filename):
+    """
+    Whether copy_filename exists and has the modification time of filename.
+    """
+    try:
+        return os.stat(copy_filename).st_mtime_ns == os.stat(filename).st_mtime_ns
+    except OSError:
+        return False
+
+
+def is_transcodable(filename):
+    """
+    Whether filename is a .nrrd file, other than a preview, with gzip-compressed data
+    attached.
+    """
+    if not filename.endswith(NRRD_EXTENSION) or filename.endswith(PREVIEW_SUFFIX):
+        return False
+    try:
+        fields = read_nrrd_header(filename)
+    except (OSError, ValueError):
+        return False
+    return fields.get("encoding", "").lower() in _COMPRESSED_ENCODINGS and not (
+        _DETACHED_FIELDS & set(fields)
+    )
+
+
+def _raw_header(nrrd_file):
+    """
+    Read the header of an open NRRD file, through its blank line, and return it with
+    its encoding changed to raw.
+    """
+    lines = [nrrd_file.readline()]
+    while True:
+        line = nrrd_file.readline()
+        if not line:
+            raise ValueError(f"{nrrd_file.name} has no data")
+        if line.split(b":", 1)[0].strip().lower() == b"encoding":
+            line = b"encoding: raw" + (b"\r\n" if line.endswith(b"\r\n") else b"\n")
+        lines.append(line)
+        if line.strip() == b"":
+            return b"".join(lines)
+
+
+def transcode_file(filename, copy_filename):
+    """
+    Write the uncompressed copy of a NRRD file accepted by is_transcodable.
+
+    Args:
+        filename: the original file
+        copy_filename: the copy to write
+    Return: a dict with the number of "bytes" of voxel data, and the "gzip_seconds"
+        that it took to read and inflate the original and the "raw_seconds" that it took
+        to read the copy
+    """
+    fields = read_nrrd_header(filename)
+    expected_bytes = header_voxel_count(fields) * (header_bytes_per_voxel(fields) or 1)
+    os.makedirs(os.path.dirname(copy_filename), exist_ok=True)
+    temporary_filename = copy_filename + ".tmp"
+    written = 0
+    start = time.perf_counter()
+    try:
+        with open(filename, "rb") as nrrd_file, open(
+            temporary_filename, "wb",
+        ) as copy_file:
+            copy_file.write(_raw_header(nrrd_file))
+            # wbits=MAX_WBITS | 32 accepts gzip and zlib streams
+            decompressor = zlib.decompressobj(zlib.MAX_WBITS | 32)
+            while chunk := nrrd_file.read(CHUNK_BYTES):
+                while chunk:
+                    data = decompressor.decompress(chunk)
+                    copy_file.write(data)
+                    written += len(data)
+                    chunk = b""
+                    if decompressor.eof:
+                        # A gzip file may hold more than one member
+                        chunk = decompressor.unused_data
+                        decompressor = zlib.decompressobj(zlib.MAX_WBITS | 32)
+            data = decompressor.flush()
+            copy_file.write(data)
+            written += len(data)
+        gzip_seconds = time.perf_counter() - start
+        if written < expected_bytes:
+            raise ValueError(
+                f"{filename} has {written} bytes of data, not {expected_bytes}",
+            )
+        start = time.perf_counter()
+        with open(temporary_filename, "rb") as copy_file:
+            while copy_file.read(CHUNK_BYTES):
+                pass
+        raw_seconds = time.perf_counter() - start
+        stat = os.stat(filename)
+        os.utime(temporary_filename, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+        os.replace(temporary_filename, copy_filename)
+    except BaseException:
+        if os.path.exists(temporary_filename):
+            os.remove(temporary_filename)
+        raise
+    return dict(bytes=written, gzip_seconds=gzip_seconds, raw_seconds=raw_seconds)
+
+
+def transcode_data_root(data_root, prefix="", directory=None):
+    """
+    Write an uncompressed copy of every gzip-compressed .nrrd file under a data root
+    whose name starts with prefix and whose copy is not up to date.
+
+    Args:
+        data_root: the directory to search, recursively
+        prefix: transcode only files with this prefix.  Blank means all files.
+        directory: the cache directory; by default the configured one
+    Return: a dict with lists of the copies "transcoded" and the files "up_to_date", a
+        dict "failed" from each file that could not be transcoded to the reason, and
+        the totals "bytes", "gzip_seconds", and "raw_seconds" of the files transcoded
+    """
+    root_directory = root_cache_directory(data_root, directory)
+    if root_directory is None:
+        raise ValueError(
+            f"No cache directory; set {ENVIRONMENT_VARIABLE} or {SETTINGS_KEY}",
+        )
+    response = dict(
+        transcoded=[],
+        up_to_date=[],
+        failed=dict(),
+        bytes=0,
+        gzip_seconds=0.0,
+        raw_seconds=0.0,
+    )
+    for walk_directory, _, basenames in os.walk(data_root):
+        for basename in sorted(basenames):
+            filename = os.path.join(walk_directory, basename)
+            if not (basename.startswith(prefix) and is_transcodable(filename)):
+                continue
+            copy_filename = fast_copy_filename(filename, data_root, directory)
+            if fast_copy_is_current(filename, copy_filename):
+                response["up_to_date"].append(filename)
+                continue
+            try:
+                timings = transcode_file(filename, copy_filename)
+            except (OSError, ValueError, zlib.error) as e:
+                logging.warning(f"Unable to transcode {filename}: {e}")
+                response["failed"][filename] = str(e)
+                continue
+            response["transcoded"].append(copy_filename)
+            for key in ("bytes", "gzip_seconds", "raw_seconds"):
+                response[key] += timings[key]
+    return response
+
+
+def format_throughput(response):
+    """
+    Return a line comparing the decode throughput of the originals and of the copies
+    of a transcode_data_root response.  The copies were just written, so they were
+    likely read from the page cache; reading them from disk is slower.
+    """
+    if not response["bytes"]:
+        return "No volumes were transcoded"
+
+    def throughput(seconds):
+        return format_bytes(response["bytes"] / max(seconds, _MIN_SECONDS)) + "/s"
+
+    return (
+        f"Decoded {format_bytes(response['bytes'])} at"
+        + f" {throughput(response['gzip_seconds'])} from gzip and at"
+        + f" {throughput(response['raw_seconds'])} from raw"
+    )
+
+
+def prefer_fast_copies(filenames, data_root, directory=None):
+    """
+    Return filenames with each file replaced by its uncompressed copy, if that is up
+    to date.
+    """
+    root_directory = root_cache_directory(data_root, directory)
+    if root_directory is None or not os.path.isdir(root_directory):
+        return list(filenames)
+    preferred = []
+    for filename in filenames:
+        copy_filename = fast_copy_filename(filename, data_root, directory)
+        preferred.append(
+            copy_filename if fast_copy_is_current(filename, copy_filename) else filename,
+        )
+    return preferred